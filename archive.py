@@ -0,0 +1,222 @@
+"""
+Archive of raw API responses, so the database can be rebuilt offline after a schema change
+instead of crawling again against the rate-limited keys.
+
+    python archive.py replay --archive archive --workers 4
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from itertools import islice
+from managers import LeaderboardDataManager, AssetsDataManager, MatchBatchWriter
+from cache import KnownKeysCache, KnownMatchIds
+from parsing import parse_matches, make_parse_pool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LEADERBOARD_ENDPOINT = re.compile(r"leaderboard/(?P<region>[^/]+)/(?P<platform>[^/]+)/?$")
+MATCHES_ENDPOINT = re.compile(r"/matches/")
+CONTENT_ENDPOINT = re.compile(r"v1/content/?$")
+
+def _digest(body):
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+class ResponseArchive:
+    """
+    Raw API responses stored as compressed JSONL segments under root/segments/<kind>/.
+
+    Every record is keyed by what it holds: match/<match_id> for each match of a match history
+    page, leaderboard/<region>/<platform>/<page> for leaderboard pages and content for the
+    content endpoint. Records are content addressed: a (key, sha256 of the body) pair that
+    is already in root/index.jsonl is not written again, so re-crawling the same matches
+    costs no disk. Segments use zstd when the zstandard package is installed and gzip otherwise,
+    and roll over every segment_records records.
+    """
+    def __init__(self, root, segment_records=5_000, compression=None):
+        self.root = root
+        self.segment_records = segment_records
+        self.compression = compression or ("zstd" if zstandard is not None else "gzip")
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package")
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock = threading.Lock()
+        self._writers = {}
+        self._index = None
+        self.written = 0
+        self.duplicates = 0
+        os.makedirs(os.path.join(root, "segments"), exist_ok=True)
+
+    def _load_index(self):
+        self._index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # torn last line after a crash
+                    self._index.setdefault(entry["key"], set()).add(entry["sha256"])
+        self._index_file = open(self.index_path, "a")
+
+    def _open_segment(self, kind):
+        directory = os.path.join(self.root, "segments", kind)
+        os.makedirs(directory, exist_ok=True)
+        extension = "zst" if self.compression == "zstd" else "gz"
+        path = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{time.time_ns()}.jsonl.{extension}")
+        if self.compression == "zstd":
+            file = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+        else:
+            file = gzip.open(path, "wb")
+        return {"path": path, "file": file, "records": 0}
+
+    def _write(self, kind, key, body, meta):
+        sha256 = _digest(body)
+        if sha256 in self._index.get(key, ()):
+            self.duplicates += 1
+            return
+        writer = self._writers.get(kind)
+        if writer is None or writer["records"] >= self.segment_records:
+            if writer is not None:
+                writer["file"].close()
+            writer = self._writers[kind] = self._open_segment(kind)
+        record = {"key": key, "sha256": sha256, "fetched_at": time.time(), **meta, "body": body}
+        writer["file"].write((json.dumps(record, separators=(",", ":")) + "\n").encode())
+        writer["records"] += 1
+        self._index.setdefault(key, set()).add(sha256)
+        self._index_file.write(json.dumps({"key": key, "sha256": sha256, "segment": writer["path"]}) + "\n")
+        self.written += 1
+
+    def record(self, endpoint, params, body):
+        """
+        Archives the JSON body of one successful API response.
+        """
+        params = dict(params or {})
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            if MATCHES_ENDPOINT.search(endpoint):
+                for match in body.get("data") or []:
+                    self._write("match", f"match/{match['metadata']['match_id']}", match, {})
+            elif (leaderboard := LEADERBOARD_ENDPOINT.search(endpoint)) is not None:
+                meta = {"region": leaderboard["region"], "platform": leaderboard["platform"], "page": params.get("page")}
+                self._write("leaderboard", f"leaderboard/{meta['region']}/{meta['platform']}/{meta['page']}", body, meta)
+            elif CONTENT_ENDPOINT.search(endpoint):
+                self._write("content", "content", body, {})
+            else:
+                key = endpoint.strip("/") + ("?" + "&".join(f"{k}={v}" for k, v in sorted(params.items())) if params else "")
+                self._write("other", key, body, {"endpoint": endpoint, "params": params})
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer["file"].close()
+            self._writers = {}
+            if self._index is not None:
+                self._index_file.close()
+                self._index = None
+
+    def segments(self, kind):
+        directory = os.path.join(self.root, "segments", kind)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+    @staticmethod
+    def _open_for_read(path):
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError(f"{path} needs the zstandard package")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return gzip.open(path, "rb")
+
+    def records(self, kind):
+        """
+        Yields the archived records of kind in the order they were written.
+        A segment cut short by a crash yields what was written before the cut.
+        """
+        for path in self.segments(kind):
+            try:
+                with self._open_for_read(path) as file:
+                    buffer = b""
+                    while chunk := file.read(1 << 20):
+                        buffer += chunk
+                        *lines, buffer = buffer.split(b"\n")
+                        for line in lines:
+                            yield json.loads(line)
+            except (EOFError, OSError) as e:
+                print(f"Segment {path} is truncated: {e}")
+            except Exception as e:
+                if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                    print(f"Segment {path} is truncated: {e}")
+                else:
+                    raise
+
+    def latest(self, kind):
+        """
+        The most recently fetched record of every key of kind.
+        """
+        latest = {}
+        for record in self.records(kind):
+            latest[record["key"]] = record
+        return list(latest.values())
+
+def replay(engine, archive, batch_matches=50, parse_workers=None, use_copy=False, chunk_size=256):
+    """
+    Loads an archive into the database without touching the network: the latest content
+    payload, the latest copy of every leaderboard page and then every archived match,
+    parsed in parse_workers processes and written batch_matches per transaction.
+    Matches already in the database are skipped, so an interrupted replay can be run again.
+    """
+    for record in archive.latest("content"):
+        AssetsDataManager(engine=engine, data=record["body"]).save()
+    for record in archive.latest("leaderboard"):
+        LeaderboardDataManager(engine=engine, data=record["body"], region=record["region"], platform=record["platform"]).save()
+
+    known_matches = KnownMatchIds(engine).warm()
+    parse_pool = make_parse_pool(parse_workers) if parse_workers else None
+    replayed = 0
+    try:
+        with MatchBatchWriter(engine, max_matches=batch_matches, use_copy=use_copy,
+                              known_keys=KnownKeysCache().warm(engine), known_matches=known_matches) as writer:
+            records = archive.records("match")
+            while chunk := list(islice(records, chunk_size)):
+                new_ids = set(known_matches.filter_new([record["body"]["metadata"]["match_id"] for record in chunk]))
+                matches = list({record["body"]["metadata"]["match_id"]: record["body"]
+                                for record in chunk if record["body"]["metadata"]["match_id"] in new_ids}.values())
+                for parsed in parse_matches(matches, executor=parse_pool):
+                    writer.add_parsed(parsed)
+                    replayed += 1
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+    return replayed
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import create_db_engine
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="load an archive into DATABASE_URL")
+    replay_parser.add_argument("--archive", default=os.getenv("ARCHIVE_DIR", "archive"))
+    replay_parser.add_argument("--workers", type=int, default=None, help="parse worker processes")
+    replay_parser.add_argument("--batch", type=int, default=50, help="matches per transaction")
+    replay_parser.add_argument("--copy", action="store_true", help="load the event tables with COPY (Postgres)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_db_engine(os.getenv("DATABASE_URL"))
+    migrate(engine)
+    time_ = time.perf_counter()
+    count = replay(engine, ResponseArchive(args.archive), batch_matches=args.batch, parse_workers=args.workers, use_copy=args.copy)
+    elapsed = time.perf_counter() - time_
+    print(f"Replayed {count} matches in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f} matches/s)")
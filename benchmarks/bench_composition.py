@@ -0,0 +1,71 @@
+"""
+Times a full sweep of composition.CompositionScorer over every five-agent composition of a map's
+agent pool (building the pair statistics from the teams played, scoring all compositions and
+taking the best) against scoring each composition in a Python loop, and checks both agree.
+
+    python -m benchmarks.bench_composition --agents 25 --teams 200000
+"""
+import argparse
+import sys
+import time
+from itertools import combinations
+import numpy as np
+from composition import TEAM_SIZE, CompositionScorer
+from scoring import COMPONENT_NAMES
+
+def _teams(num_agents, num_teams, rng):
+    # Random five-agent teams whose chance to win grows with the agents' strengths
+    strength = rng.normal(scale=0.3, size=num_agents)
+    members = np.argsort(rng.random((num_teams, num_agents)), axis=1)[:, :TEAM_SIZE]
+    masks = np.bitwise_or.reduce(np.left_shift(np.uint64(1), members.astype(np.uint64)), axis=1)
+    won = rng.random(num_teams) < 1 / (1 + np.exp(-strength[members].sum(axis=1)))
+    return masks, won
+
+def _loop(scorer, prior=20):
+    # Per composition: look up the agents of the teams played, then average its pair win rates
+    games, wins = {}, {}
+    for mask, won in zip(scorer.team_masks.tolist(), scorer.team_won.tolist()):
+        agents = [i for i in range(len(scorer.agent_ids)) if mask >> i & 1]
+        for a in agents:
+            for b in agents:
+                games[a, b] = games.get((a, b), 0) + 1
+                wins[a, b] = wins.get((a, b), 0) + won
+    base = scorer.team_won.mean()
+    win, coverage = [], []
+    for team in combinations(range(len(scorer.agent_ids)), TEAM_SIZE):
+        rates = [(wins.get((a, b), 0) + prior * base) / (games.get((a, b), 0) + prior) for a, b in combinations(team, 2)]
+        win.append(sum(rates) / len(rates))
+        coverage.append(sum(max(scorer.pc_scores[i, j] for i in team) for j in range(len(scorer.component_names))))
+    return np.array(win), np.array(coverage)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=25)
+    parser.add_argument("--teams", type=int, default=200_000, help="teams played on the map")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    masks, won = _teams(args.agents, args.teams, rng)
+    pc_scores = rng.normal(size=(args.agents, len(COMPONENT_NAMES)))
+    agents = [f"agent-{i}" for i in range(args.agents)]
+
+    time_ = time.perf_counter()
+    scorer = CompositionScorer(agents, agents, pc_scores, COMPONENT_NAMES, masks, won)
+    best = scorer.best(args.top)
+    sweep_time = time.perf_counter() - time_
+    time_ = time.perf_counter()
+    win, coverage = _loop(scorer)
+    loop_time = time.perf_counter() - time_
+
+    difference = max(np.abs(win - scorer.win).max(), np.abs(coverage - scorer.coverage).max())
+    print(f"{len(scorer.masks)} compositions of {args.agents} agents, {args.teams} teams played")
+    print(f"Python loop:      {loop_time:7.2f}s")
+    print(f"vectorized sweep: {sweep_time * 1000:7.1f} ms ({loop_time / sweep_time:.0f}x), max difference {difference:.2e}")
+    print(best.head(3).to_string())
+    if difference > 1e-9:
+        print("Vectorized scores differ from the loop")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Checks that the agent and agent x map rankings of cube.AggregateCube match those of scanning the
+whole exported dataset (read_features, project every row, group by), and compares the time of a
+ranking query. A synthetic dataset is exported in several parts and the cube folds in each part
+as it appears (saving and reloading itself in between). Exits with status 1 when the component
+means or standard deviations differ by more than --tolerance.
+
+    python -m benchmarks.bench_cube --rows 1000000 --parts 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from cube import AggregateCube
+from export import PARTITION_COLUMNS, read_features
+from scoring import FEATURE_COLUMNS, PCA_QUEUES, SCALER_QUEUES, PcaModel, feature_matrix
+from benchmarks.fixtures import NUM_AGENTS, NUM_MAPS, make_feature_matrix
+
+QUEUES = SCALER_QUEUES + ["swiftplay"]
+# Neutral names, so read_features leaves the synthetic values in float64
+FEATURES = [f"feature_{i}" for i in range(len(FEATURE_COLUMNS))]
+
+def _export_part(output_dir, part, num_rows, seed):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(make_feature_matrix(num_rows, len(FEATURES), seed=seed), columns=FEATURES)
+    frame.iloc[rng.random(num_rows) < 0.001, 0] = np.nan  # the notebooks drop rows with missing values
+    agents, maps = rng.integers(0, NUM_AGENTS, num_rows), rng.integers(0, NUM_MAPS, num_rows)
+    frame["match_id"] = [f"match-{seed}-{i // 10}" for i in range(num_rows)]
+    frame["player_puuid"] = [f"player-{i % 10}" for i in range(num_rows)]
+    frame["agent_id"] = [f"agent-{i}" for i in agents]
+    frame["agent_name"] = [f"Agent {i}" for i in agents]
+    frame["map_id"] = [f"map-{i}" for i in maps]
+    frame["map_name"] = [f"Map {i}" for i in maps]
+    frame["queue_id"] = rng.choice(QUEUES, num_rows, p=[0.5, 0.1, 0.3, 0.1])
+    frame["tier_id"] = rng.integers(0, 28, num_rows)
+    pq.write_to_dataset(pa.Table.from_pandas(frame, preserve_index=False), output_dir, partition_cols=PARTITION_COLUMNS,
+                        basename_template=f"part-{part:05d}-{{i}}.parquet")
+
+def _fold(output_dir, cube_path):
+    cube = AggregateCube.load(cube_path) if os.path.exists(cube_path) else AggregateCube(FEATURES)
+    cube.fold_dataset(output_dir)
+    cube.save(cube_path)
+
+def _scan(output_dir, model, by):
+    frame = read_features(output_dir, queues=PCA_QUEUES, columns=FEATURES + ["agent_id", "map_id", "queue_id"]).dropna()
+    scores = pd.DataFrame(model.project(feature_matrix(frame, FEATURES)), columns=model.component_names, index=frame.index)
+    scores[by] = frame[by].astype(str)
+    grouped = scores.groupby(by)[model.component_names]
+    return grouped.mean(), grouped.std()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows over all parts")
+    parser.add_argument("--parts", type=int, default=4, help="exports the rows arrive in")
+    parser.add_argument("--tolerance", type=float, default=1e-8)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    output_dir, cube_path = os.path.join(directory, "dataset"), os.path.join(directory, "cube.npz")
+    fold_time = 0.0
+    for part in range(args.parts):
+        _export_part(output_dir, part, args.rows // args.parts, seed=part)
+        time_ = time.perf_counter()
+        _fold(output_dir, cube_path)
+        fold_time += time.perf_counter() - time_
+    frame = read_features(output_dir, queues=SCALER_QUEUES, columns=FEATURES + ["queue_id"])
+    model = PcaModel.fit(frame, pca_rows=frame["queue_id"].isin(PCA_QUEUES), feature_names=FEATURES)
+    del frame
+
+    print(f"{args.rows} rows in {args.parts} parts; cube folded in {fold_time:.2f}s over {args.parts} updates")
+    differences = []
+    for by in (["agent_id"], ["agent_id", "map_id"]):
+        time_ = time.perf_counter()
+        mean, std = _scan(output_dir, model, by)
+        scan_time = time.perf_counter() - time_
+        time_ = time.perf_counter()
+        cube = AggregateCube.load(cube_path)
+        load_time = time.perf_counter() - time_
+        time_ = time.perf_counter()
+        table = cube.table(by=by, model=model)
+        cube_time = time.perf_counter() - time_
+        difference = max(np.abs(table[model.component_names].to_numpy() - mean.to_numpy()).max(),
+                         np.abs(table[[f"{name} std" for name in model.component_names]].to_numpy() - std.to_numpy()).max())
+        differences.append(difference)
+        print(f"by {' x '.join(by):<16} {len(table):4d} groups: scan {scan_time:6.2f}s, cube table {cube_time * 1000:6.1f} ms "
+              f"({scan_time / cube_time:.0f}x) after a {load_time * 1000:.0f} ms load; max difference {difference:.2e}")
+    if max(differences) > args.tolerance:
+        print(f"Cube differs from the full scan by more than {args.tolerance}")
+        sys.exit(1)
+    print(f"Cube matches the full scan within {args.tolerance}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares building the analysis dataset the way preprocessing.ipynb does (read_sql of whole tables,
+merged in pandas) with export.export_features, at two database sizes. Peak memory is measured
+with tracemalloc, which sees pandas and numpy buffers; the export's should not grow with the database.
+Also times an incremental refresh after a few more matches are ingested.
+
+    python -m benchmarks.bench_export --matches 500 2000
+    python -m benchmarks.bench_export --url postgresql://.../scratch   # tables are dropped!
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from sqlmodel import SQLModel
+from db import create_db_engine
+from migrations import migrate
+from managers import AssetsDataManager, MatchBatchWriter, MatchDataManager
+from export import export_features, read_features
+from benchmarks.fixtures import make_content, make_match, make_player_pool
+
+def _ingest(engine, seeds, pool):
+    with MatchBatchWriter(engine, max_matches=100, use_copy=engine.dialect.name == "postgresql") as writer:
+        for seed in seeds:
+            writer.add(MatchDataManager(engine=engine, data=make_match(seed, player_pool=pool)))
+
+def _notebook_build(engine):
+    # Cells 3-9 of preprocessing.ipynb
+    read = lambda table: pd.read_sql(f"SELECT * FROM {table}", engine)
+    match_players, plants, defuses = read("match_players"), read("match_round_plant"), read("match_round_defuse")
+    rounds, round_player_stats = read("match_rounds"), read("match_round_player_stats")
+    total_rounds = rounds.groupby("match_id")["round_num"].count().reset_index(name="total_rounds")
+    player_rounds = round_player_stats.merge(rounds[["match_id", "round_num", "winning_team"]], on=["match_id", "round_num"], how="left")
+    player_rounds["round_win"] = (player_rounds["winning_team"] == player_rounds["player_team"]).astype(int)
+    keys = ["match_id", "player_puuid", "agent_id"]
+    frame = (match_players
+             .merge(total_rounds, on="match_id", how="left")
+             .merge(plants.groupby(keys)["round_num"].count().reset_index(name="total_plants"), on=keys, how="left")
+             .merge(defuses.groupby(keys)["round_num"].count().reset_index(name="total_defuses"), on=keys, how="left"))
+    maps = read("map")[["id", "name"]].rename(columns={"id": "map_id", "name": "map_name"})
+    matches = read("match")[["id", "map_id", "queue_id"]].rename(columns={"id": "match_id"})
+    frame = frame.merge(matches.merge(maps, on="map_id", how="left"), on="match_id", how="left")
+    agents = read("agent")[["id", "name"]].rename(columns={"id": "agent_id", "name": "agent_name"})
+    frame = frame.merge(agents, on="agent_id", how="left").merge(read("match_teams"), on=["match_id", "team_id"])
+    return frame
+
+def _measure(function):
+    tracemalloc.start()
+    time_ = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - time_
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, nargs="+", default=[500, 2000], help="database sizes to compare")
+    parser.add_argument("--chunk", type=int, default=250, help="matches per export chunk")
+    parser.add_argument("--url", help="Scratch database URL. Defaults to a temporary SQLite file.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    url = args.url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    engine = create_db_engine(url)
+    pool = make_player_pool(2000)
+    output_dir = os.path.join(directory, "dataset")
+    SQLModel.metadata.drop_all(engine)
+    migrate(engine)
+    AssetsDataManager(engine=engine, data=make_content()).save()
+
+    ingested = 0
+    for size in sorted(args.matches):
+        _ingest(engine, range(ingested, size), pool)
+        ingested = size
+        shutil.rmtree(output_dir, ignore_errors=True)
+        SQLModel.metadata.tables["exported_match"].drop(engine)
+        SQLModel.metadata.tables["exported_match"].create(engine)
+
+        notebook, notebook_time, notebook_peak = _measure(lambda: _notebook_build(engine))
+        _, export_time, export_peak = _measure(lambda: export_features(engine, output_dir, chunk_matches=args.chunk))
+        dataset = read_features(output_dir)
+        print(f"{size} matches on {engine.dialect.name}, {len(dataset)} rows:")
+        print(f"  notebook read_sql + merge  {notebook_time:7.2f}s  peak {notebook_peak:8.1f} MiB  "
+              f"frame {notebook.memory_usage(deep=True).sum() / 2**20:6.1f} MiB")
+        print(f"  export_features            {export_time:7.2f}s  peak {export_peak:8.1f} MiB  "
+              f"frame {dataset.memory_usage(deep=True).sum() / 2**20:6.1f} MiB (compact dtypes, read back)")
+
+    new = max(1, ingested // 50)
+    _ingest(engine, range(ingested, ingested + new), pool)
+    _, refresh_time, refresh_peak = _measure(lambda: export_features(engine, output_dir, chunk_matches=args.chunk))
+    print(f"Refresh after {new} new matches: {refresh_time:.2f}s, peak {refresh_peak:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Times the derived features and category codes of preprocessing.ipynb (pandas arithmetic, a
+row-wise apply for damage_per_kills and dict lookups for the codes) against features.py on a
+synthetic dataset in export.py's compact dtypes, and checks both give the same values.
+
+    python -m benchmarks.bench_features --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from export import compact_dtypes
+from features import DERIVED_FEATURES, add_derived_features, encode_categories
+from benchmarks.fixtures import NUM_AGENTS, NUM_MAPS
+
+QUEUES = ["competitive", "premier", "unrated"]
+
+def _dataset(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    total_rounds = rng.integers(13, 30, num_rows)
+    rounds_won = rng.integers(0, 14, num_rows)
+    frame = pd.DataFrame({
+        "agent_name": rng.choice([f"Agent {i}" for i in range(NUM_AGENTS)], num_rows),
+        "map_name": rng.choice([f"Map {i}" for i in range(NUM_MAPS)], num_rows),
+        "queue_id": rng.choice(QUEUES, num_rows),
+        "stats_score": rng.integers(0, 9000, num_rows),
+        "stats_kills": rng.integers(0, 40, num_rows),
+        "stats_deaths": rng.integers(0, 30, num_rows),
+        "stats_assists": rng.integers(0, 20, num_rows),
+        "stats_damage_dealt": rng.integers(0, 6000, num_rows),
+        "ability_casts_grenade": rng.integers(0, 30, num_rows),
+        "ability_casts_ability1": rng.integers(0, 30, num_rows),
+        "ability_casts_ability2": rng.integers(0, 30, num_rows),
+        "ability_casts_ultimate": rng.integers(0, 5, num_rows),
+        "total_rounds": total_rounds,
+        "rounds_won": np.minimum(rounds_won, total_rounds),
+    })
+    return compact_dtypes(frame)
+
+def _notebook(frame, codes):
+    # Cells 16, 18 and 19 of preprocessing.ipynb
+    frame = frame.copy()
+    for column in codes:
+        mapping = {category: code for code, category in enumerate(codes[column])}
+        frame[f"{column}_numeric"] = frame[column].map(mapping)
+    frame["KDA Ratio"] = (frame["stats_kills"] + frame["stats_assists"]) / (frame["stats_deaths"] + 1)
+    frame["ADR"] = frame["stats_damage_dealt"] / frame["total_rounds"]
+    frame["ACS"] = frame["stats_score"] / frame["total_rounds"]
+    frame["Overall Ability Cast"] = (frame["ability_casts_grenade"] + frame["ability_casts_ability1"]
+                                     + frame["ability_casts_ability2"] + frame["ability_casts_ultimate"]) / frame["total_rounds"]
+    frame["Win Ratio"] = frame["rounds_won"] / frame["total_rounds"]
+
+    def calculate_damage_per_kill(row):
+        if row["stats_kills"] == 0:
+            return 0
+        return row["stats_damage_dealt"] / row["stats_kills"]
+
+    frame["damage_per_kills"] = frame.apply(calculate_damage_per_kill, axis=1)
+    return frame
+
+def _vectorized(frame, codes):
+    return encode_categories(add_derived_features(frame.copy()), codes)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    frame = _dataset(args.rows)
+    codes = {"agent_name": sorted(f"Agent {i}" for i in range(NUM_AGENTS)),
+             "map_name": sorted(f"Map {i}" for i in range(NUM_MAPS)), "queue_id": QUEUES}
+
+    time_ = time.perf_counter()
+    expected = _notebook(frame, codes)
+    notebook_time = time.perf_counter() - time_
+    time_ = time.perf_counter()
+    result = _vectorized(frame, codes)
+    vectorized_time = time.perf_counter() - time_
+
+    mismatched = [column for column in DERIVED_FEATURES
+                  if not np.allclose(result[column], expected[column].astype(float), equal_nan=True)]
+    mismatched += [f"{column}_numeric" for column in codes
+                   if not (result[f"{column}_numeric"] == expected[f"{column}_numeric"]).all()]
+    print(f"{args.rows} rows")
+    print(f"notebook (apply + dict map): {notebook_time:8.2f}s")
+    print(f"features.py:                 {vectorized_time:8.3f}s, {notebook_time / vectorized_time:.0f}x")
+    print("values identical" if not mismatched else f"values differ in: {', '.join(mismatched)}")
+
+if __name__ == "__main__":
+    main()
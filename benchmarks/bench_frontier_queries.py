@@ -0,0 +1,173 @@
+"""
+Times the crawler's own hot queries (leaderboard exclusion, players with fewer than n matches,
+per-player match lookups and frontier claims) on a synthetic match_players table, first
+without the secondary indexes and then after migrations.create_indexes. The selection
+queries read player_crawl_stats; the GROUP BY over match_players they replaced is timed
+alongside for comparison.
+
+    python -m benchmarks.bench_frontier_queries --rows 1000000
+    python -m benchmarks.bench_frontier_queries --url postgresql://.../scratch   # tables are dropped!
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import func, select
+from sqlmodel import SQLModel
+from db import create_db_engine, open_session, copy_rows
+from frontier import FrontierScheduler, players_with_matches, players_with_fewer_matches
+from managers import AssetsDataManager
+from migrations import create_indexes
+from crawl_stats import backfill_player_crawl_stats
+from models import Player, Match, MatchPlayers, Queue
+from benchmarks.fixtures import make_content, make_player_pool, NUM_AGENTS, NUM_MAPS
+
+PLAYERS_PER_MATCH = 10
+CHUNK = 50_000
+
+def _match_player(match_id, puuid, rng):
+    return {
+        "match_id": match_id, "player_puuid": puuid, "team_id": "Red", "platform": "pc", "party_id": None,
+        "agent_id": f"agent-{rng.randrange(NUM_AGENTS)}",
+        "stats_score": 0, "stats_kills": 0, "stats_deaths": 0, "stats_assists": 0, "stats_headshots": 0,
+        "stats_bodyshots": 0, "stats_legshots": 0, "stats_damage_dealt": 0, "stats_damage_received": 0,
+        "ability_casts_grenade": 0, "ability_casts_ability1": 0, "ability_casts_ability2": 0, "ability_casts_ultimate": 0,
+        "tier_id": rng.randrange(3, 28), "account_level": 100, "session_playtime_in_ms": 0,
+        "behavior_afk_rounds": 0.0, "behavior_friendly_fire_incoming": 0.0, "behavior_friendly_fire_outgoing": 0.0,
+        "behavior_rounds_in_spawn": 0.0, "economy_spent_overall": 0, "economy_spent_average": 0.0,
+        "economy_loadout_value_overall": 0, "economy_loadout_value_average": 0.0,
+    }
+
+def _write(engine, model, rows):
+    with open_session(engine) as session:
+        copy_rows(session, model, rows)
+        session.commit()
+
+def _seed(engine, num_rows, num_players):
+    """
+    num_rows match_players rows over num_rows / 10 matches. Players are drawn with a skew,
+    so some have hundreds of matches and many have only a few, like a real crawl.
+    """
+    rng = random.Random(0)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(engine)
+
+    AssetsDataManager(engine=engine, data=make_content()).save()
+    _write(engine, Queue, [{"id": "competitive", "name": "Competitive", "mode_type": "Standard"}])
+    puuids = make_player_pool(num_players)
+    for start in range(0, num_players, CHUNK):
+        _write(engine, Player, [{"puuid": puuid, "name": puuid[:8], "tag": "0000", "primary_region": "na",
+                                 "primary_platform": "pc"} for puuid in puuids[start:start+CHUNK]])
+
+    num_matches = num_rows // PLAYERS_PER_MATCH
+    started_at = datetime(2024, 11, 1)
+    cum_weights = list(accumulate(1 / (rank + 10) for rank in range(num_players)))
+    for start in range(0, num_matches, CHUNK // PLAYERS_PER_MATCH):
+        match_ids = [f"match-{i}" for i in range(start, min(start + CHUNK // PLAYERS_PER_MATCH, num_matches))]
+        _write(engine, Match, [{"id": match_id, "map_id": f"map-{rng.randrange(NUM_MAPS)}", "game_version": "release-09.10",
+                                "game_length_in_ms": 0, "started_at": started_at + timedelta(minutes=i),
+                                "is_completed": True, "queue_id": "competitive", "season_id": "season-1",
+                                "platform": "pc", "premier": None, "region": "na", "cluster": "Virginia"}
+                               for i, match_id in enumerate(match_ids, start)])
+        rows = []
+        for match_id in match_ids:
+            players = set()
+            while len(players) < PLAYERS_PER_MATCH:
+                players.update(rng.choices(puuids, cum_weights=cum_weights, k=PLAYERS_PER_MATCH - len(players)))
+            rows.extend(_match_player(match_id, puuid, rng) for puuid in players)
+        _write(engine, MatchPlayers, rows)
+
+    backfill_player_crawl_stats(engine)
+
+    # A frontier some way into a crawl: nine in ten players are done, the rest pending
+    frontier = FrontierScheduler(engine)
+    frontier.add([("na", "pc", puuid) for puuid in puuids])
+    frontier.complete([(puuid, 1, None, None) for i, puuid in enumerate(puuids) if i % 10])
+    return puuids
+
+def _time(label, function, repeat):
+    times = []
+    for _ in range(repeat):
+        time_ = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - time_)
+    best = min(times)
+    print(f"  {label:<34} {best * 1000:9.1f} ms  ({len(result)} rows)")
+    return best
+
+def _run_queries(engine, puuids, repeat):
+    rng = random.Random(1)
+    leaderboard = rng.sample(puuids, min(9000, len(puuids)))
+    lookups = rng.sample(puuids, 200)
+    frontier = FrontierScheduler(engine)
+
+    def exclusion():
+        with open_session(engine) as session:
+            return players_with_matches(session, 10, puuids=leaderboard)
+
+    def fewer_matches():
+        with open_session(engine) as session:
+            return players_with_fewer_matches(session, 10, 50)
+
+    def fewer_matches_aggregate():
+        match_count = func.count(MatchPlayers.match_id)
+        with open_session(engine) as session:
+            return session.execute(
+                select(Player.puuid, Player.primary_platform, Player.primary_region)
+                    .outerjoin(MatchPlayers, Player.puuid == MatchPlayers.player_puuid)
+                    .where(Player.primary_platform.is_not(None), Player.primary_region.is_not(None))
+                    .group_by(Player.puuid)
+                    .having(match_count < 10)
+                    .order_by(match_count)
+                    .limit(50)
+            ).all()
+
+    def player_matches():
+        with open_session(engine) as session:
+            return [session.execute(select(MatchPlayers.match_id).where(MatchPlayers.player_puuid == puuid)).all()
+                    for puuid in lookups]
+
+    def claim():
+        return frontier.claim(50)
+
+    return {
+        "leaderboard exclusion (9000 puuids)": _time("leaderboard exclusion (9000 puuids)", exclusion, repeat),
+        "players with < 10 matches": _time("players with < 10 matches", fewer_matches, repeat),
+        "  same, GROUP BY match_players": _time("  same, GROUP BY match_players", fewer_matches_aggregate, repeat),
+        "200 per-player match lookups": _time("200 per-player match lookups", player_matches, repeat),
+        "frontier claim(50)": _time("frontier claim(50)", claim, repeat),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="match_players rows")
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", help="Scratch database URL. Defaults to a temporary SQLite file.")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_db_engine(url)
+    time_ = time.perf_counter()
+    puuids = _seed(engine, args.rows, args.players)
+    print(f"Seeded {args.rows} match_players rows, {args.players} players on {engine.dialect.name} "
+          f"in {time.perf_counter() - time_:.0f}s")
+
+    print("Without secondary indexes:")
+    before = _run_queries(engine, puuids, args.repeat)
+    time_ = time.perf_counter()
+    create_indexes(engine)
+    print(f"Indexes built in {time.perf_counter() - time_:.1f}s")
+    print("With indexes:")
+    after = _run_queries(engine, puuids, args.repeat)
+    for label in before:
+        print(f"  {label:<34} {before[label] / after[label]:6.1f}x")
+
+if __name__ == "__main__":
+    main()
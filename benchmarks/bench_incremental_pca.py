@@ -0,0 +1,94 @@
+"""
+Checks that scoring.IncrementalPcaFit gives the same model as PcaModel.fit on the whole dataset,
+and compares their time and peak memory. A synthetic dataset is exported in several parts; the
+incremental fit folds in each part as it appears (saving and reloading its state in between) and
+is compared with a full fit after the last one. Exits with status 1 when they differ by more
+than --tolerance.
+
+    python -m benchmarks.bench_incremental_pca --rows 1000000 --parts 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from export import PARTITION_COLUMNS, read_features
+from scoring import FEATURE_COLUMNS, SCALER_QUEUES, PCA_QUEUES, IncrementalPcaFit, PcaModel
+from benchmarks.fixtures import NUM_MAPS, make_feature_matrix
+
+QUEUES = SCALER_QUEUES + ["swiftplay"]
+# Neutral names, so read_features leaves the synthetic values in float64
+FEATURES = [f"feature_{i}" for i in range(len(FEATURE_COLUMNS))]
+
+def _export_part(output_dir, part, num_rows, seed):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(make_feature_matrix(num_rows, len(FEATURES), seed=seed), columns=FEATURES)
+    frame.iloc[rng.random(num_rows) < 0.001, 0] = np.nan  # the notebooks drop rows with missing values
+    frame["match_id"] = [f"match-{seed}-{i // 10}" for i in range(num_rows)]
+    frame["player_puuid"] = [f"player-{i % 10}" for i in range(num_rows)]
+    frame["map_name"] = rng.choice([f"Map {i}" for i in range(NUM_MAPS)], num_rows)
+    frame["queue_id"] = rng.choice(QUEUES, num_rows, p=[0.5, 0.1, 0.3, 0.1])
+    pq.write_to_dataset(pa.Table.from_pandas(frame, preserve_index=False), output_dir, partition_cols=PARTITION_COLUMNS,
+                        basename_template=f"part-{part:05d}-{{i}}.parquet")
+
+def _measure(function):
+    tracemalloc.start()
+    time_ = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - time_
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+def _full_fit(output_dir):
+    frame = read_features(output_dir, queues=SCALER_QUEUES, columns=FEATURES + ["queue_id"])
+    return PcaModel.fit(frame, pca_rows=frame["queue_id"].isin(PCA_QUEUES), feature_names=FEATURES)
+
+def _incremental_fit(output_dir, state_path):
+    fit = IncrementalPcaFit.load(state_path) if os.path.exists(state_path) else IncrementalPcaFit(FEATURES)
+    fit.fold_dataset(output_dir)
+    fit.save(state_path)
+    return fit.to_model()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows over all parts")
+    parser.add_argument("--parts", type=int, default=4, help="exports the rows arrive in")
+    parser.add_argument("--tolerance", type=float, default=1e-8)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    output_dir, state_path = os.path.join(directory, "dataset"), os.path.join(directory, "pca_state.npz")
+    fold_time, fold_peak = 0.0, 0.0
+    for part in range(args.parts):
+        _export_part(output_dir, part, args.rows // args.parts, seed=part)
+        incremental, elapsed, peak = _measure(lambda: _incremental_fit(output_dir, state_path))
+        fold_time, fold_peak = fold_time + elapsed, max(fold_peak, peak)
+    full, full_time, full_peak = _measure(lambda: _full_fit(output_dir))
+
+    differences = {
+        "explained variance ratio": np.abs(incremental.explained_variance_ratio - full.explained_variance_ratio).max(),
+        "loadings": np.abs(incremental.components - full.components).max(),
+        "scaler mean (relative)": np.abs(incremental.mean / full.mean - 1).max(),
+        "scaler scale (relative)": np.abs(incremental.scale / full.scale - 1).max(),
+    }
+    sample = make_feature_matrix(10_000, len(FEATURES), seed=args.parts)
+    differences["scores"] = np.abs(incremental.project(sample) - full.project(sample)).max()
+
+    print(f"{args.rows} rows in {args.parts} parts")
+    print(f"full fit:        {full_time:6.2f}s, peak {full_peak:7.1f} MiB")
+    print(f"incremental fit: {fold_time:6.2f}s over {args.parts} folds, peak {fold_peak:7.1f} MiB per fold")
+    for label, difference in differences.items():
+        print(f"  max difference in {label:<25} {difference:.2e}")
+    if max(differences.values()) > args.tolerance:
+        print(f"Incremental fit differs from the full fit by more than {args.tolerance}")
+        sys.exit(1)
+    print(f"Incremental fit matches the full fit within {args.tolerance}")
+
+if __name__ == "__main__":
+    main()
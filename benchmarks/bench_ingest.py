@@ -0,0 +1,75 @@
+"""
+Compares the session.merge ingestion path of MatchDataManager with the bulk upsert path
+and the cross-match MatchBatchWriter (with and without COPY for the event tables), and checks
+that all of them leave the same rows behind. COPY only differs from the batch path on Postgres.
+
+    python -m benchmarks.bench_ingest --matches 20
+    python -m benchmarks.bench_ingest --url postgresql://.../scratch   # tables are dropped!
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlmodel import SQLModel, Session, select
+from db import create_db_engine
+import models  # noqa: F401 registers the tables
+from managers import MatchDataManager, MatchBatchWriter, AssetsDataManager
+from benchmarks.fixtures import make_match, make_player_pool, make_content
+
+def _snapshot(engine):
+    tables = {}
+    with Session(engine) as session:
+        for model in MatchDataManager.BULK_TABLE_ORDER:
+            table = model.__table__
+            columns = [c for c in table.columns if c is not table.autoincrement_column]
+            rows = session.exec(select(*columns)).all()
+            tables[table.name] = sorted(tuple(map(repr, row)) for row in rows)
+    return tables
+
+def _run(engine, matches, bulk, batch_matches=None, use_copy=False):
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    AssetsDataManager(engine=engine, data=make_content()).save()
+    time_ = time.perf_counter()
+    if batch_matches:
+        with MatchBatchWriter(engine, max_matches=batch_matches, use_copy=use_copy) as writer:
+            for match in matches:
+                writer.add(MatchDataManager(engine=engine, data=match))
+    else:
+        for match in matches:
+            MatchDataManager(engine=engine, data=match, bulk=bulk).save()
+    return time.perf_counter() - time_
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=50, help="Matches per MatchBatchWriter transaction.")
+    parser.add_argument("--url", help="Scratch database URL. Defaults to a temporary SQLite file.")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_db_engine(url)
+    pool = make_player_pool(200)
+    matches = [make_match(seed, player_pool=pool) for seed in range(args.matches)]
+
+    merge_time = _run(engine, matches, bulk=False)
+    merge_rows = _snapshot(engine)
+    bulk_time = _run(engine, matches, bulk=True)
+    bulk_rows = _snapshot(engine)
+    batch_time = _run(engine, matches, bulk=True, batch_matches=args.batch)
+    batch_rows = _snapshot(engine)
+    copy_time = _run(engine, matches, bulk=True, batch_matches=args.batch, use_copy=True)
+    copy_rows = _snapshot(engine)
+
+    mismatched = [name for name in merge_rows
+                  if not merge_rows[name] == bulk_rows[name] == batch_rows[name] == copy_rows[name]]
+    total_rows = sum(len(rows) for rows in bulk_rows.values())
+    print(f"{args.matches} matches, {total_rows} rows on {engine.dialect.name}")
+    print(f"merge: {merge_time:.2f}s ({args.matches / merge_time:.2f} matches/s)")
+    print(f"bulk:  {bulk_time:.2f}s ({args.matches / bulk_time:.2f} matches/s), {merge_time / bulk_time:.1f}x")
+    print(f"batch: {batch_time:.2f}s ({args.matches / batch_time:.2f} matches/s), {merge_time / batch_time:.1f}x")
+    print(f"copy:  {copy_time:.2f}s ({args.matches / copy_time:.2f} matches/s), {merge_time / copy_time:.1f}x")
+    print("rows identical" if not mismatched else f"rows differ in: {', '.join(mismatched)}")
+
+if __name__ == "__main__":
+    main()
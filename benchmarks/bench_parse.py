@@ -0,0 +1,42 @@
+"""
+Parse throughput of the ingestion parse stage (match JSON -> row tuples per table)
+in this process and in a ProcessPoolExecutor with a growing number of workers.
+
+    python -m benchmarks.bench_parse --matches 400
+"""
+import argparse
+import json
+import os
+import time
+from parsing import parse_matches, make_parse_pool
+from benchmarks.fixtures import make_match, make_player_pool
+
+def _time(matches, executor=None):
+    time_ = time.perf_counter()
+    rows = sum(parsed.row_count() for parsed in parse_matches(matches, executor=executor, chunksize=8))
+    return time.perf_counter() - time_, rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=400)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    pool = make_player_pool(2000)
+    # Round-trip through JSON so payloads look like what the API client hands over
+    matches = [json.loads(json.dumps(make_match(seed, player_pool=pool), default=str)) for seed in range(args.matches)]
+
+    elapsed, rows = _time(matches)
+    print(f"{args.matches} matches, {rows} rows")
+    print(f"in process: {args.matches / elapsed:8.1f} matches/s")
+
+    workers = 1
+    while workers <= args.max_workers:
+        with make_parse_pool(workers) as executor:
+            _time(matches[:workers * 8], executor)  # start the workers before timing
+            elapsed, _ = _time(matches, executor)
+        print(f"{workers:2d} workers: {args.matches / elapsed:8.1f} matches/s")
+        workers *= 2
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Latency of recommend.RecommendationIndex with tens of thousands of players indexed: the neighbour
+search alone and a full recommendation, by brute force and with the BallTree, and a check that
+both methods recommend the same agents. The index is built from synthetic per player, agent and
+map sums, as RecommendationIndex.build aggregates an exported dataset.
+
+    python -m benchmarks.bench_recommend --players 50000
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from recommend import KEY_COLUMNS, RecommendationIndex
+from scoring import COMPONENT_NAMES
+from benchmarks.fixtures import NUM_AGENTS, NUM_MAPS
+
+def _sums(num_players, entries_per_player, seed=0):
+    # Players with a PC profile of their own, each playing a few agents on a few maps
+    rng = np.random.default_rng(seed)
+    profiles = rng.normal(size=(num_players, len(COMPONENT_NAMES))) * np.linspace(2.0, 0.5, len(COMPONENT_NAMES))
+    players = np.repeat(np.arange(num_players), entries_per_player)
+    entries = pd.DataFrame({
+        "player_puuid": [f"player-{i:06d}" for i in players],
+        "agent_id": [f"agent-{i}" for i in rng.integers(0, NUM_AGENTS, len(players))],
+        "map_id": [f"map-{i}" for i in rng.integers(0, NUM_MAPS, len(players))],
+    }).drop_duplicates(KEY_COLUMNS)
+    players = players[entries.index]
+    matches = rng.integers(1, 20, len(entries))
+    scores = (profiles[players] + rng.normal(scale=0.5, size=(len(entries), len(COMPONENT_NAMES)))) * matches[:, None]
+    for i, name in enumerate(COMPONENT_NAMES):
+        entries[name] = scores[:, i]
+    entries["total_pc_score"] = scores.sum(axis=1)
+    entries["matches"] = matches
+    return entries.set_index(KEY_COLUMNS)
+
+def _latencies(function, queries):
+    times = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        time_ = time.perf_counter()
+        function(query)
+        times[i] = time.perf_counter() - time_
+    return times * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=50_000)
+    parser.add_argument("--entries", type=int, default=15, help="agent and map pairs per player")
+    parser.add_argument("--neighbours", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    sums = _sums(args.players, args.entries)
+    indexes = {}
+    for method in ("brute", "ball_tree"):
+        time_ = time.perf_counter()
+        indexes[method] = RecommendationIndex.from_sums(sums, COMPONENT_NAMES, method=method)
+        print(f"{method:<9} index of {args.players} players, {len(sums)} entries built in {time.perf_counter() - time_:.2f}s")
+
+    rng = np.random.default_rng(1)
+    queries = [(indexes["brute"].player_puuids[i], f"map-{rng.integers(NUM_MAPS)}")
+               for i in rng.integers(0, args.players, args.queries)]
+    results = {}
+    for method, index in indexes.items():
+        search = _latencies(lambda query: index.neighbours(index.profile(query[0])[0], args.neighbours), queries)
+        recommend = _latencies(lambda query: index.recommend(index.profile(query[0])[0], query[1], k=args.neighbours,
+                                                             exclude=query[0]), queries)
+        results[method] = [index.recommend(index.profile(player)[0], map_, k=args.neighbours, exclude=player)
+                           for player, map_ in queries[:100]]
+        for label, latency in (("neighbours", search), ("recommend", recommend)):
+            print(f"{method:<9} {label:<10} p50 {np.percentile(latency, 50):6.3f} ms  p99 {np.percentile(latency, 99):6.3f} ms")
+    same = all(brute["agent_id"].tolist() == tree["agent_id"].tolist()
+               for brute, tree in zip(results["brute"], results["ball_tree"]))
+    if not same:
+        print("Brute force and BallTree recommendations differ")
+        sys.exit(1)
+    print("Brute force and BallTree recommend the same agents")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Times scoring.PcaModel against the fitted scikit-learn StandardScaler + PCA it was built from:
+batch projection of many rows, and the latency of scoring a single row as a dashboard would.
+
+    python -m benchmarks.bench_scoring --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+from scoring import FEATURE_COLUMNS, PcaModel
+from benchmarks.fixtures import make_feature_matrix
+
+def _latencies(function, rows):
+    times = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        time_ = time.perf_counter()
+        function(row)
+        times[i] = time.perf_counter() - time_
+    return times * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--single", type=int, default=2000, help="rows scored one at a time")
+    args = parser.parse_args()
+
+    features = make_feature_matrix(args.rows, len(FEATURE_COLUMNS))
+    frame = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    model = PcaModel.fit(frame)
+    scaler = StandardScaler().fit(features)
+    pca = PCA(n_components=8).fit(scaler.transform(features))
+
+    time_ = time.perf_counter()
+    expected = pca.transform(scaler.transform(features))
+    sklearn_time = time.perf_counter() - time_
+    time_ = time.perf_counter()
+    scores = model.project(features)
+    model_time = time.perf_counter() - time_
+    print(f"Batch of {args.rows} rows: scikit-learn {sklearn_time:.3f}s, PcaModel.project {model_time:.3f}s "
+          f"({sklearn_time / model_time:.1f}x), max difference {np.abs(scores - expected).max():.2e}")
+
+    records = frame.iloc[:args.single].to_dict("records")
+    sklearn_latency = _latencies(lambda record: pca.transform(scaler.transform(np.array([[record[column] for column in FEATURE_COLUMNS]]))), records)
+    model_latency = _latencies(model.project_one, records)
+    for label, latency in (("scikit-learn", sklearn_latency), ("PcaModel.project_one", model_latency)):
+        print(f"Single row, {label:<20} p50 {np.percentile(latency, 50):7.1f} us  p99 {np.percentile(latency, 99):7.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Synthetic Henrikdev v4 match payloads for the benchmarks. Shapes follow what MatchDataManager reads.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+NUM_AGENTS = 25
+NUM_MAPS = 8
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+def make_player_pool(size, seed=0):
+    rng = random.Random(seed)
+    return [_uuid(rng) for _ in range(size)]
+
+def make_match(seed=0, n_rounds=24, player_pool=None):
+    """
+    Builds one match dict. Ten players are drawn from player_pool (or freshly generated),
+    so matches built from the same pool share Player rows like real crawls do.
+    """
+    rng = random.Random(seed)
+    if player_pool is None:
+        player_pool = make_player_pool(10, seed)
+    puuids = rng.sample(player_pool, 10)
+    teams = ["Red"] * 5 + ["Blue"] * 5
+    agents = [f"agent-{i}" for i in rng.sample(range(NUM_AGENTS), 10)]
+
+    def ref(i):
+        return {"puuid": puuids[i], "name": f"player-{puuids[i][:8]}", "tag": "0000", "team": teams[i]}
+
+    def weapon():
+        i = rng.randrange(18)
+        return {"id": f"weapon-{i}", "name": f"Weapon {i}", "type": "Weapon"}
+
+    players = []
+    for i in range(10):
+        players.append({
+            "puuid": puuids[i], "name": f"player-{puuids[i][:8]}", "tag": "0000", "team_id": teams[i],
+            "platform": "pc", "party_id": _uuid(rng),
+            "agent": {"id": agents[i], "name": agents[i]},
+            "stats": {"score": rng.randrange(1000, 8000), "kills": rng.randrange(30), "deaths": rng.randrange(1, 30),
+                      "assists": rng.randrange(12), "headshots": rng.randrange(20), "bodyshots": rng.randrange(60),
+                      "legshots": rng.randrange(8), "damage": {"dealt": rng.randrange(800, 6000), "received": rng.randrange(800, 6000)}},
+            "ability_casts": {"grenade": rng.randrange(30), "ability1": rng.randrange(30), "ability2": rng.randrange(30), "ultimate": rng.randrange(5)},
+            "tier": {"id": rng.randrange(3, 28), "name": "Tier"},
+            "account_level": rng.randrange(20, 400), "session_playtime_in_ms": rng.randrange(1_500_000, 3_000_000),
+            "behavior": {"afk_rounds": 0.0, "friendly_fire": {"incoming": 0.0, "outgoing": 0.0}, "rounds_in_spawn": 0.0},
+            "economy": {"spent": {"overall": rng.randrange(40000, 90000), "average": rng.uniform(1500, 4000)},
+                        "loadout_value": {"overall": rng.randrange(40000, 90000), "average": rng.uniform(1500, 4000)}},
+        })
+
+    rounds, kills = [], []
+    red_won = 0
+    for r in range(n_rounds):
+        locations = [{"player": ref(i), "view_radians": rng.uniform(0, 6.28),
+                      "location": {"x": rng.uniform(-9000, 9000), "y": rng.uniform(-9000, 9000)}} for i in range(10)]
+        plant = None
+        defuse = None
+        if rng.random() < 0.6:
+            plant = {"round_time_in_ms": rng.randrange(20000, 90000), "site": rng.choice("ABC"),
+                     "location": {"x": rng.randrange(-9000, 9000), "y": rng.randrange(-9000, 9000)},
+                     "player": ref(rng.randrange(5)), "player_locations": locations}
+            if rng.random() < 0.3:
+                defuse = {"round_time_in_ms": rng.randrange(90000, 130000),
+                          "location": {"x": rng.randrange(-9000, 9000), "y": rng.randrange(-9000, 9000)},
+                          "player": ref(5 + rng.randrange(5)), "player_locations": locations}
+        stats = []
+        for i in range(10):
+            enemies = [j for j in range(10) if teams[j] != teams[i]]
+            stats.append({
+                "player": ref(i),
+                "ability_casts": {"grenade": rng.randrange(2), "ability1": rng.randrange(2), "ability2": rng.randrange(2), "ultimate": 0},
+                "damage_events": [{"player": ref(j), "bodyshots": rng.randrange(4), "headshots": rng.randrange(2),
+                                   "legshots": rng.randrange(2), "damage": rng.randrange(20, 160)}
+                                  for j in rng.sample(enemies, rng.randrange(0, 4))],
+                "stats": {"score": rng.randrange(0, 600), "kills": rng.randrange(3), "headshots": rng.randrange(3),
+                          "bodyshots": rng.randrange(6), "legshots": rng.randrange(2), "damage": rng.randrange(0, 400)},
+                "economy": {"loadout_value": rng.randrange(0, 5000), "remaining": rng.randrange(0, 9000),
+                            "weapon": weapon(), "armor": {"id": "armor-heavy", "name": "Heavy Shields"}},
+                "was_afk": False, "received_penalty": False, "stayed_in_spawn": False,
+            })
+        winner = rng.choice(["Red", "Blue"])
+        red_won += winner == "Red"
+        rounds.append({"id": r, "result": "Elimination", "ceremony": "CeremonyDefault", "winning_team": winner,
+                       "plant": plant, "defuse": defuse, "stats": stats})
+        for k in range(rng.randrange(5, 10)):
+            killer, victim = rng.randrange(10), rng.randrange(10)
+            kills.append({
+                "time_in_round_in_ms": rng.randrange(0, 100000), "time_in_match_in_ms": r * 100000 + k,
+                "round": r, "killer": ref(killer), "victim": ref(victim),
+                "assistants": [ref(j) for j in rng.sample(range(10), rng.randrange(0, 3))],
+                "location": {"x": rng.uniform(-9000, 9000), "y": rng.uniform(-9000, 9000)},
+                "weapon": weapon(), "secondary_fire_mode": False, "player_locations": locations,
+            })
+
+    map_index = rng.randrange(NUM_MAPS)
+    return {
+        "metadata": {
+            "match_id": _uuid(rng),
+            "map": {"id": f"map-{map_index}", "name": f"Map {map_index}"},
+            "game_version": "release-09.10", "game_length_in_ms": rng.randrange(1_500_000, 3_000_000),
+            "started_at": datetime(2024, 11, 1, tzinfo=timezone.utc) + timedelta(minutes=seed),
+            "is_completed": True,
+            "queue": {"id": "competitive", "name": "Competitive", "mode_type": "Standard"},
+            "season": {"id": "season-1", "short": "e9a3"},
+            "platform": "pc", "premier": None, "region": "na", "cluster": "Virginia",
+        },
+        "players": players, "observers": [], "coaches": [],
+        "teams": [
+            {"team_id": "Red", "rounds": {"won": red_won, "lost": n_rounds - red_won}, "won": red_won * 2 > n_rounds, "premier_roster": None},
+            {"team_id": "Blue", "rounds": {"won": n_rounds - red_won, "lost": red_won}, "won": red_won * 2 < n_rounds, "premier_roster": None},
+        ],
+        "rounds": rounds, "kills": kills,
+    }
+
+def make_content(version="release-09.10"):
+    """
+    A valorant/v1/content payload covering every agent, map, weapon and act make_match refers to.
+    """
+    def asset(prefix, i, name):
+        return {"id": f"{prefix}-{i}", "name": f"{name} {i}", "assetName": f"{name}{i}", "localizedNames": {"en-US": f"{name} {i}"}}
+    return {
+        "version": version,
+        "characters": [asset("agent", i, "Agent") for i in range(NUM_AGENTS)],
+        "maps": [asset("map", i, "Map") for i in range(NUM_MAPS)],
+        "equips": [asset("weapon", i, "Weapon") for i in range(18)],
+        "acts": [{"id": "season-1", "parentId": "00000000-0000-0000-0000-000000000000", "type": "act",
+                  "name": "ACT III", "localizedNames": {"en-US": "ACT III"}, "isActive": True}],
+    }
+
+def make_feature_matrix(num_rows, num_features, seed=0):
+    """
+    A (num_rows, num_features) float array of correlated features on very different scales,
+    standing in for the stats columns of the analysis dataset.
+    """
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size=(10, num_features))
+    scales = rng.uniform(1, 5000, num_features)
+    return (rng.normal(size=(num_rows, 10)) @ mixing + rng.normal(size=(num_rows, num_features))) * scales
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from sqlmodel import select
+from db import open_session
+from models import Equipment, Armor, Queue, Player, Match
+
+class KnownKeysCache:
+    """
+    Primary keys of lookup rows (Equipment, Armor, Queue, Player) that are already in the database.
+    Bulk ingestion checks it before writing, so lookup rows we already have cost nothing.
+    Players are bounded with LRU eviction; the other tables are small enough to keep whole.
+    """
+    def __init__(self, max_players=500_000):
+        self.max_players = max_players
+        self._keys = {
+            Equipment: set(),
+            Armor: set(),
+            Queue: set(),
+            Player: OrderedDict(),
+        }
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key_column(model):
+        return model.__table__.primary_key.columns.values()[0].name
+
+    def warm(self, engine):
+        with open_session(engine) as session:
+            # Equipment synced from the content endpoint has no type yet; let the first match fill it in
+            self._keys[Equipment].update(session.exec(select(Equipment.id).where(Equipment.type.is_not(None))).all())
+            self._keys[Armor].update(session.exec(select(Armor.id)).all())
+            self._keys[Queue].update(session.exec(select(Queue.id)).all())
+            for puuid in session.exec(select(Player.puuid).limit(self.max_players)).yield_per(10_000):
+                self._keys[Player][puuid] = None
+        return self
+
+    def __contains__(self, item):
+        model, key = item
+        return key in self._keys.get(model, ())
+
+    def unknown_rows(self, model, rows):
+        """
+        Returns the rows whose primary key is not cached. Tables the cache does not track pass through.
+        """
+        keys = self._keys.get(model)
+        if keys is None:
+            return rows
+        key_column = self._key_column(model)
+        unknown = []
+        for row in rows:
+            key = row[key_column]
+            if key in keys:
+                self.hits += 1
+                if model is Player:
+                    keys.move_to_end(key)
+            else:
+                self.misses += 1
+                unknown.append(row)
+        return unknown
+
+    def remember(self, model, rows):
+        """
+        Records rows that were written. Call only after the transaction that wrote them committed.
+        """
+        keys = self._keys.get(model)
+        if keys is None:
+            return
+        key_column = self._key_column(model)
+        if model is Player:
+            for row in rows:
+                keys[row[key_column]] = None
+                keys.move_to_end(row[key_column])
+            while len(keys) > self.max_players:
+                keys.popitem(last=False)
+        else:
+            keys.update(row[key_column] for row in rows)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            **{model.__tablename__: len(keys) for model, keys in self._keys.items()},
+        }
+
+class KnownMatchIds:
+    """
+    Match ids already stored, checked a whole page at a time before any match payload is parsed.
+    Ids missing from the in-memory set are confirmed with a single WHERE id IN (...) query, which
+    also catches matches written by another crawler since start-up. The set keeps the max_ids
+    most recently seen ids (about 180 bytes each, so 100 000 ids take under 20 MiB), so a crawl
+    that runs for days does not grow without bound; an evicted id only costs that query again.
+    """
+    def __init__(self, engine, max_ids=100_000):
+        self.engine = engine
+        self.max_ids = max_ids
+        self.ids = OrderedDict()
+        self.skipped = 0
+
+    def warm(self):
+        newest = select(Match.id, Match.started_at).order_by(Match.started_at.desc()).limit(self.max_ids).subquery()
+        with open_session(self.engine) as session:
+            # Oldest matches at the front, where eviction starts
+            self.ids = OrderedDict.fromkeys(session.exec(select(newest.c.id).order_by(newest.c.started_at)).yield_per(10_000))
+        return self
+
+    def add(self, match_id):
+        self.ids[match_id] = None
+        self.ids.move_to_end(match_id)
+        while len(self.ids) > self.max_ids:
+            self.ids.popitem(last=False)
+
+    def filter_new(self, match_ids):
+        """
+        Returns the ids in match_ids that are not stored yet, keeping their order.
+        """
+        candidates = [match_id for match_id in dict.fromkeys(match_ids) if match_id not in self.ids]
+        if candidates:
+            with open_session(self.engine) as session:
+                stored = set(session.exec(select(Match.id).where(Match.id.in_(candidates))).all())
+            for match_id in stored:
+                self.add(match_id)
+            candidates = [match_id for match_id in candidates if match_id not in stored]
+        self.skipped += len(match_ids) - len(candidates)
+        return candidates
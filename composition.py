@@ -0,0 +1,185 @@
+"""
+Five-agent team compositions scored for a map. Every composition of the agents played on the map
+is encoded as a bitmask (bit i set when agent i is on the team) and all of them are scored in one
+batch from two parts:
+    win:      the mean over the composition's ten agent pairs of how often teams with both agents
+              won on the map (match_teams.won), smoothed towards the overall win rate;
+    coverage: the sum over the components of the best mean score any member has on the map, so a
+              team covers each component with a specialist, as the notebook picks teammates for
+              an agent's weakest components.
+Each part is standardized over all compositions and the final score is win + pc_weight * coverage.
+
+    python composition.py --map Ascent --model output/pca.npz --top 10
+    python composition.py --map Ascent --cube output/cube.npz   # a .npz cube instead of agent_map_stats
+    python composition.py --map Ascent --include Jett Sova --exclude Reyna
+"""
+import argparse
+import os
+from itertools import combinations
+from math import comb
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from models import Match, MatchPlayers, MatchTeams
+from scoring import PCA_QUEUES
+
+TEAM_SIZE = 5
+
+def compositions(num_agents, size=TEAM_SIZE):
+    """
+    Every size-agent composition of num_agents agents as a (compositions, size) array of agent
+    positions in lexicographic order, and the matching uint64 bitmasks.
+    """
+    members = np.fromiter((i for team in combinations(range(num_agents), size) for i in team), dtype=np.int8,
+                          count=comb(num_agents, size) * size).reshape(-1, size)
+    return members, np.bitwise_or.reduce(np.left_shift(np.uint64(1), members.astype(np.uint64)), axis=1)
+
+def team_compositions(engine, map_id, agent_ids, queues=PCA_QUEUES, chunk_size=100_000):
+    """
+    The bitmask over agent_ids of every team that played map_id in queues and whether it won,
+    from match_players and match_teams. Agents not in agent_ids leave their bit out.
+    """
+    positions = {agent_id: i for i, agent_id in enumerate(agent_ids)}
+    query = (
+        select(MatchPlayers.match_id, MatchPlayers.team_id, MatchPlayers.agent_id, MatchTeams.won)
+            .join(MatchTeams, (MatchTeams.match_id == MatchPlayers.match_id) & (MatchTeams.team_id == MatchPlayers.team_id))
+            .join(Match, Match.id == MatchPlayers.match_id)
+            .where(Match.map_id == map_id, Match.queue_id.in_(queues))
+    )
+    parts = []
+    with engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        for frame in pd.read_sql(query, connection, chunksize=chunk_size):
+            position = frame["agent_id"].map(positions)
+            frame["bit"] = np.where(position.isna(), np.uint64(0),
+                                    np.left_shift(np.uint64(1), position.fillna(0).to_numpy(dtype=np.uint64)))
+            # Teammates are distinct agents, so the sum of their bits is the team's mask; a team cut
+            # by a chunk boundary is completed by adding its parts again below
+            parts.append(frame.groupby(["match_id", "team_id"]).agg(mask=("bit", "sum"), won=("won", "first")))
+    if not parts:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    teams = pd.concat(parts).groupby(level=["match_id", "team_id"]).agg(mask=("mask", "sum"), won=("won", "first"))
+    return teams["mask"].to_numpy(dtype=np.uint64), teams["won"].to_numpy(dtype=bool)
+
+class CompositionScorer:
+    """
+    Scores every TEAM_SIZE-agent composition of agent_ids for one map, given each agent's mean
+    component scores on the map (pc_scores, agents x components) and the bitmasks and results of
+    the teams that played it. Pair win rates are smoothed with prior games at the overall win
+    rate, so rarely seen pairs stay near it.
+    """
+    def __init__(self, agent_ids, agent_names, pc_scores, component_names, team_masks, team_won, prior=20):
+        if len(agent_ids) > 64:
+            raise ValueError("Bitmasks hold at most 64 agents")
+        self.agent_ids, self.agent_names = list(agent_ids), list(agent_names)
+        self.pc_scores = np.asarray(pc_scores, dtype=np.float64)
+        self.component_names = list(component_names)
+        self.team_masks = np.asarray(team_masks, dtype=np.uint64)
+        self.team_won = np.asarray(team_won, dtype=bool)
+        self.members, self.masks = compositions(len(self.agent_ids))
+
+        # Games and wins of every distinct team played, and of the compositions played as such
+        played, inverse = np.unique(self.team_masks, return_inverse=True)
+        played_games = np.bincount(inverse, minlength=len(played))
+        played_wins = np.bincount(inverse, weights=self.team_won, minlength=len(played))
+        positions = np.searchsorted(played, self.masks)
+        found = positions < len(played)
+        found[found] = played[positions[found]] == self.masks[found]
+        self.games = np.zeros(len(self.masks), dtype=np.int64)
+        self.wins = np.zeros(len(self.masks), dtype=np.int64)
+        self.games[found] = played_games[positions[found]]
+        self.wins[found] = played_wins[positions[found]]
+
+        # Pair games and wins from the agents of the distinct teams; the diagonal holds each agent's own
+        membership = ((played[:, None] >> np.arange(len(self.agent_ids), dtype=np.uint64)) & np.uint64(1)).astype(np.float64)
+        self.pair_games = membership.T @ (membership * played_games[:, None])
+        self.pair_wins = membership.T @ (membership * played_wins[:, None])
+        base = self.team_won.mean() if len(self.team_won) else 0.5
+        self.pair_win_rates = (self.pair_wins + prior * base) / (self.pair_games + prior)
+
+        pairs = list(combinations(range(TEAM_SIZE), 2))
+        self.win = sum(self.pair_win_rates[self.members[:, a], self.members[:, b]] for a, b in pairs) / len(pairs)
+        self.coverage = self.pc_scores[self.members].max(axis=1).sum(axis=1)
+
+    @classmethod
+    def for_map(cls, engine, cube, model, map_id, queues=PCA_QUEUES, min_count=30, prior=20):
+        """
+        The scorer for map_id over the agents with at least min_count rows on it in queues, with
+        their component means from an AggregateCube and the team results from the database.
+        """
+        table = cube.table(by=["agent_id"], model=model, maps=[map_id], queues=queues)
+        table = table[table["count"] >= min_count]
+        agent_ids = table.index.tolist()
+        team_masks, team_won = team_compositions(engine, map_id, agent_ids, queues=queues)
+        return cls(agent_ids, table["agent_name"].tolist(), table[model.component_names].to_numpy(),
+                   model.component_names, team_masks, team_won, prior=prior)
+
+    def mask(self, agents):
+        """
+        Bitmask of agents given by id or name.
+        """
+        mask = np.uint64(0)
+        for agent in agents:
+            names = self.agent_ids if agent in self.agent_ids else self.agent_names
+            if agent not in names:
+                raise KeyError(f"Agent {agent!r} is not in the pool of this map")
+            mask |= np.uint64(1) << np.uint64(names.index(agent))
+        return mask
+
+    def scores(self, pc_weight=1.0):
+        """
+        Score of every composition: the standardized win part plus pc_weight times the
+        standardized coverage part.
+        """
+        def standardize(values):
+            scale = values.std()
+            return (values - values.mean()) / (scale if scale > 0 else 1.0)
+
+        return standardize(self.win) + pc_weight * standardize(self.coverage)
+
+    def best(self, top=10, include=(), exclude=(), pc_weight=1.0):
+        """
+        The top compositions that have every agent of include and none of exclude, best first,
+        as a DataFrame with their agents, score, parts and exact games and wins on the map.
+        """
+        include, exclude = self.mask(include), self.mask(exclude)
+        scores = self.scores(pc_weight)
+        eligible = np.flatnonzero(((self.masks & include) == include) & ((self.masks & exclude) == 0))
+        if len(eligible) > top:
+            eligible = eligible[np.argpartition(-scores[eligible], top - 1)[:top]]
+        eligible = eligible[np.argsort(-scores[eligible], kind="stable")]
+        names = np.array(self.agent_names, dtype=object)
+        return pd.DataFrame({"agents": [", ".join(team) for team in names[self.members[eligible]]],
+                             "score": scores[eligible], "win": self.win[eligible], "coverage": self.coverage[eligible],
+                             "games": self.games[eligible], "wins": self.wins[eligible]})
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from cube import AggregateCube
+    from db import create_db_engine
+    from scoring import PcaModel
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--map", required=True, help="map id or name")
+    parser.add_argument("--cube", help="a .npz cube to read instead of the agent_map_stats table")
+    parser.add_argument("--model", default="output/pca.npz")
+    parser.add_argument("--queue", nargs="+", default=PCA_QUEUES)
+    parser.add_argument("--include", nargs="*", default=[], help="agents every composition must have")
+    parser.add_argument("--exclude", nargs="*", default=[], help="agents no composition may have")
+    parser.add_argument("--min-count", type=int, default=30, help="rows an agent needs on the map to be in the pool")
+    parser.add_argument("--pc-weight", type=float, default=1.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_db_engine(os.getenv("DATABASE_URL"))
+    cube = AggregateCube.load(args.cube) if args.cube else AggregateCube.from_db(engine)
+    map_names = cube.names["map_id"]
+    map_id = args.map if args.map in map_names else next((id_ for id_, name in map_names.items() if name == args.map), None)
+    if map_id is None:
+        raise SystemExit(f"Map {args.map!r} is not in the cube")
+    scorer = CompositionScorer.for_map(engine, cube, PcaModel.load(args.model), map_id, queues=args.queue,
+                                       min_count=args.min_count)
+    print(f"{map_names[map_id]}: {len(scorer.agent_ids)} agents, {len(scorer.masks)} compositions, "
+          f"{len(scorer.team_masks)} teams played")
+    print(scorer.best(args.top, include=args.include, exclude=args.exclude, pc_weight=args.pc_weight).to_string())
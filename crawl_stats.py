@@ -0,0 +1,84 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam, case, func, select, update
+from db import insert_for, insert_missing, naive_utc, open_session
+from models import Player, Match, MatchPlayers, PlayerCrawlStats
+
+def _upsert_stats(session, rows, set_):
+    # Sorted by puuid so concurrent writers lock the rows in the same order
+    rows = sorted(rows, key=lambda row: row["puuid"])
+    if not rows:
+        return
+    stmt = insert_for(session)(PlayerCrawlStats.__table__)
+    session.execute(stmt.on_conflict_do_update(index_elements=["puuid"], set_=set_(stmt.excluded)), rows)
+
+def record_player_matches(session, matches, match_players):
+    """
+    Adds newly ingested matches to player_crawl_stats. matches and match_players are the
+    Match and MatchPlayers row dicts just written in session; run it before the commit so
+    the counts and the matches land in the same transaction. Pass only matches whose match
+    row this transaction inserted (db.insert_new): a match another writer stored first
+    would otherwise be counted twice.
+    """
+    started_at = {match["id"]: naive_utc(match["started_at"]) for match in matches}
+    counts = defaultdict(int)
+    last_match_at = {}
+    for row in match_players:
+        puuid = row["player_puuid"]
+        if puuid is None:
+            continue
+        counts[puuid] += 1
+        match_at = started_at.get(row["match_id"])
+        if match_at is not None and (last_match_at.get(puuid) is None or match_at > last_match_at[puuid]):
+            last_match_at[puuid] = match_at
+
+    table = PlayerCrawlStats.__table__
+    _upsert_stats(session, [{"puuid": puuid, "match_count": count, "last_match_at": last_match_at.get(puuid),
+                             "last_crawled_at": None} for puuid, count in counts.items()],
+                  lambda excluded: {
+                      "match_count": table.c.match_count + excluded.match_count,
+                      "last_match_at": case(
+                          (table.c.last_match_at.is_(None) | (excluded.last_match_at > table.c.last_match_at),
+                           excluded.last_match_at),
+                          else_=table.c.last_match_at),
+                  })
+
+def record_player_crawls(session, puuids, crawled_at=None):
+    """
+    Sets last_crawled_at of the players whose match history was just crawled.
+    """
+    if not puuids:
+        return
+    table = PlayerCrawlStats.__table__
+    session.execute(
+        update(table).where(table.c.puuid == bindparam("b_puuid")).values(last_crawled_at=crawled_at or datetime.now()),
+        [{"b_puuid": puuid} for puuid in sorted(set(puuids))]
+    )
+
+def ensure_player_stats(session, puuids):
+    """
+    Gives players that have no matches yet (e.g. straight from a leaderboard) a zero row,
+    so they show up in the match_count range scans.
+    """
+    insert_missing(session, PlayerCrawlStats, [{"puuid": puuid, "match_count": 0} for puuid in set(puuids)])
+
+def backfill_player_crawl_stats(engine):
+    """
+    Fills player_crawl_stats from the existing match_players rows, once, when the table is created.
+    """
+    counts = (
+        select(MatchPlayers.player_puuid.label("puuid"),
+               func.count().label("match_count"),
+               func.max(Match.started_at).label("last_match_at"))
+            .join(Match, Match.id == MatchPlayers.match_id)
+            .group_by(MatchPlayers.player_puuid)
+            .subquery()
+    )
+    query = (
+        select(Player.puuid, func.coalesce(counts.c.match_count, 0), counts.c.last_match_at)
+            .outerjoin(counts, counts.c.puuid == Player.puuid)
+    )
+    with open_session(engine) as session:
+        table = PlayerCrawlStats.__table__
+        session.execute(table.insert().from_select(["puuid", "match_count", "last_match_at"], query))
+        session.commit()
@@ -1,41 +1,99 @@
-from typing import Self
-from sqlmodel import SQLModel, create_engine, Session
-from managers import LeaderboardDataManager, MatchDataManager, AssetsDataManager
+from typing import NamedTuple, Self
+from db import create_db_engine, open_session
+from migrations import migrate
+from managers import LeaderboardDataManager, MatchDataManager, AssetsDataManager, MatchBatchWriter
 import httpx
-from utils import flatten_dict, RateLimitTransport
+from utils import flatten_dict, RateLimitTransport, AsyncRateLimitTransport, KeyScheduler
 from tqdm import tqdm
 import httpx
-import random
-from models import Player, MatchPlayers
-from sqlalchemy import func, select,distinct, text
-from httpcore import PoolTimeout
-from itertools import cycle
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cache import KnownKeysCache, KnownMatchIds
+from frontier import FrontierScheduler, match_started_at, players_with_matches, players_with_fewer_matches, \
+    stream_players_with_fewer_matches
+from archive import ResponseArchive
+from http_cache import HttpCache, CacheTransport, AsyncCacheTransport
+from parsing import parse_matches, make_parse_pool
 from dotenv import load_dotenv
 import os
 
+class PlayerCrawled(NamedTuple):
+    puuid: str
+    pages: int
+    matches: list  # (match id, started_at) of every match on the pages fetched
+    gaps: bool  # a page could not be fetched or saved
+
 class ValorantApiCrawler:
-    def __init__(self) -> Self:
+    def __init__(self, bulk_ingest=False, batch_matches=None, use_copy=False, parse_workers=None, archive_dir=None,
+                 http_cache_dir=None) -> Self:
         load_dotenv()
+        self.bulk_ingest = bulk_ingest or batch_matches is not None or use_copy
+        self.use_copy = use_copy
         self.API_URL = os.getenv("API_URL")
         self.AUTH_KEYS = os.getenv("API_KEYS").split(",")
-        self.engine = create_engine(os.getenv("DATABASE_URL"))
-        
-        SQLModel.metadata.create_all(self.engine)
-        self.key_cycle = cycle(self.AUTH_KEYS)
-        self.client = httpx.Client(base_url=self.API_URL, transport=RateLimitTransport())
+        # One engine for the whole crawler, with a connection kept open for every thread that writes
+        self.engine = create_db_engine(os.getenv("DATABASE_URL"), pool_size=self.db_threads())
 
-    def api_call(self, endpoint, params=None):
-        try:
-            response = self.client.get(endpoint, params=params, timeout=60, headers={"Authorization": next(self.key_cycle)})
-            return response.json()
-        except PoolTimeout as e:
-            print("Pool Timeout, retrying...")
-            self.__init__()
-            return self.api_call(endpoint, params)
+        migrate(self.engine)
+        # Matches already stored are skipped before their payload is parsed; ids are only added once
+        # the transaction that stored them committed
+        self.known_matches = KnownMatchIds(self.engine).warm()
+        # Lookup rows already in the database, so bulk ingestion skips rewriting them
+        self.known_keys = KnownKeysCache().warm(self.engine) if self.bulk_ingest else None
+        # When set, matches are written batch_matches at a time in one transaction
+        self.batch_writer = MatchBatchWriter(self.engine, max_matches=batch_matches, use_copy=use_copy,
+                                             known_keys=self.known_keys,
+                                             known_matches=self.known_matches) if batch_matches else None
+        # Batched crawls can parse pages of matches in worker processes before they reach the writer
+        self.parse_pool = make_parse_pool(parse_workers) if parse_workers and batch_matches else None
+        # Players to crawl live in the crawl_frontier table, so a restarted crawler picks up where it stopped
+        self.frontier = FrontierScheduler(self.engine)
+        self.frontier.recover()
+        # Players crawled since the last flush; marked done once their matches are written
+        self.crawled_players = []
+        # Ids of matches of the current batch of players that could not be written; the players
+        # they came from go back in the queue instead of being marked done
+        self.failed_matches = set()
+        # Raw responses are kept on disk so the database can be rebuilt without crawling again
+        self.archive = ResponseArchive(archive_dir) if archive_dir else None
+        self.key_scheduler = KeyScheduler(self.AUTH_KEYS)
+        # Content and leaderboard responses are served from disk while fresh, ahead of the rate limiter
+        self.http_cache = HttpCache(http_cache_dir) if http_cache_dir else None
+        transport = RateLimitTransport(scheduler=self.key_scheduler)
+        if self.http_cache is not None:
+            transport = CacheTransport(self.http_cache, transport)
+        self.client = httpx.Client(base_url=self.API_URL, transport=transport)
+
+    def db_threads(self):
+        """
+        Number of threads that use the database at the same time.
+        """
+        return 1
+
+    def api_call(self, endpoint, params=None, retries=5):
+        for attempt in range(1, retries+1):
+            try:
+                response = self.client.get(endpoint, params=params, timeout=60)
+                data = response.json()
+                if self.archive is not None and response.is_success:
+                    self.archive.record(endpoint, params, data)
+                return data
+            except httpx.PoolTimeout:
+                if attempt == retries:
+                    raise
+                print(f"Pool Timeout, retrying ({attempt}/{retries})...")
+                time.sleep(min(2 ** attempt, 30))
         
     def sync_assets(self):
         assets_data = self.api_call("valorant/v1/content")
-        AssetsDataManager(engine=self.engine, data=assets_data).save()
+        changed = AssetsDataManager(engine=self.engine, data=assets_data).save()
+        if changed is None:
+            print(f"Assets already at version {assets_data['version']}")
+        else:
+            print(f"Synced assets version {assets_data['version']}: {changed}")
         
     def crawl_leaderboard(self, region, platform):
         print(f"Crawling leaderboard for {region} {platform}")
@@ -49,82 +107,392 @@ class ValorantApiCrawler:
             players.extend(uuids)
         return players
     
-    def crawl_matches_from_player(self, region, platform, player_uuid, num_pages=1, page_size=10):
+    def save_match(self, match):
+        match_manager = MatchDataManager(engine=self.engine, data=match, bulk=self.bulk_ingest,
+                                         use_copy=self.use_copy, known_keys=self.known_keys)
+        if self.batch_writer is not None:
+            # The batch writer adds the id to known_matches once its flush committed
+            self.batch_writer.add(match_manager)
+            return
+        try:
+            match_manager.save()
+        except Exception as e:
+            print(f"An error has ocurred when saving match {match_manager.match_id}: {e}")
+            self.failed_matches.add(match_manager.match_id)
+            return
+        self.known_matches.add(match_manager.match_id)
+
+    def save_matches(self, matches):
+        if self.parse_pool is None:
+            for match in matches:
+                self.save_match(match)
+            return
+        for parsed in parse_matches(matches, executor=self.parse_pool):
+            self.batch_writer.add_parsed(parsed)
+
+    def new_matches(self, matches):
+        """
+        Drops the matches of a page that are already stored, with one lookup for the whole page.
+        """
+        new_ids = set(self.known_matches.filter_new([match['metadata']['match_id'] for match in matches]))
+        return [match for match in matches if match['metadata']['match_id'] in new_ids]
+
+    def finish_player(self, player_uuid, pages, matches=(), gaps=False):
+        """
+        Records a crawled player with the (match id, started_at) of the matches on its pages.
+        Batched crawls only mark it done in the frontier after the next flush, so a crash never
+        marks a player whose matches were not written yet.
+        """
+        self.crawled_players.append(PlayerCrawled(player_uuid, pages, list(matches), gaps))
+        if self.batch_writer is None:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the batched matches and settles the players crawled since the last flush: players
+        with a match that could not be written go back in the queue, the others are marked done.
+        Their high-water mark moves to the newest of their matches, which are all stored by then,
+        unless a page could not be fetched or saved: then the next crawl has to walk back over it.
+        """
+        if self.batch_writer is not None:
+            self.failed_matches.update(self.batch_writer.flush())
+        crawled, self.crawled_players = self.crawled_players, []
+        done = []
+        for player in crawled:
+            if self.failed_matches.intersection(match_id for match_id, _ in player.matches):
+                print(f"Matches of player {player.puuid} could not be written, queueing it again")
+                self.frontier.fail(player.puuid)
+            else:
+                newest = None if player.gaps else self._newest_match(player.matches)
+                done.append((player.puuid, player.pages, *(newest or (None, None))))
+        self.frontier.complete(done)
+
+    def close(self):
+        self.flush()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+        if self.archive is not None:
+            self.archive.close()
+
+    @staticmethod
+    def _newest_match(matches):
+        # The newest of (match id, started_at) pairs, None for none
+        return max(matches, key=lambda match: match[1], default=None)
+
+    @staticmethod
+    def _last_page(matches, fresh, page_size, stop_at, backfill):
+        """
+        Whether paging back through a player's history can stop after this page: it is the end of
+        the history or, unless backfilling, it reached matches ingested before (the player's
+        high-water mark stop_at, or a page with nothing new on it).
+        """
+        if len(matches) < page_size:
+            return True
+        if backfill:
+            return False
+        if not fresh:
+            return True
+        return stop_at is not None and any(match_started_at(match) <= stop_at[1] for match in matches)
+
+    def crawl_matches_from_player(self, region, platform, player_uuid, num_pages=1, page_size=10, backfill=False):
+        """
+        Pages through the player's match history newest first, up to num_pages.
+        Stops at the player's high-water mark unless backfill is set, which walks the full num_pages.
+        Returns the number of pages fetched successfully, the (match id, started_at) of the
+        matches on them and whether a page could not be fetched or saved.
+        """
+        stop_at = self.frontier.high_water_mark(player_uuid)
         # Max page size for api is 10, can fetch up to 80 for activate players, else will result an error
         # for page in (pbar1 := tqdm(range(1, num_pages+1),leave=False)):
+        pages, seen, gaps = 0, [], False
         for page in range(1, num_pages+1):
             # pbar1.set_description(f"Processing {page} of player {player_uuid}")
             try:
                 data = self.api_call(f"/valorant/v4/by-puuid/matches/{region}/{platform}/{player_uuid}",
                                     params={"size": page_size, "start": (page-1)*page_size})
-                for match in data['data']:
-                    match_manager = MatchDataManager(engine=self.engine, data=match)
-                    match_manager.save()
+                matches = data['data']
+                seen.extend((match['metadata']['match_id'], match_started_at(match)) for match in matches)
+                fresh = self.new_matches(matches)
+                self.save_matches(fresh)
+                pages += 1
             except Exception as e:
                 print(f"An error has ocurred when crawling matches with player: {e}")
+                gaps = True
                 continue
+            if self._last_page(matches, fresh, page_size, stop_at, backfill):
+                break
+        return pages, seen, gaps
 
+    def _crawl_players(self, targets, num_pages=1, page_size=10, backfill=False):
+        """
+        Crawls the match history of every (region, platform, puuid) in targets, one player at a time.
+        """
+        try:
+            for region, platform, player_uuid in (pbar := tqdm(targets)):
+                pbar.set_description(f"Processing matches of player {player_uuid}")
+                try:
+                    pages, seen, gaps = self.crawl_matches_from_player(region, platform, player_uuid, num_pages=num_pages,
+                                                                       page_size=page_size, backfill=backfill)
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    print(f"Error: {e}")
+                    pages, seen, gaps = 0, [], True
+                if pages:
+                    self.finish_player(player_uuid, pages, seen, gaps)
+                else:
+                    self.frontier.fail(player_uuid)
+        finally:
+            self.flush()
+            self.failed_matches.clear()
 
-    def crawl_matches_from_leaderboard(self, region, platform, limit=50):
+    def _seed_frontier_from_leaderboard(self, region, platform):
         players = self.crawl_leaderboard(region, platform)
 
-        # Get the total number of matches present in the database
-        with Session(self.engine) as session:
-            query = (
-                session.exec(
-                        select(Player.puuid)
-                            .outerjoin(MatchPlayers, Player.puuid == MatchPlayers.player_puuid)
-                            .group_by(Player.puuid)
-                            .having(func.count(MatchPlayers.match_id) >= 10)
-                    )
-            )
-            players_to_exclude = [row[0] for row in query.all()]
-
-        players = list(set(players) - set(players_to_exclude))
-        players = random.choices(players, k=min(limit, len(players)))
-        
-        for player_uuid in (pbar := tqdm(players)):
-            pbar.set_description(f"Processing matches of player {player_uuid}")
+        # Leaderboard players that already have enough matches stored are not queued
+        with open_session(self.engine) as session:
+            players_to_exclude = players_with_matches(session, 10, puuids=set(players))
+
+        players = set(players) - set(players_to_exclude)
+        self.frontier.add([(region, platform, player_uuid) for player_uuid in players])
+
+    def _select_leaderboard_players(self, region, platform, limit=50):
+        # The leaderboard is only fetched again once every player queued from it has been crawled
+        if not self.frontier.has_pending(region, platform):
+            self._seed_frontier_from_leaderboard(region, platform)
+        return self.frontier.claim(limit, region=region, platform=platform)
+
+    def _select_players_less_than_n_matches(self, num_matches=10, limit=50):
+        with open_session(self.engine) as session:
+            return players_with_fewer_matches(session, num_matches, limit)
+
+    def crawl_matches_from_leaderboard(self, region, platform, limit=50, num_pages=1, backfill=False):
+        targets = self._select_leaderboard_players(region, platform, limit=limit)
+        self._crawl_players(targets, num_pages=num_pages, backfill=backfill)
+
+    def _queue_players_less_than_n_matches(self, num_matches, crawled_before, max_players, chunk_size=1000):
+        """
+        Streams up to max_players players with fewer than num_matches matches, fewest first, into
+        the frontier chunk_size at a time. Returns the number of players queued.
+        """
+        queued = 0
+        with open_session(self.engine) as session:
+            for targets in stream_players_with_fewer_matches(session, num_matches, crawled_before, chunk_size=chunk_size):
+                targets = targets[:max_players - queued]
+                self.frontier.add(targets, requeue=True)
+                queued += len(targets)
+                if queued >= max_players:
+                    break
+        return queued
+
+    def _stop_reason(self, started_at, requests_at_start, max_wall_time, max_requests):
+        if max_wall_time is not None and time.monotonic() - started_at >= max_wall_time.total_seconds():
+            return f"wall time of {max_wall_time} reached"
+        if max_requests is not None and self.key_scheduler.requests_sent() - requests_at_start >= max_requests:
+            return f"{max_requests} API requests spent"
+        return None
+
+    def crawl_matches_from_players_less_than_n_matches(self, num_matches=10, limit=50, recursive=False,
+                                                        max_wall_time=None, max_requests=None,
+                                                        recrawl_after=timedelta(days=1), refill_size=10_000):
+        """
+        Crawls players with fewer than num_matches stored matches, limit players per batch.
+
+        Without recursive, crawls a single batch. With recursive, keeps claiming batches from the
+        frontier and refills it from player_crawl_stats (refill_size players at a time, streamed)
+        whenever it runs dry. Stale claims are recovered before every batch, so players left
+        in_progress by a crashed crawler are crawled again during a long run. It stops once no
+        player under num_matches is left that was not crawled in the last recrawl_after, after
+        max_wall_time (a timedelta) or once max_requests API requests were sent, whichever comes
+        first; the batch in flight is always finished. Returns why it stopped.
+        """
+        if not recursive:
+            self.frontier.add(self._select_players_less_than_n_matches(num_matches=num_matches, limit=limit), requeue=True)
+            self._crawl_players(self.frontier.claim(limit), num_pages=1, page_size=10)
+            return "single batch crawled"
+
+        started_at = time.monotonic()
+        requests_at_start = self.key_scheduler.requests_sent()
+        while (reason := self._stop_reason(started_at, requests_at_start, max_wall_time, max_requests)) is None:
+            # Players claimed by a crawler that died since start-up go back in the queue once their claim is stale
+            self.frontier.recover()
+            targets = self.frontier.claim(limit)
+            if not targets:
+                if not self._queue_players_less_than_n_matches(num_matches, datetime.now() - recrawl_after, refill_size):
+                    reason = f"no players with fewer than {num_matches} matches left to crawl"
+                    break
+                continue
+            self._crawl_players(targets, num_pages=1, page_size=10)
+        print(f"Stopped crawling players with fewer than {num_matches} matches: {reason}")
+        return reason
+
+class AsyncValorantApiCrawler(ValorantApiCrawler):
+    """
+    Asyncio variant of the crawler built on httpx.AsyncClient.
+
+    Runs one worker lane per API key (times workers_per_key), so the number of requests in
+    flight grows with the number of keys in API_KEYS. The lanes share the crawler's KeyScheduler,
+    which sends every request to the key with the most remaining budget.
+    Fetched matches go through a bounded queue to a single writer, so slow DB writes
+    apply backpressure to the lanes instead of piling up in memory.
+    """
+    def __init__(self, bulk_ingest=False, batch_matches=None, use_copy=False, parse_workers=None, archive_dir=None,
+                 http_cache_dir=None, workers_per_key=1, queue_size=32) -> Self:
+        self.workers_per_key = workers_per_key
+        self.queue_size = queue_size
+        # Ids of matches queued for the writer but not saved yet; lanes sharing a match queue it once
+        self.pending_matches = set()
+        self._pending_lock = threading.Lock()
+        super().__init__(bulk_ingest=bulk_ingest, batch_matches=batch_matches, use_copy=use_copy,
+                         parse_workers=parse_workers, archive_dir=archive_dir, http_cache_dir=http_cache_dir)
+
+    @property
+    def lanes_count(self):
+        return len(self.AUTH_KEYS) * self.workers_per_key
+
+    def db_threads(self):
+        # Every lane can be in a lookup thread while the writer thread saves a batch
+        return self.lanes_count + 1
+
+    def _make_async_client(self):
+        transport = AsyncRateLimitTransport(scheduler=self.key_scheduler)
+        if self.http_cache is not None:
+            transport = AsyncCacheTransport(self.http_cache, transport)
+        return httpx.AsyncClient(base_url=self.API_URL, transport=transport, timeout=60)
+
+    async def async_api_call(self, client, endpoint, params=None):
+        response = await client.get(endpoint, params=params)
+        data = response.json()
+        if self.archive is not None and response.is_success:
+            await asyncio.to_thread(self.archive.record, endpoint, params, data)
+        return data
+
+    def new_matches(self, matches):
+        """
+        Drops the matches of a page that are stored, already queued by another lane or waiting in
+        the batch writer for its next flush, and marks the rest as queued.
+        """
+        fresh = super().new_matches(matches)
+        if self.batch_writer is not None:
+            fresh = [match for match in fresh if match['metadata']['match_id'] not in self.batch_writer]
+        with self._pending_lock:
+            fresh = [match for match in fresh if match['metadata']['match_id'] not in self.pending_matches]
+            self.pending_matches.update(match['metadata']['match_id'] for match in fresh)
+        return fresh
+
+    async def _lane(self, client, player_queue, match_queue, pbar, num_pages, page_size, backfill):
+        while True:
+            target = await player_queue.get()
+            if target is None:
+                break
+            region, platform, player_uuid = target
+            stop_at = await asyncio.to_thread(self.frontier.high_water_mark, player_uuid)
+            pages, seen, gaps = 0, [], False
+            for page in range(1, num_pages+1):
+                try:
+                    data = await self.async_api_call(client, f"/valorant/v4/by-puuid/matches/{region}/{platform}/{player_uuid}",
+                                                     params={"size": page_size, "start": (page-1)*page_size})
+                    matches = data['data']
+                    seen.extend((match['metadata']['match_id'], match_started_at(match)) for match in matches)
+                    fresh = await asyncio.to_thread(self.new_matches, matches)
+                    for match in fresh:
+                        await match_queue.put(match)
+                    pages += 1
+                except Exception as e:
+                    print(f"An error has ocurred when crawling matches with player: {e}")
+                    gaps = True
+                    continue
+                if self._last_page(matches, fresh, page_size, stop_at, backfill):
+                    break
+            if pages:
+                # Queued behind the player's matches, so the writer records the player after saving them
+                await match_queue.put(PlayerCrawled(player_uuid, pages, seen, gaps))
+            else:
+                await asyncio.to_thread(self.frontier.fail, player_uuid)
+            pbar.update(1)
+
+    async def _writer(self, match_queue):
+        while True:
+            # Take whatever has queued up so a parse pool gets several matches at once
+            matches = [await match_queue.get()]
+            while not match_queue.empty():
+                matches.append(match_queue.get_nowait())
+            done = None in matches
+            crawled = [item for item in matches if isinstance(item, PlayerCrawled)]
+            matches = [item for item in matches if item is not None and not isinstance(item, PlayerCrawled)]
             try:
-                self.crawl_matches_from_player(region, platform, player_uuid)
-            
+                await asyncio.to_thread(self.save_matches, matches)
             except Exception as e:
-                import traceback
-                traceback.print_exc()
-                print(f"Error: {e}")
-                continue
+                # The players these matches came from are queued again by the flush
+                print(f"An error has ocurred when saving matches: {e}")
+                self.failed_matches.update(match['metadata']['match_id'] for match in matches)
+            finally:
+                # Saved matches are in known_matches now and batched ones are held by the batch writer
+                # until their flush commits; failed ones may be queued again
+                with self._pending_lock:
+                    self.pending_matches.difference_update(match['metadata']['match_id'] for match in matches)
+            # Settled by the flush after the lanes are done, once every match they queued was saved or
+            # failed, including matches of the player another lane queued
+            self.crawled_players.extend(crawled)
+            if done:
+                break
 
-    def crawl_matches_from_players_less_than_n_matches(self, num_matches=10, limit=50, recursive=False):
-        with Session(self.engine) as session:
-            query = (
-                session.exec(
-                    text(
-                        f"""
-                        SELECT player.puuid, 
-                            player.primary_platform, 
-                            player.primary_region, 
-                            COUNT(DISTINCT(match_players.match_id)) AS match_count
-                        FROM player
-                        LEFT JOIN match_players ON player.puuid = match_players.player_puuid
-                        WHERE player.primary_platform IS NOT NULL AND player.primary_region IS NOT NULL
-                        GROUP BY player.puuid
-                        HAVING COUNT(match_id) < {num_matches}
-                        ORDER BY match_count ASC
-                        LIMIT {limit}
-                        """
-                    )        
-                )
-            )
-            for puuid, platform, region, _ in (pbar := tqdm(query.all())):
-                pbar.set_description(f"Processing player {puuid} with {num_matches} current matches")
-                self.crawl_matches_from_player(region, platform, puuid, num_pages=1, page_size=10)
-        
-        if recursive:
-            self.crawl_matches_from_players_less_than_n_matches(num_matches=num_matches, limit=limit, recursive=recursive)
+    async def _crawl_players_async(self, targets, num_pages=1, page_size=10, backfill=False):
+        player_queue = asyncio.Queue()
+        match_queue = asyncio.Queue(maxsize=self.queue_size)
+        client = self._make_async_client()
+        lanes_count = self.lanes_count
+        # DB work runs in to_thread; give it exactly as many threads as the pool has connections
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.db_threads()))
+
+        for target in targets:
+            player_queue.put_nowait(target)
+        for _ in range(lanes_count):
+            player_queue.put_nowait(None)
+
+        with tqdm(total=len(targets), desc="Processing matches of players") as pbar:
+            writer = asyncio.create_task(self._writer(match_queue))
+            try:
+                lanes = [asyncio.create_task(self._lane(client, player_queue, match_queue, pbar, num_pages, page_size, backfill))
+                         for _ in range(lanes_count)]
+                await asyncio.gather(*lanes)
+            finally:
+                await match_queue.put(None)
+                await writer
+                await asyncio.to_thread(self.flush)
+                self.failed_matches.clear()
+                await client.aclose()
+
+    def _crawl_players(self, targets, num_pages=1, page_size=10, backfill=False):
+        asyncio.run(self._crawl_players_async(targets, num_pages=num_pages, page_size=page_size, backfill=backfill))
 
 if __name__ == "__main__":
-    crawler = ValorantApiCrawler()
+    load_dotenv()
+    bulk_ingest = os.getenv("BULK_INGEST", "").lower() in ("1", "true")
+    batch_matches = int(os.getenv("BATCH_MATCHES")) if os.getenv("BATCH_MATCHES") else None
+    use_copy = os.getenv("COPY_EVENTS", "").lower() in ("1", "true")
+    parse_workers = int(os.getenv("PARSE_WORKERS")) if os.getenv("PARSE_WORKERS") else None
+    # Pages of history per player; with CRAWL_BACKFILL the crawl keeps paging past already ingested matches
+    num_pages = int(os.getenv("CRAWL_PAGES", "1"))
+    backfill = os.getenv("CRAWL_BACKFILL", "").lower() in ("1", "true")
+    # Optional limits of the crawl of players with few matches: hours of wall time and API requests
+    max_wall_time = timedelta(hours=float(os.getenv("CRAWL_MAX_HOURS"))) if os.getenv("CRAWL_MAX_HOURS") else None
+    max_requests = int(os.getenv("CRAWL_MAX_REQUESTS")) if os.getenv("CRAWL_MAX_REQUESTS") else None
+    options = dict(bulk_ingest=bulk_ingest, batch_matches=batch_matches, use_copy=use_copy, parse_workers=parse_workers,
+                   archive_dir=os.getenv("ARCHIVE_DIR"), http_cache_dir=os.getenv("HTTP_CACHE_DIR"))
+    if os.getenv("CRAWLER_MODE") == "async":
+        crawler = AsyncValorantApiCrawler(**options)
+    else:
+        crawler = ValorantApiCrawler(**options)
     crawler.sync_assets()
     for region in ["na", "eu", "ap", "kr", "latam"]:
-        crawler.crawl_matches_from_leaderboard(region, "pc")
-    crawler.crawl_matches_from_players_less_than_n_matches(num_matches=10, limit=50, recursive=True)
\ No newline at end of file
+        crawler.crawl_matches_from_leaderboard(region, "pc", num_pages=num_pages, backfill=backfill)
+    try:
+        crawler.crawl_matches_from_players_less_than_n_matches(num_matches=10, limit=50, recursive=True,
+                                                               max_wall_time=max_wall_time, max_requests=max_requests)
+    finally:
+        crawler.close()
+        crawler.key_scheduler.report()
+        if crawler.http_cache is not None:
+            crawler.http_cache.report()
+        print(f"Crawl frontier: {crawler.frontier.counts()}")
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""
+Agent x map performance cube: running statistics of the feature rows per (agent_id, map_id,
+queue_id, tier bucket) cell. Rankings and recommendations read the cells, which is
+O(agents x maps) however many matches are stored, instead of scanning the matches or the dataset.
+
+The cells live in the agent_map_stats table and ingestion keeps them current: the managers call
+record_match_cells in the transaction that writes a match, as crawl_stats.record_player_matches
+does for the player counters, so a match is counted once it is stored and never twice. The
+migration that creates the table backfills it from the matches already stored.
+
+A cube can also be kept as a .npz snapshot of an exported dataset, folded forward with the files
+each export adds (`python export.py` does so unless given --no-cube, `python cube.py update` on a
+dataset exported some other way); both hold the same cells for the same matches.
+
+Every cell holds the count, mean and scatter matrix (sum of outer products of deviations from the
+mean) of its feature rows. Sums and sums of squares follow from them, and since the component
+scores are an affine map of the features, so do the mean and spread of the scores of any PcaModel,
+without reading the matches again after a refit.
+
+    python cube.py rank --model output/pca.npz --component "Combat Prowess" --by agent_id map_id
+    python cube.py rank --cube output/cube.npz --model output/pca.npz --component "Combat Prowess"
+    python cube.py update --dataset output/dataset --cube output/cube.npz
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, select, tuple_, update
+from db import create_db_engine, insert_missing, open_session
+from models import Agent, AgentMapStats, Map, Match
+from scoring import FEATURE_COLUMNS, PCA_QUEUES, PcaModel, feature_matrix, fold_new_files, merge_moments
+
+DIMENSIONS = ["agent_id", "map_id", "queue_id", "tier_bucket"]
+
+# Rank families of the competitive tiers: 0-2 unranked, three tiers per family, 27 is Radiant
+TIER_BUCKETS = ["Unranked", "Iron", "Bronze", "Silver", "Gold", "Platinum", "Diamond", "Ascendant", "Immortal", "Radiant"]
+
+# Display names kept for the id dimensions
+NAME_COLUMNS = {"agent_id": "agent_name", "map_id": "map_name"}
+
+def tier_buckets(tier_ids):
+    """
+    The TIER_BUCKETS name of every tier id; missing tiers count as unranked.
+    """
+    tiers = np.nan_to_num(np.asarray(tier_ids, dtype=np.float64), nan=0)
+    return np.array(TIER_BUCKETS, dtype=object)[np.clip((tiers - 3) // 3 + 1, 0, len(TIER_BUCKETS) - 1).astype(int)]
+
+class AggregateCube:
+    """
+    Count, mean and scatter matrix of feature_names per DIMENSIONS cell. Batches are merged into
+    their cells with scoring.merge_moments, so the statistics equal those of one pass over all
+    rows. Rows with a missing feature, agent or map are skipped, as the notebooks drop them.
+    fold_dataset reads the dataset through scoring.fold_new_files, so only files exported since
+    the last call are read.
+    """
+    def __init__(self, feature_names=FEATURE_COLUMNS):
+        self.feature_names = list(feature_names)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets every cell and file folded in so far.
+        """
+        self.keys = []
+        self.names = {dimension: {} for dimension in NAME_COLUMNS}
+        self.files = set()
+        self._cells = {}
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        # Cell arrays with room for capacity cells, keeping the cells stored so far
+        n_features, size = len(self.feature_names), len(self.keys)
+        count, mean, scatter = (np.zeros(capacity, dtype=np.int64), np.zeros((capacity, n_features)),
+                                np.zeros((capacity, n_features, n_features)))
+        if size:
+            count[:size], mean[:size], scatter[:size] = self.count, self.mean, self.scatter
+        self._count, self._mean, self._scatter = count, mean, scatter
+
+    @property
+    def count(self):
+        return self._count[:len(self.keys)]
+
+    @property
+    def mean(self):
+        return self._mean[:len(self.keys)]
+
+    @property
+    def scatter(self):
+        return self._scatter[:len(self.keys)]
+
+    def _rows(self, keys):
+        # Cell rows of keys, adding empty cells for keys not seen before
+        new = [key for key in keys if key not in self._cells]
+        if len(self.keys) + len(new) > len(self._count):
+            self._allocate(max(2 * len(self._count), len(self.keys) + len(new), 256))
+        self._cells.update((key, len(self.keys) + i) for i, key in enumerate(new))
+        self.keys.extend(new)
+        return np.array([self._cells[key] for key in keys], dtype=np.intp)
+
+    def _fold(self, features, dimensions, names):
+        complete = ~np.isnan(features).any(axis=1) & pd.notna(dimensions["agent_id"]) & pd.notna(dimensions["map_id"])
+        if not complete.any():
+            return
+        # One integer per row for its cell, from the codes of each dimension within the batch
+        codes, uniques = [], []
+        for dimension in DIMENSIONS:
+            dimension_codes, dimension_uniques = pd.factorize(dimensions[dimension][complete])
+            codes.append(dimension_codes)
+            uniques.append(dimension_uniques)
+        for dimension, column in NAME_COLUMNS.items():
+            position = DIMENSIONS.index(dimension)
+            for code, value in enumerate(uniques[position]):
+                if str(value) not in self.names[dimension]:
+                    self.names[dimension][str(value)] = str(names[column][complete][np.argmax(codes[position] == code)])
+        combined = np.ravel_multi_index(codes, [len(values) for values in uniques])
+        cells, inverse, count = np.unique(combined, return_inverse=True, return_counts=True)
+        keys = [tuple(str(values[code]) for values, code in zip(uniques, cell_codes))
+                for cell_codes in zip(*np.unravel_index(cells, [len(values) for values in uniques]))]
+
+        features = features[complete][np.argsort(inverse, kind="stable")]
+        bounds = np.concatenate([[0], np.cumsum(count)])
+        mean = np.add.reduceat(features, bounds[:-1], axis=0) / count[:, None]
+        scatter = np.empty((len(cells), features.shape[1], features.shape[1]))
+        for cell, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            deviations = features[start:stop] - mean[cell]
+            scatter[cell] = deviations.T @ deviations
+
+        rows = self._rows(keys)
+        self._count[rows], self._mean[rows], self._scatter[rows] = merge_moments(
+            self._count[rows], self._mean[rows], self._scatter[rows], count, mean, scatter)
+
+    def update(self, frame):
+        """
+        Folds in a DataFrame of feature rows with their agent, map, queue and tier_id.
+        """
+        dimensions = {dimension: frame[dimension].astype(object).to_numpy() for dimension in DIMENSIONS[:3]}
+        dimensions["tier_bucket"] = tier_buckets(frame["tier_id"].to_numpy(dtype=np.float64, na_value=np.nan))
+        names = {column: frame[column].astype(object).to_numpy() for column in NAME_COLUMNS.values()}
+        self._fold(feature_matrix(frame, self.feature_names), dimensions, names)
+
+    def fold_dataset(self, output_dir, batch_size=65_536):
+        """
+        Folds in the dataset files of output_dir (written by export.py) not read before,
+        batch_size rows at a time. Returns the number of files read.
+        """
+        columns = list(dict.fromkeys(self.feature_names + DIMENSIONS[:3] + list(NAME_COLUMNS.values()) + ["tier_id"]))
+
+        def fold(values):
+            features = np.column_stack([values[name].astype(np.float64) for name in self.feature_names])
+            dimensions = {dimension: values[dimension] for dimension in DIMENSIONS[:3]}
+            dimensions["tier_bucket"] = tier_buckets(values["tier_id"].astype(np.float64))
+            self._fold(features, dimensions, values)
+
+        return fold_new_files(self, output_dir, columns, fold, batch_size=batch_size)
+
+    def sums(self):
+        """
+        Sum of every feature per cell, a (cells, features) array.
+        """
+        return self.mean * self.count[:, None]
+
+    def sums_of_squares(self):
+        """
+        Sum of the squares of every feature per cell, a (cells, features) array.
+        """
+        return self.scatter.diagonal(axis1=1, axis2=2) + self.mean ** 2 * self.count[:, None]
+
+    def table(self, by=("agent_id",), model=None, agents=None, maps=None, queues=PCA_QUEUES, tiers=None):
+        """
+        The cells matching the filters merged per combination of the by dimensions, as a DataFrame
+        with the row count and feature means, and with a model, the mean and standard deviation of
+        each of its component scores. Filters take lists of agent ids, map ids, queues and
+        TIER_BUCKETS names; None keeps everything. Defaults to the queues the PCA is fitted on.
+        """
+        by = list(by)
+        keys = pd.DataFrame(self.keys, columns=DIMENSIONS) if self.keys else pd.DataFrame(columns=DIMENSIONS)
+        selected = np.ones(len(keys), dtype=bool)
+        for dimension, values in zip(DIMENSIONS, (agents, maps, queues, tiers)):
+            if values is not None:
+                selected &= keys[dimension].isin(values).to_numpy()
+        groups = keys[selected].groupby(by, sort=True).indices
+        rows = np.flatnonzero(selected)
+        if model is not None:
+            # Positions of the model's features among the cube's
+            features = [self.feature_names.index(name) for name in model.feature_names]
+
+        records = []
+        for group, positions in groups.items():
+            cells = rows[positions]
+            count = self.count[cells]
+            total = count.sum()
+            mean = count @ self.mean[cells] / total
+            record = dict(zip(by, group if isinstance(group, tuple) else (group,)), count=total,
+                          **dict(zip(self.feature_names, mean)))
+            if model is not None:
+                deviations = self.mean[cells][:, features] - mean[features]
+                scatter = self.scatter[cells].sum(axis=0)[np.ix_(features, features)] + (deviations.T * count) @ deviations
+                variance = np.einsum("ik,ij,jk->k", model.weights, scatter, model.weights) / max(total - 1, 1)
+                record.update(zip(model.component_names, mean[features] @ model.weights + model.offset))
+                record.update(zip([f"{name} std" for name in model.component_names], np.sqrt(variance)))
+            records.append(record)
+        table = pd.DataFrame(records, columns=by + ["count"] + self.feature_names + (
+            model.component_names + [f"{name} std" for name in model.component_names] if model is not None else []))
+        table = table.set_index(by)
+        for dimension, column in NAME_COLUMNS.items():
+            if dimension in by:
+                table.insert(0, column, table.index.get_level_values(dimension).map(self.names[dimension]))
+        return table
+
+    def rank(self, model, component, by=("agent_id",), min_count=1, **filters):
+        """
+        table() sorted by the mean score of component, highest first, leaving out groups with
+        fewer than min_count rows.
+        """
+        table = self.table(by=by, model=model, **filters)
+        return table[table["count"] >= min_count].sort_values(component, ascending=False)
+
+    def save(self, path):
+        # Scatter matrices are symmetric; only their upper triangles are stored
+        upper = np.triu_indices(len(self.feature_names))
+        np.savez(path, feature_names=np.array(self.feature_names),
+                 keys=np.array(self.keys, dtype=str).reshape(-1, len(DIMENSIONS)),
+                 count=self.count, mean=self.mean, scatter=self.scatter[:, upper[0], upper[1]],
+                 files=np.array(sorted(self.files), dtype=str),
+                 **{f"names_{dimension}": np.array(sorted(names.items()), dtype=str).reshape(-1, 2)
+                    for dimension, names in self.names.items()})
+
+    @classmethod
+    def from_db(cls, engine):
+        """
+        The cube of the agent_map_stats table, which ingestion keeps up to date (record_match_cells).
+        """
+        table = AgentMapStats.__table__
+        with open_session(engine) as session:
+            rows = session.execute(select(table).order_by(*(table.c[dimension] for dimension in DIMENSIONS))).all()
+            agents = dict(session.execute(select(Agent.id, Agent.name)).all())
+            maps = dict(session.execute(select(Map.id, Map.name)).all())
+        cube = cls()
+        cube.keys = [tuple(getattr(row, dimension) for dimension in DIMENSIONS) for row in rows]
+        cube._cells = {key: i for i, key in enumerate(cube.keys)}
+        cube._count, cube._mean, cube._scatter = _decode_cells(rows, len(cube.feature_names))
+        cube.names = {"agent_id": {row.agent_id: str(agents.get(row.agent_id)) for row in rows},
+                      "map_id": {row.map_id: str(maps.get(row.map_id)) for row in rows}}
+        return cube
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            cube = cls(state["feature_names"].tolist())
+            cube.keys = [tuple(key) for key in state["keys"].tolist()]
+            cube._cells = {key: i for i, key in enumerate(cube.keys)}
+            cube._count, cube._mean = state["count"], state["mean"]
+            upper = np.triu_indices(len(cube.feature_names))
+            cube._scatter = np.empty((len(cube.keys), len(cube.feature_names), len(cube.feature_names)))
+            cube._scatter[:, upper[0], upper[1]] = state["scatter"]
+            cube._scatter[:, upper[1], upper[0]] = state["scatter"]
+            cube.names = {dimension: dict(state[f"names_{dimension}"].tolist()) for dimension in NAME_COLUMNS}
+            cube.files = set(state["files"].tolist())
+        return cube
+
+def _decode_cells(rows, n_features):
+    # count, mean and scatter arrays of agent_map_stats rows
+    upper = np.triu_indices(n_features)
+    count = np.array([row.count for row in rows], dtype=np.int64)
+    mean = np.array([np.frombuffer(row.mean, dtype="<f8") for row in rows]).reshape(len(rows), n_features)
+    scatter = np.empty((len(rows), n_features, n_features))
+    scatter[:, upper[0], upper[1]] = np.array([np.frombuffer(row.scatter, dtype="<f8") for row in rows]).reshape(len(rows), -1)
+    scatter[:, upper[1], upper[0]] = scatter[:, upper[0], upper[1]]
+    return count, mean, scatter
+
+def record_match_cells(session, match_ids):
+    """
+    Folds the feature rows of newly ingested matches into agent_map_stats. Like
+    crawl_stats.record_player_matches, run it in the ingest transaction, after the rows of
+    match_ids were written and before the commit, and only for matches this transaction inserted.
+    The rows are read back with export.feature_query in the dtypes of the exported dataset, so
+    the cells equal those an AggregateCube folds from an export of the same matches.
+    """
+    from export import compact_dtypes, feature_query
+    from features import add_derived_features
+
+    if not match_ids:
+        return
+    batch = AggregateCube()
+    batch.update(compact_dtypes(add_derived_features(pd.read_sql(feature_query(list(match_ids)), session.connection()))))
+    if not batch.keys:
+        return
+    order = sorted(range(len(batch.keys)), key=batch.keys.__getitem__)
+    keys = [batch.keys[i] for i in order]
+    n_features = len(batch.feature_names)
+    upper = np.triu_indices(n_features)
+    table = AgentMapStats.__table__
+    key_columns = [table.c[dimension] for dimension in DIMENSIONS]
+
+    # Empty cells are created first, so concurrent writers then lock the same rows, in key order
+    insert_missing(session, AgentMapStats, [dict(zip(DIMENSIONS, key), count=0, mean=np.zeros(n_features).tobytes(),
+                                                 scatter=np.zeros(len(upper[0])).tobytes()) for key in keys])
+    rows = session.execute(select(table).where(tuple_(*key_columns).in_(keys)).order_by(*key_columns).with_for_update()).all()
+    # The database's collation may order the rows differently from keys
+    rows = {tuple(getattr(row, dimension) for dimension in DIMENSIONS): row for row in rows}
+    rows = [rows[key] for key in keys]
+    count, mean, scatter = merge_moments(*_decode_cells(rows, n_features), batch.count[order], batch.mean[order],
+                                         batch.scatter[order])
+    session.execute(
+        update(table)
+            .where(*(column == bindparam(f"b_{column.name}") for column in key_columns))
+            .values(count=bindparam("b_count"), mean=bindparam("b_mean"), scatter=bindparam("b_scatter")),
+        [{**{f"b_{dimension}": value for dimension, value in zip(DIMENSIONS, key)}, "b_count": int(count[i]),
+          "b_mean": mean[i].astype("<f8").tobytes(), "b_scatter": scatter[i][upper].astype("<f8").tobytes()}
+         for i, key in enumerate(keys)]
+    )
+
+def backfill_agent_map_stats(engine, chunk_matches=5_000):
+    """
+    Fills agent_map_stats from the matches that are already stored, once, when the table is created.
+    """
+    after = ""
+    with open_session(engine) as session:
+        while match_ids := session.execute(select(Match.id).where(Match.id > after).order_by(Match.id)
+                                           .limit(chunk_matches)).scalars().all():
+            record_match_cells(session, match_ids)
+            after = match_ids[-1]
+        session.commit()
+
+def update_cube(cube_path, output_dir, rebuild=False):
+    """
+    Folds the files of the dataset in output_dir not read yet into the cube at cube_path, creating
+    it if missing (or starting over with rebuild), and saves it. Returns the cube and the number
+    of files read.
+    """
+    if rebuild and os.path.exists(cube_path):
+        os.remove(cube_path)
+    cube = AggregateCube.load(cube_path) if os.path.exists(cube_path) else AggregateCube()
+    files = cube.fold_dataset(output_dir)
+    cube.save(cube_path)
+    return cube, files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="fold the files exported since the last update into the cube")
+    update_parser.add_argument("--dataset", default="output/dataset")
+    update_parser.add_argument("--cube", default="output/cube.npz")
+    rank_parser = subparsers.add_parser("rank", help="rank agents, maps or agent-map pairs by a component")
+    rank_parser.add_argument("--cube", help="a .npz cube to read instead of the agent_map_stats table")
+    rank_parser.add_argument("--model", default="output/pca.npz")
+    rank_parser.add_argument("--component", required=True)
+    rank_parser.add_argument("--by", nargs="+", default=["agent_id"], choices=DIMENSIONS)
+    rank_parser.add_argument("--queue", nargs="+", default=PCA_QUEUES)
+    rank_parser.add_argument("--tier", nargs="+", choices=TIER_BUCKETS)
+    rank_parser.add_argument("--min-count", type=int, default=30)
+    rank_parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "update":
+        cube, files = update_cube(args.cube, args.dataset)
+        print(f"Folded in {files} new files; {len(cube.keys)} cells over {cube.count.sum()} rows, saved to {args.cube}")
+    else:
+        if args.cube:
+            cube = AggregateCube.load(args.cube)
+        else:
+            from dotenv import load_dotenv
+            load_dotenv()
+            cube = AggregateCube.from_db(create_db_engine(os.getenv("DATABASE_URL")))
+        ranking = cube.rank(PcaModel.load(args.model), args.component, by=args.by, min_count=args.min_count,
+                            queues=args.queue, tiers=args.tier)
+        columns = [column for column in NAME_COLUMNS.values() if column in ranking.columns]
+        print(ranking[columns + ["count", args.component, f"{args.component} std"]].head(args.top).to_string())
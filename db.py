@@ -0,0 +1,196 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+import os
+from pydantic_core import PydanticUndefined
+from sqlalchemy import DateTime, create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Compiled statements kept per engine; ingestion alone uses a few per table and dialect
+QUERY_CACHE_SIZE = 1200
+
+def create_db_engine(url=None, pool_size=5, max_overflow=None):
+    """
+    Builds the one engine the crawler, managers and caches share. The pool keeps pool_size
+    connections open, so it should match the number of threads that use the database at the
+    same time; max_overflow (pool_size by default) only covers short bursts, since overflow
+    connections are closed when returned. Connections are checked with a pre-ping before use
+    and recycled hourly, so a server-side timeout never reaches a query.
+    """
+    url = make_url(url or os.getenv("DATABASE_URL"))
+    options = dict(pool_pre_ping=True, query_cache_size=QUERY_CACHE_SIZE)
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options.update(pool_size=pool_size, max_overflow=pool_size if max_overflow is None else max_overflow,
+                       pool_recycle=3600, pool_use_lifo=True, pool_timeout=60)
+    return create_engine(url, **options)
+
+@lru_cache(maxsize=None)
+def session_factory(engine):
+    # Objects stay usable after commit instead of being reloaded on next access
+    return sessionmaker(engine, class_=Session, expire_on_commit=False)
+
+def open_session(engine):
+    """
+    A session on the shared engine's pool; use it as a context manager like Session(engine).
+    """
+    return session_factory(engine)()
+
+@lru_cache(maxsize=None)
+def _model_columns(model):
+    columns = {}
+    for name in model.__table__.columns.keys():
+        field = model.model_fields.get(name)
+        default = field.default if field is not None else PydanticUndefined
+        columns[name] = default
+    return columns
+
+@lru_cache(maxsize=None)
+def _datetime_columns(model):
+    return frozenset(column.name for column in model.__table__.columns if isinstance(column.type, DateTime))
+
+def naive_utc(value):
+    """
+    A datetime (or ISO string) as naive UTC, the way timestamps are stored and compared.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def model_row(model, values):
+    """
+    Builds a plain row dict for the table of model, the same way the model constructor would:
+    keys that are not columns are dropped and missing fields fall back to their declared default.
+    ISO timestamps from the API are turned into datetimes, which every dialect accepts.
+    """
+    row = {}
+    for name, default in _model_columns(model).items():
+        if name in values:
+            row[name] = values[name]
+        elif default is not PydanticUndefined:
+            row[name] = default
+    for name in _datetime_columns(model):
+        if isinstance(row.get(name), str):
+            row[name] = datetime.fromisoformat(row[name])
+    return row
+
+def _dedupe(table, rows):
+    primary_key = [column.name for column in table.primary_key.columns]
+    return list({tuple(row.get(k) for k in primary_key): row for row in rows}.values())
+
+def insert_for(session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+def upsert(session, model, rows):
+    """
+    Writes rows into the table of model with one multi-row INSERT ... ON CONFLICT DO UPDATE
+    per distinct set of columns; SQLAlchemy pages very large batches into several VALUES lists.
+    Rows sharing a primary key keep the last one, which is what repeated session.merge calls
+    would leave behind. Tables keyed by an autoincrement id are plain inserts.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    insert = insert_for(session)
+    primary_key = [column.name for column in table.primary_key.columns]
+    autoincrement = table.autoincrement_column is not None
+
+    if autoincrement:
+        id_column = table.autoincrement_column.name
+        rows = [{k: v for k, v in row.items() if not (k == id_column and v is None)} for row in rows]
+    else:
+        rows = _dedupe(table, rows)
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(row.keys())].append(row)
+
+    for keys, group in groups.items():
+        stmt = insert(table)
+        if not autoincrement:
+            update_columns = {k: stmt.excluded[k] for k in keys if k not in primary_key}
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(index_elements=primary_key, set_=update_columns)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=primary_key)
+        # executemany of a single cached statement; SQLAlchemy batches it into multi-row VALUES
+        session.execute(stmt, group)
+
+def insert_missing(session, model, rows):
+    """
+    Inserts the rows of model whose primary key is not in the table yet and leaves existing rows untouched.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    primary_key = [column.name for column in table.primary_key.columns]
+    stmt = insert_for(session)(table).on_conflict_do_nothing(index_elements=primary_key)
+    session.execute(stmt, _dedupe(table, rows))
+
+def insert_new(session, model, rows):
+    """
+    Inserts the rows of model whose primary key is not in the table yet, like insert_missing, and
+    returns the first primary key column of the rows this statement actually inserted. Concurrent
+    writers of the same key wait on each other, so only one of them gets the key back.
+    """
+    if not rows:
+        return []
+    table = model.__table__
+    primary_key = [column.name for column in table.primary_key.columns]
+    stmt = (insert_for(session)(table)
+            .on_conflict_do_nothing(index_elements=primary_key)
+            .returning(table.c[primary_key[0]]))
+    return session.execute(stmt, _dedupe(table, rows)).scalars().all()
+
+COPY_NULL = "\\N"
+
+def copy_rows(session, model, rows):
+    """
+    Streams rows into the table of model with COPY FROM STDIN into a temporary staging table,
+    then moves them into the target with INSERT ... SELECT ... ON CONFLICT. Only Postgres
+    (psycopg2) supports this; on other databases it falls back to upsert.
+    """
+    if not rows:
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        upsert(session, model, rows)
+        return
+
+    table = model.__table__
+    primary_key = [column.name for column in table.primary_key.columns]
+    autoincrement = table.autoincrement_column
+    columns = [column.name for column in table.columns if column is not autoincrement]
+    if autoincrement is None:
+        rows = _dedupe(table, rows)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([COPY_NULL if row.get(name) is None else row[name] for name in columns])
+    buffer.seek(0)
+
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    staging = f"staging_{table.name}"
+    if autoincrement is not None:
+        conflict = ""
+    else:
+        updates = ", ".join(f'"{name}" = EXCLUDED."{name}"' for name in columns if name not in primary_key)
+        conflict = f"ON CONFLICT ({', '.join(primary_key)}) DO UPDATE SET {updates}"
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS '
+                       f'SELECT {column_list} FROM "{table.name}" WITH NO DATA')
+        cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+        cursor.execute(f'INSERT INTO "{table.name}" ({column_list}) SELECT {column_list} FROM {staging} {conflict}')
+        cursor.execute(f"TRUNCATE {staging}")
+    finally:
+        cursor.close()
@@ -0,0 +1,265 @@
+"""
+Builds the per-player-per-match analysis dataset (what preprocessing.ipynb joins together in
+pandas) as a Parquet dataset partitioned by map and queue. The joins and per-match counts run
+in the database, a chunk of matches at a time, and only matches that were not exported yet are
+read, so refreshing the dataset after a crawl costs as much as the crawl added. Each chunk is
+streamed out of the database and kept in compact dtypes, so peak memory depends on the chunk
+size and not on the size of the database.
+
+    python export.py --output output/dataset
+    python export.py --output output/dataset --rebuild   # drops the dataset and exports everything again
+
+Every run also folds the newly written files into a .npz snapshot of the aggregate cube of
+cube.py (output/cube.npz by default), so a cube of the dataset stays in step with it without a
+separate step; the cube ingestion keeps in the agent_map_stats table does not depend on exports.
+"""
+import argparse
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import Integer, and_, cast, delete, func, select
+from db import insert_missing, open_session
+from features import add_derived_features
+from models import (Agent, ExportedMatch, Map, Match, MatchPlayers, MatchRoundDefuse, MatchRoundPlant,
+                    MatchRoundPlayerStats, MatchRounds, MatchTeams)
+
+PARTITION_COLUMNS = ["map_name", "queue_id"]
+
+STAT_COLUMNS = [
+    "stats_score", "stats_kills", "stats_deaths", "stats_assists", "stats_headshots", "stats_bodyshots",
+    "stats_legshots", "stats_damage_dealt", "stats_damage_received", "ability_casts_grenade",
+    "ability_casts_ability1", "ability_casts_ability2", "ability_casts_ultimate", "tier_id", "account_level",
+    "economy_spent_overall", "economy_spent_average", "economy_loadout_value_overall",
+    "economy_loadout_value_average",
+]
+
+# Compact dtypes of the feature columns. Ids and names repeat across rows, so they are categoricals;
+# counters fit 16 bits and totals 32. Integers are nullable since the outer joins can leave gaps.
+CATEGORY_COLUMNS = ["match_id", "player_puuid", "team_id", "agent_id", "agent_name", "map_id", "map_name", "queue_id"]
+INT16_COLUMNS = [
+    "stats_kills", "stats_deaths", "stats_assists", "stats_headshots", "stats_bodyshots", "stats_legshots",
+    "ability_casts_grenade", "ability_casts_ability1", "ability_casts_ability2", "ability_casts_ultimate", "tier_id",
+    "total_plants", "total_defuses", "rounds_won", "rounds_lost", "total_rounds", "rounds_played", "rounds_played_won",
+]
+INT32_COLUMNS = [
+    "stats_score", "stats_damage_dealt", "stats_damage_received", "account_level", "economy_spent_overall",
+    "economy_loadout_value_overall",
+]
+FLOAT32_COLUMNS = [
+    "economy_spent_average", "economy_loadout_value_average", "KDA Ratio", "ADR", "ACS", "Overall Ability Cast",
+    "Win Ratio", "damage_per_kills",
+]
+
+def compact_dtypes(frame):
+    """
+    Casts the feature columns present in frame to their compact dtypes, in place, and returns it.
+    """
+    for columns, dtype in ((CATEGORY_COLUMNS, "category"), (INT16_COLUMNS, "Int16"),
+                           (INT32_COLUMNS, "Int32"), (FLOAT32_COLUMNS, "float32")):
+        for column in columns:
+            if column in frame.columns:
+                frame[column] = frame[column].astype(dtype)
+    return frame
+
+def feature_query(match_ids):
+    """
+    One row per player of the given matches, with the columns preprocessing.ipynb builds: the
+    match_players stats, plants, defuses, total rounds, rounds won and lost, map, queue and agent.
+    The derived features are added afterwards by features.add_derived_features.
+    """
+    rounds = (
+        select(MatchRounds.match_id, func.count().label("total_rounds"))
+            .where(MatchRounds.match_id.in_(match_ids))
+            .group_by(MatchRounds.match_id)
+            .subquery()
+    )
+    plants = (
+        select(MatchRoundPlant.match_id, MatchRoundPlant.player_puuid, MatchRoundPlant.agent_id,
+               func.count().label("total_plants"))
+            .where(MatchRoundPlant.match_id.in_(match_ids))
+            .group_by(MatchRoundPlant.match_id, MatchRoundPlant.player_puuid, MatchRoundPlant.agent_id)
+            .subquery()
+    )
+    defuses = (
+        select(MatchRoundDefuse.match_id, MatchRoundDefuse.player_puuid, MatchRoundDefuse.agent_id,
+               func.count().label("total_defuses"))
+            .where(MatchRoundDefuse.match_id.in_(match_ids))
+            .group_by(MatchRoundDefuse.match_id, MatchRoundDefuse.player_puuid, MatchRoundDefuse.agent_id)
+            .subquery()
+    )
+    # A player's own rounds, from the per-round stats joined to the round winners; unlike rounds_won
+    # of match_teams it leaves out rounds played before a player joined or after they left
+    player_rounds = (
+        select(MatchRoundPlayerStats.match_id, MatchRoundPlayerStats.player_puuid,
+               func.count().label("rounds_played"),
+               func.sum(cast(MatchRoundPlayerStats.player_team == MatchRounds.winning_team, Integer)).label("rounds_played_won"))
+            .join(MatchRounds, and_(MatchRounds.match_id == MatchRoundPlayerStats.match_id,
+                                    MatchRounds.round_num == MatchRoundPlayerStats.round_num))
+            .where(MatchRoundPlayerStats.match_id.in_(match_ids))
+            .group_by(MatchRoundPlayerStats.match_id, MatchRoundPlayerStats.player_puuid)
+            .subquery()
+    )
+    return (
+        select(
+            MatchPlayers.match_id, MatchPlayers.player_puuid, MatchPlayers.team_id, MatchPlayers.agent_id,
+            Agent.name.label("agent_name"), Match.map_id, Map.name.label("map_name"), Match.queue_id, Match.started_at,
+            *[getattr(MatchPlayers, column) for column in STAT_COLUMNS],
+            func.coalesce(plants.c.total_plants, 0).label("total_plants"),
+            func.coalesce(defuses.c.total_defuses, 0).label("total_defuses"),
+            MatchTeams.rounds_won, MatchTeams.rounds_lost, rounds.c.total_rounds,
+            player_rounds.c.rounds_played, player_rounds.c.rounds_played_won,
+        )
+            .join(Match, Match.id == MatchPlayers.match_id)
+            .join(MatchTeams, and_(MatchTeams.match_id == MatchPlayers.match_id, MatchTeams.team_id == MatchPlayers.team_id))
+            .outerjoin(Map, Map.id == Match.map_id)
+            .outerjoin(Agent, Agent.id == MatchPlayers.agent_id)
+            .outerjoin(rounds, rounds.c.match_id == MatchPlayers.match_id)
+            .outerjoin(player_rounds, and_(player_rounds.c.match_id == MatchPlayers.match_id,
+                                           player_rounds.c.player_puuid == MatchPlayers.player_puuid))
+            .outerjoin(plants, and_(plants.c.match_id == MatchPlayers.match_id, plants.c.player_puuid == MatchPlayers.player_puuid,
+                                    plants.c.agent_id == MatchPlayers.agent_id))
+            .outerjoin(defuses, and_(defuses.c.match_id == MatchPlayers.match_id, defuses.c.player_puuid == MatchPlayers.player_puuid,
+                                     defuses.c.agent_id == MatchPlayers.agent_id))
+            .where(MatchPlayers.match_id.in_(match_ids))
+    )
+
+def read_feature_chunk(connection, match_ids, rows_per_batch=20_000):
+    """
+    The feature rows of match_ids as one table in compact dtypes. The rows come through a
+    server-side cursor rows_per_batch at a time, and each batch is compacted before the next
+    is fetched, so the full-width frame of the whole chunk never exists.
+    """
+    # Set on the statement, not the connection: Connection.execution_options changes the session's
+    # connection in place, and the later executemany calls cannot run on a server-side cursor
+    query = feature_query(match_ids).execution_options(stream_results=True, max_row_buffer=rows_per_batch)
+    batches = [pa.Table.from_pandas(compact_dtypes(add_derived_features(frame)), preserve_index=False)
+               for frame in pd.read_sql(query, connection, chunksize=rows_per_batch)]
+    if not batches:
+        return None
+    # Categories differ between batches; unify them so the batches share one schema
+    return pa.concat_tables(batches, promote_options="permissive").unify_dictionaries()
+
+def _unexported_matches(session, after, limit):
+    """
+    Up to limit ids of matches that are not in exported_match, in id order after the id after.
+    """
+    return session.execute(
+        select(Match.id)
+            .outerjoin(ExportedMatch, ExportedMatch.match_id == Match.id)
+            .where(ExportedMatch.match_id.is_(None))
+            .where(Match.id > after)
+            .order_by(Match.id)
+            .limit(limit)
+    ).scalars().all()
+
+def export_features(engine, output_dir, chunk_matches=5_000):
+    """
+    Appends the rows of every match not exported yet to the dataset in output_dir, chunk_matches
+    matches per query, and records them in exported_match. Each chunk commits after its files are
+    written, so an interrupted export picks up at the first unrecorded chunk; a crash between the
+    two can leave that chunk's rows in the dataset twice, which read_features drops.
+    Returns the number of matches exported.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    run = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    exported, chunks, after = 0, 0, ""
+    with open_session(engine) as session:
+        while match_ids := _unexported_matches(session, after, chunk_matches):
+            after = match_ids[-1]
+            table = read_feature_chunk(session.connection(), match_ids)
+            rows = 0 if table is None else table.num_rows
+            part = f"part-{run}-{chunks:05d}-{{i}}.parquet"
+            if rows:
+                pq.write_to_dataset(table, output_dir,
+                                    partition_cols=PARTITION_COLUMNS, basename_template=part,
+                                    existing_data_behavior="overwrite_or_ignore")
+            now = datetime.now()
+            insert_missing(session, ExportedMatch, [{"match_id": match_id, "exported_at": now, "part": part}
+                                                    for match_id in match_ids])
+            session.commit()
+            exported += len(match_ids)
+            chunks += 1
+            print(f"Exported {exported} matches ({rows} rows in the last chunk)")
+    return exported
+
+def reset_export(engine, output_dir):
+    """
+    Forgets every exported match and deletes the dataset, so the next export writes it again from scratch.
+    """
+    with open_session(engine) as session:
+        session.execute(delete(ExportedMatch))
+        session.commit()
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+def dataset_files(output_dir):
+    """
+    Paths of the Parquet files of the dataset in output_dir.
+    """
+    return set(ds.dataset(output_dir, format="parquet", partitioning="hive").files)
+
+def read_batches(output_dir, paths, columns, batch_size=65_536):
+    """
+    Streams the given files of the dataset in output_dir as Arrow record batches of columns,
+    with the map_name and queue_id partition columns filled in. Every partition file is a batch
+    of its own when scanned, so they are coalesced into batches of about batch_size rows.
+    """
+    dataset = ds.dataset(sorted(paths), format="parquet", partitioning="hive", partition_base_dir=output_dir)
+    pending, rows = [], 0
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        pending.append(batch)
+        rows += batch.num_rows
+        if rows >= batch_size:
+            yield from pa.Table.from_batches(pending).unify_dictionaries().combine_chunks().to_batches()
+            pending, rows = [], 0
+    if pending:
+        yield from pa.Table.from_batches(pending).unify_dictionaries().combine_chunks().to_batches()
+
+def read_features(output_dir, maps=None, queues=None, players=None, columns=None):
+    """
+    Loads the dataset as a DataFrame in compact dtypes, reading only the partitions of the given
+    map names and queue ids, and only the rows of the given player puuids.
+    """
+    dataset = ds.dataset(output_dir, format="parquet", partitioning="hive")
+    filter_ = None
+    for column, values in (("map_name", maps), ("queue_id", queues), ("player_puuid", players)):
+        if values is not None:
+            condition = ds.field(column).isin(list(values))
+            filter_ = condition if filter_ is None else filter_ & condition
+    frame = compact_dtypes(dataset.to_table(columns=columns, filter=filter_).to_pandas())
+    if columns is None or {"match_id", "player_puuid"} <= set(columns):
+        frame = frame.drop_duplicates(subset=["match_id", "player_puuid"], ignore_index=True)
+    return frame
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import create_db_engine
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join("output", "dataset"))
+    parser.add_argument("--chunk", type=int, default=5_000, help="matches per query")
+    parser.add_argument("--rebuild", action="store_true", help="delete the dataset and export every match again")
+    parser.add_argument("--cube", default=os.path.join("output", "cube.npz"),
+                        help="aggregate cube (cube.py) to fold the newly exported files into")
+    parser.add_argument("--no-cube", action="store_true", help="leave the aggregate cube alone")
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_db_engine(os.getenv("DATABASE_URL"))
+    migrate(engine)
+    if args.rebuild:
+        reset_export(engine, args.output)
+    time_ = time.perf_counter()
+    count = export_features(engine, args.output, chunk_matches=args.chunk)
+    print(f"Exported {count} new matches to {args.output} in {time.perf_counter() - time_:.1f}s")
+    if not args.no_cube:
+        from cube import update_cube
+
+        cube, files = update_cube(args.cube, args.output, rebuild=args.rebuild)
+        print(f"Folded {files} new files into {args.cube}; {len(cube.keys)} cells over {cube.count.sum()} rows")
@@ -0,0 +1,79 @@
+"""
+Derived features of the per-player-per-match dataset and the integer codes of its categories,
+computed on whole columns at once. export.py adds the derived features to every chunk it writes;
+the notebooks can call the same functions on a DataFrame loaded with export.read_features.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from db import open_session
+from models import Agent, Map, Queue
+
+DERIVED_FEATURES = ["KDA Ratio", "ADR", "ACS", "Overall Ability Cast", "Win Ratio", "damage_per_kills"]
+
+ABILITY_CAST_COLUMNS = ["ability_casts_grenade", "ability_casts_ability1", "ability_casts_ability2", "ability_casts_ultimate"]
+
+# Categorical columns and the table column their codes come from
+CATEGORY_SOURCES = {
+    "agent_name": Agent.name,
+    "map_name": Map.name,
+    "queue_id": Queue.id,
+}
+
+def _values(frame, column):
+    # Nullable and compact integer columns as float64, with NULLs as NaN
+    return frame[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+def _divide(numerator, denominator, zero=np.nan):
+    result = np.full_like(numerator, zero)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+def derived_features(frame):
+    """
+    The DERIVED_FEATURES of frame as a dict of float64 arrays, in the notebook's definitions:
+    (kills + assists) / (deaths + 1), damage and score per round, ability casts per round,
+    rounds won per round and damage per kill (0 without kills). Per-round values are NaN
+    when a match has no rounds stored.
+    """
+    kills = _values(frame, "stats_kills")
+    damage = _values(frame, "stats_damage_dealt")
+    total_rounds = _values(frame, "total_rounds")
+    ability_casts = sum(np.nan_to_num(_values(frame, column)) for column in ABILITY_CAST_COLUMNS)
+    return {
+        "KDA Ratio": (kills + _values(frame, "stats_assists")) / (_values(frame, "stats_deaths") + 1),
+        "ADR": _divide(damage, total_rounds),
+        "ACS": _divide(_values(frame, "stats_score"), total_rounds),
+        "Overall Ability Cast": _divide(ability_casts, total_rounds),
+        "Win Ratio": _divide(_values(frame, "rounds_won"), total_rounds),
+        "damage_per_kills": _divide(damage, kills, zero=0.0),
+    }
+
+def add_derived_features(frame):
+    """
+    Adds the DERIVED_FEATURES columns to frame, in place, and returns it.
+    """
+    for column, values in derived_features(frame).items():
+        frame[column] = values
+    return frame
+
+def category_codes(engine):
+    """
+    The categories of every CATEGORY_SOURCES column as read from the agent, map and queue tables,
+    sorted, so a category's code is its position in the list. Agents or maps added by a later
+    content sync shift the codes after them; keep the lists with anything built on the codes.
+    """
+    with open_session(engine) as session:
+        return {column: list(dict.fromkeys(session.execute(select(source).where(source.is_not(None))
+                                                           .order_by(source)).scalars()))
+                for column, source in CATEGORY_SOURCES.items()}
+
+def encode_categories(frame, codes):
+    """
+    Adds an int16 <column>_numeric code column for every column of codes present in frame,
+    in place, and returns it. Values missing from codes get -1.
+    """
+    for column, categories in codes.items():
+        if column in frame.columns:
+            frame[f"{column}_numeric"] = pd.Categorical(frame[column], categories=categories).codes.astype(np.int16)
+    return frame
@@ -0,0 +1,215 @@
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, String, bindparam, case, func, select, tuple_, update
+from models import CrawlFrontier, Player, PlayerCrawlStats
+from crawl_stats import record_player_crawls
+from db import insert_missing, open_session, naive_utc
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+def match_started_at(match):
+    """
+    started_at of a match payload as a naive UTC datetime, the way it is stored in the database.
+    """
+    return naive_utc(match['metadata']['started_at'])
+
+def players_with_matches(session, min_matches, puuids=None):
+    """
+    Puuids (optionally only those in puuids) with at least min_matches stored matches,
+    read from the running counts in player_crawl_stats.
+    """
+    query = select(PlayerCrawlStats.puuid).where(PlayerCrawlStats.match_count >= min_matches)
+    if puuids is not None:
+        query = query.where(PlayerCrawlStats.puuid.in_(list(puuids)))
+    return session.execute(query).scalars().all()
+
+def players_with_fewer_matches(session, num_matches, limit):
+    """
+    (region, platform, puuid) of up to limit players with a known region and platform and
+    fewer than num_matches stored matches, fewest first. A range scan over the
+    (match_count, puuid) index of player_crawl_stats.
+    """
+    query = (
+        select(Player.primary_region, Player.primary_platform, Player.puuid)
+            .join(PlayerCrawlStats, PlayerCrawlStats.puuid == Player.puuid)
+            .where(PlayerCrawlStats.match_count < num_matches)
+            .where(Player.primary_platform.is_not(None), Player.primary_region.is_not(None))
+            .order_by(PlayerCrawlStats.match_count, PlayerCrawlStats.puuid)
+            .limit(limit)
+    )
+    return [tuple(row) for row in session.execute(query).all()]
+
+def stream_players_with_fewer_matches(session, num_matches, crawled_before, chunk_size=1000):
+    """
+    Streams the same players as players_with_fewer_matches, fewest matches first, as lists of
+    up to chunk_size (region, platform, puuid). Each list is one keyset query that starts after
+    the (match_count, puuid) of the last player of the previous one, so memory stays flat however
+    many players qualify. The list is read in full and the read transaction ended before it is
+    yielded, so the caller can write between lists (queue them in the frontier) without holding
+    a cursor open, which SQLite would answer with "database is locked". Players crawled at or
+    after crawled_before are left out, and so are players the frontier is crawling or gave up on.
+    """
+    query = (
+        select(Player.primary_region, Player.primary_platform, Player.puuid, PlayerCrawlStats.match_count)
+            .join(PlayerCrawlStats, PlayerCrawlStats.puuid == Player.puuid)
+            .outerjoin(CrawlFrontier, CrawlFrontier.puuid == Player.puuid)
+            .where(PlayerCrawlStats.match_count < num_matches)
+            .where(Player.primary_platform.is_not(None), Player.primary_region.is_not(None))
+            .where(PlayerCrawlStats.last_crawled_at.is_(None) | (PlayerCrawlStats.last_crawled_at < crawled_before))
+            .where(CrawlFrontier.status.is_(None) | (CrawlFrontier.status == DONE))
+            .order_by(PlayerCrawlStats.match_count, PlayerCrawlStats.puuid)
+            .limit(chunk_size)
+    )
+    last = None
+    while True:
+        page = query if last is None else query.where(tuple_(PlayerCrawlStats.match_count, PlayerCrawlStats.puuid) > last)
+        rows = session.execute(page).all()
+        session.rollback()
+        if not rows:
+            return
+        yield [(row.primary_region, row.primary_platform, row.puuid) for row in rows]
+        last = (rows[-1].match_count, rows[-1].puuid)
+
+class FrontierScheduler:
+    """
+    Hands out players to crawl from the crawl_frontier table.
+
+    Players are added once (the puuid is the primary key, so a player found on several
+    leaderboards is queued only once) and claimed by flipping them to in_progress in the same
+    statement that selects them. On Postgres the selection uses FOR UPDATE SKIP LOCKED, so
+    several crawlers can pull from the same frontier without getting the same player.
+    Claims older than stale_after are treated as abandoned by a crashed crawler and put back.
+    """
+    def __init__(self, engine, stale_after=timedelta(minutes=30), max_attempts=3):
+        self.engine = engine
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.table = CrawlFrontier.__table__
+
+    def add(self, targets, requeue=False):
+        """
+        Queues (region, platform, puuid) targets that are not in the frontier yet.
+        With requeue, players that were already crawled (or gave up) are queued again.
+        """
+        now = datetime.now()
+        rows = [{"puuid": puuid, "region": region, "platform": platform, "status": PENDING,
+                 "pages_fetched": 0, "attempts": 0, "added_at": now}
+                for region, platform, puuid in targets]
+        if not rows:
+            return
+        with open_session(self.engine) as session:
+            insert_missing(session, CrawlFrontier, rows)
+            if requeue:
+                session.execute(
+                    update(self.table)
+                        .where(self.table.c.puuid.in_([row["puuid"] for row in rows]))
+                        .where(self.table.c.status.in_([DONE, FAILED]))
+                        .values(status=PENDING, attempts=0)
+                )
+            session.commit()
+
+    def recover(self):
+        """
+        Puts players claimed longer than stale_after ago back in the queue.
+        """
+        with open_session(self.engine) as session:
+            result = session.execute(
+                update(self.table)
+                    .where(self.table.c.status == IN_PROGRESS)
+                    .where(self.table.c.claimed_at < datetime.now() - self.stale_after)
+                    .values(status=PENDING)
+            )
+            session.commit()
+            return result.rowcount
+
+    def has_pending(self, region=None, platform=None):
+        query = select(self.table.c.puuid).where(self.table.c.status == PENDING)
+        if region is not None:
+            query = query.where(self.table.c.region == region)
+        if platform is not None:
+            query = query.where(self.table.c.platform == platform)
+        with open_session(self.engine) as session:
+            return session.execute(query.limit(1)).first() is not None
+
+    def claim(self, limit, region=None, platform=None):
+        """
+        Marks up to limit pending players as in_progress and returns them as (region, platform, puuid).
+        """
+        candidates = (
+            select(self.table.c.puuid)
+                .where(self.table.c.status == PENDING)
+                .order_by(self.table.c.added_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+        )
+        if region is not None:
+            candidates = candidates.where(self.table.c.region == region)
+        if platform is not None:
+            candidates = candidates.where(self.table.c.platform == platform)
+
+        with open_session(self.engine) as session:
+            result = session.execute(
+                update(self.table)
+                    .where(self.table.c.puuid.in_(candidates))
+                    .where(self.table.c.status == PENDING)
+                    .values(status=IN_PROGRESS, claimed_at=datetime.now(), attempts=self.table.c.attempts + 1)
+                    .returning(self.table.c.region, self.table.c.platform, self.table.c.puuid)
+            )
+            targets = [tuple(row) for row in result.all()]
+            session.commit()
+        return targets
+
+    def high_water_mark(self, puuid):
+        """
+        Returns (newest_match_id, newest_match_at) of the player, or None if nothing was ingested for it yet.
+        """
+        with open_session(self.engine) as session:
+            row = session.execute(
+                select(self.table.c.newest_match_id, self.table.c.newest_match_at)
+                    .where(self.table.c.puuid == puuid)
+            ).first()
+        if row is None or row.newest_match_at is None:
+            return None
+        return tuple(row)
+
+    def complete(self, results):
+        """
+        Marks players as crawled. results is a list of (puuid, pages fetched in this crawl,
+        newest match id, newest match started_at); the high-water mark only ever moves forward.
+        """
+        if not results:
+            return
+        newest_at = bindparam("b_newest_at", type_=DateTime)
+        moves_forward = (newest_at.is_not(None)
+                         & ((self.table.c.newest_match_at.is_(None)) | (self.table.c.newest_match_at < newest_at)))
+        with open_session(self.engine) as session:
+            session.execute(
+                update(self.table)
+                    .where(self.table.c.puuid == bindparam("b_puuid"))
+                    .values(status=DONE, last_crawled_at=datetime.now(),
+                            pages_fetched=self.table.c.pages_fetched + bindparam("b_pages"),
+                            newest_match_id=case((moves_forward, bindparam("b_newest_id", type_=String)),
+                                                 else_=self.table.c.newest_match_id),
+                            newest_match_at=case((moves_forward, newest_at), else_=self.table.c.newest_match_at)),
+                [{"b_puuid": puuid, "b_pages": pages, "b_newest_id": newest_id, "b_newest_at": newest_at}
+                 for puuid, pages, newest_id, newest_at in results]
+            )
+            record_player_crawls(session, [puuid for puuid, *_ in results])
+            session.commit()
+
+    def fail(self, puuid):
+        """
+        Puts a player back in the queue, or marks it failed once it used up max_attempts.
+        """
+        with open_session(self.engine) as session:
+            attempts = session.execute(select(self.table.c.attempts).where(self.table.c.puuid == puuid)).scalar()
+            status = FAILED if attempts is not None and attempts >= self.max_attempts else PENDING
+            session.execute(update(self.table).where(self.table.c.puuid == puuid).values(status=status))
+            session.commit()
+
+    def counts(self):
+        with open_session(self.engine) as session:
+            rows = session.execute(select(self.table.c.status, func.count()).group_by(self.table.c.status)).all()
+        return {status: count for status, count in rows}
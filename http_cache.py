@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import httpx
+
+# Seconds a cached response is served without asking the API again, by URL pattern.
+# URLs that match no pattern (match histories) always go to the API.
+DEFAULT_TTLS = [
+    (r"valorant/v1/content", 24 * 60 * 60),
+    (r"valorant/v3/leaderboard/", 60 * 60),
+]
+
+class HttpCache:
+    """
+    On-disk cache of GET responses, shared by CacheTransport and AsyncCacheTransport.
+
+    A response younger than the TTL of its URL pattern is served from disk. An older one is
+    revalidated with If-None-Match / If-Modified-Since when the API sent an ETag or Last-Modified,
+    and a 304 serves the stored body again. Entries live in directory as <sha256 of url>.json
+    (status, headers, stored_at) next to <sha256 of url>.body with the raw response bytes.
+    """
+    def __init__(self, directory, ttls=DEFAULT_TTLS):
+        self.directory = directory
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def ttl_for(self, request):
+        if request.method != "GET":
+            return None
+        url = str(request.url)
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def _path(self, request, extension):
+        return os.path.join(self.directory, hashlib.sha256(str(request.url).encode()).hexdigest() + extension)
+
+    def lookup(self, request):
+        try:
+            with open(self._path(request, ".json")) as file:
+                entry = json.load(file)
+            with open(self._path(request, ".body"), "rb") as file:
+                entry["content"] = file.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        return time.time() - entry["stored_at"] < ttl
+
+    @staticmethod
+    def add_validators(request, entry):
+        """
+        Makes request conditional on the cached entry. Returns False when the API gave no validator.
+        """
+        headers = {name.lower(): value for name, value in entry["headers"]}
+        if "etag" in headers:
+            request.headers["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            request.headers["If-Modified-Since"] = headers["last-modified"]
+        return "etag" in headers or "last-modified" in headers
+
+    def _write(self, path, data):
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def store(self, request, response, content):
+        entry = {"url": str(request.url), "status_code": response.status_code,
+                 "headers": list(response.headers.multi_items()), "stored_at": time.time()}
+        self._write(self._path(request, ".body"), content)
+        self._write(self._path(request, ".json"), json.dumps(entry).encode())
+
+    def touch(self, request, entry):
+        """
+        Restarts the TTL of an entry the API confirmed is unchanged.
+        """
+        entry = {key: value for key, value in entry.items() if key != "content"}
+        entry["stored_at"] = time.time()
+        self._write(self._path(request, ".json"), json.dumps(entry).encode())
+
+    @staticmethod
+    def to_response(request, entry):
+        return httpx.Response(entry["status_code"], headers=entry["headers"], content=entry["content"],
+                              request=request, extensions={"from_cache": True})
+
+    def count(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        requests = self.hits + self.revalidated + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.revalidated) / requests, 3) if requests else 0.0,
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(f"HTTP cache: {stats['hits']} hits, {stats['revalidated']} revalidated, "
+              f"{stats['misses']} misses ({stats['hit_rate']:.1%} served locally)")
+
+class CacheTransport(httpx.BaseTransport):
+    """
+    Serves cacheable GETs from an HttpCache before they reach transport. Wrap it around
+    RateLimitTransport so cache hits spend no API quota.
+    """
+    def __init__(self, cache, transport):
+        self.cache = cache
+        self.transport = transport
+
+    def handle_request(self, request):
+        ttl = self.cache.ttl_for(request)
+        if ttl is None:
+            return self.transport.handle_request(request)
+
+        entry = self.cache.lookup(request)
+        if entry is not None:
+            if self.cache.is_fresh(entry, ttl):
+                self.cache.count("hits")
+                return self.cache.to_response(request, entry)
+            if not self.cache.add_validators(request, entry):
+                entry = None
+
+        response = self.transport.handle_request(request)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.touch(request, entry)
+            self.cache.count("revalidated")
+            return self.cache.to_response(request, entry)
+
+        # Raw bytes, still content-encoded, so the stored headers describe them correctly
+        content = b"".join(response.stream)
+        response.close()
+        if response.status_code == 200:
+            self.cache.store(request, response, content)
+        self.cache.count("misses")
+        return httpx.Response(response.status_code, headers=response.headers, content=content,
+                              request=request, extensions=response.extensions)
+
+    def close(self):
+        self.transport.close()
+
+class AsyncCacheTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of CacheTransport.
+    """
+    def __init__(self, cache, transport):
+        self.cache = cache
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        ttl = self.cache.ttl_for(request)
+        if ttl is None:
+            return await self.transport.handle_async_request(request)
+
+        entry = self.cache.lookup(request)
+        if entry is not None:
+            if self.cache.is_fresh(entry, ttl):
+                self.cache.count("hits")
+                return self.cache.to_response(request, entry)
+            if not self.cache.add_validators(request, entry):
+                entry = None
+
+        response = await self.transport.handle_async_request(request)
+        if response.status_code == 304 and entry is not None:
+            await response.aclose()
+            self.cache.touch(request, entry)
+            self.cache.count("revalidated")
+            return self.cache.to_response(request, entry)
+
+        content = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        if response.status_code == 200:
+            self.cache.store(request, response, content)
+        self.cache.count("misses")
+        return httpx.Response(response.status_code, headers=response.headers, content=content,
+                              request=request, extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -7,354 +7,243 @@ from models import (Agent,
                     MatchPlayers, 
                     Act, 
                     Tier,
-                    MatchTeams, 
-                    MatchRounds,
-                    MatchRoundPlant,
-                    MatchRoundDefuse,
                     MatchRoundPlayerLocations,
-                    MatchRoundPlayerStats,
                     MatchRoundPlayerStatsDamageEvents,
-                    MatchRoundKills,
                     MatchRoundKillsPlayerLocations,
-                    MatchRoundAssists,
                     Queue,
-                    Armor
+                    Armor,
+                    ContentVersion
 )
 from utils import flatten_dict
-from sqlmodel import Session
+from db import upsert, copy_rows, insert_new, open_session
+from crawl_stats import record_player_matches, ensure_player_stats
+from cube import record_match_cells
+from parsing import MatchParser, ParsedMatch, TABLE_ORDER
+from sqlmodel import select
 import time
-from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from sqlalchemy import exists
 
-class MatchDataManager:
+class MatchDataManager(MatchParser):
     "API reference: v4_match"
-    def __init__(self, engine, data):
-        self.engine = engine
-        
-        self.match_metadata :dict = data['metadata']
-        self.platform :str = data['metadata']['platform']
-        self.region :str = data['metadata']['region']
+    BULK_TABLE_ORDER = TABLE_ORDER
+    # The highest volume tables, loaded with COPY when use_copy is set (Postgres only)
+    COPY_TABLES = (
+        MatchRoundPlayerLocations,
+        MatchRoundPlayerStatsDamageEvents,
+        MatchRoundKillsPlayerLocations,
+    )
 
-        self.match_id :str = data['metadata']['match_id']
+    def __init__(self, engine, data, bulk=False, use_copy=False, known_keys=None):
+        super().__init__(data)
+        self.engine = engine
+        self.bulk = bulk or use_copy
+        self.use_copy = use_copy
+        # Optional KnownKeysCache; lookup rows it already holds are not written again
+        self.known_keys = known_keys
 
-        self.match_players :dict = data['players']
-        self.player_agent_mappings = {match_player["puuid"]: match_player["agent"]["id"] for match_player in data['players']}
-        
-        self.match_observers :dict = data['observers']
-        self.match_coaches :dict = data['coaches']
-        self.match_teams :dict = data['teams']
-        self.match_rounds :dict = data['rounds']
-        self.match_kills :dict = data['kills']
+    def _merge_save(self, session):
+        tables = self.to_rows()
+        for model, rows in tables.items():
+            if model is Match:
+                session.flush()
+                if not insert_new(session, Match, rows):
+                    # Another writer stored the match since the exists() check; leave it to that one
+                    session.rollback()
+                    return
+                continue
+            for row in rows:
+                session.merge(model(**row))
+        session.flush()
+        record_player_matches(session, tables[Match], tables[MatchPlayers])
+        record_match_cells(session, [self.match_id])
+        session.commit()
 
-    def _get_player_agent(self, player_puuid):
-        return self.player_agent_mappings.get(player_puuid, "Unknown")
+    @classmethod
+    def write_rows(cls, session, model, rows, use_copy=False):
+        if use_copy and model in cls.COPY_TABLES:
+            copy_rows(session, model, rows)
+        else:
+            upsert(session, model, rows)
 
-    def _save_metadata(self,session):
-        queue_obj = Queue(
-            **flatten_dict(self.match_metadata['queue'])
-        )
-        session.merge(queue_obj)
-        
-        obj = Match(
-            id = self.match_id,
-            **flatten_dict(self.match_metadata)
-        )
-        session.merge(obj)
+    def _bulk_save(self, session):
+        tables = self.to_rows()
+        if self.known_keys is not None:
+            tables = {model: self.known_keys.unknown_rows(model, rows) for model, rows in tables.items()}
+        for model, rows in tables.items():
+            if model is Match:
+                if not insert_new(session, Match, rows):
+                    # Another writer stored the match since the exists() check; leave it to that one
+                    session.rollback()
+                    return
+                continue
+            self.write_rows(session, model, rows, self.use_copy)
+        record_player_matches(session, tables[Match], tables[MatchPlayers])
+        record_match_cells(session, [self.match_id])
         session.commit()
-    
-    def _save_match_players(self,session):
-        for match_player in self.match_players:
-            player_obj = Player(
-                puuid = match_player["puuid"],
-                name = match_player["name"],
-                tag = match_player["tag"],
-                primary_region=self.region,
-                primary_platform=self.platform
-            )
-            session.merge(player_obj)
-            session.commit()
-
-            match_player_flat = flatten_dict(match_player)
-            match_player_flat['player_puuid'] = match_player_flat.pop('puuid')
-            match_player_obj = MatchPlayers(
-                match_id = self.match_id,
-                **match_player_flat,
-            )
-            session.merge(match_player_obj)
-            session.commit()
-               
-    def _save_match_teams(self,session):
-        for team in self.match_teams:
-            team_obj = MatchTeams(
-                match_id = self.match_id,
-                **flatten_dict(team)
-            )
-            session.merge(team_obj)
+        if self.known_keys is not None:
+            for model, rows in tables.items():
+                self.known_keys.remember(model, rows)
 
-    def _save_match_rounds(self,session):
-        # for round in self.match_rounds:
+    def save(self):
         
-        def _indiv(round):
-            objs = []
-            # rename id to round_id
-            round_flat = flatten_dict(round)
-            round_flat['round_num'] = round_flat.pop('id')
-            round_obj = MatchRounds(
-                match_id = self.match_id,
-                **round_flat
-            )
-            objs.append(round_obj)
-            # session.merge(round_obj)
-            if round['plant']:
-                objs_ = self._save_match_round_plant(session, round['plant'], round['id'])
-                objs.extend(objs_)
-            if round['defuse']:
-                objs_ = self._save_match_round_defuse(session, round['plant'], round['id'])
-                objs.extend(objs_)
-            objs_ = self._save_match_round_player_stats(session, round['stats'], round['id'])
-            objs.extend(objs_)
-            return objs
+        # print("Saving match data", self.match_id)
+        time_ = time.time()
+        with open_session(self.engine) as session:
+            match_exists = session.exec(exists().where(Match.id == self.match_id).select()).scalar()
+            if match_exists:
+                # print(f"Match {self.match_id} already exists in the database.")
+                return
+            # print(f"Session took {time.time() - time_:.2f} seconds to connect.")
+            if self.bulk:
+                self._bulk_save(session)
+            else:
+                self._merge_save(session)
 
-        
-        with ThreadPoolExecutor() as executor:
-            executor.map(_indiv, self.match_rounds)
-            results = list(executor.map(_indiv, self.match_rounds))
-            objs = []
-            
-            for result in results:
-                objs.extend(result)
-            #print("LEN OF RESULTS", len(objs))
-            for obj in objs:
-                session.merge(obj)
-        session.commit()
-    
-    def _save_match_round_plant(self, session, round_plant, round_num):
-        objs = []
-        player_puuid = round_plant['player']['puuid']
+class MatchBatchWriter:
+    """
+    Collects the rows of many matches and writes them in one transaction, flushing once
+    max_matches matches or max_rows rows are pending. Lookup rows that repeat across
+    matches (Player, Equipment, Armor, Queue) are kept once per batch.
+    Use as a context manager so the final flush also runs on shutdown or error.
+    With known_matches (a cache.KnownMatchIds), the ids of the matches are added to it once the
+    transaction that stored them committed.
+    """
+    LOOKUP_TABLES = (Queue, Player, Equipment, Armor)
 
-        round_plant_flat = flatten_dict(round_plant)
-        plant_obj = MatchRoundPlant(
-            match_id=self.match_id,
-            round_num=round_num,
-            agent_id = self._get_player_agent(player_puuid),
-            **round_plant_flat
-        )
-        objs.append(plant_obj)
-        # session.merge(plant_obj)
-        for player_location in round_plant['player_locations']:
-            obj = self._save_match_round_player_locations(session, player_location, round_num, "PLANT")
-            objs.append(obj)
-        return objs
+    def __init__(self, engine, max_matches=50, max_rows=250_000, use_copy=False, known_keys=None, known_matches=None):
+        self.engine = engine
+        self.max_matches = max_matches
+        self.max_rows = max_rows
+        self.use_copy = use_copy
+        self.known_keys = known_keys
+        self.known_matches = known_matches
 
-    def _save_match_round_defuse(self, session, round_defuse, round_num):
-        objs = []
-        player_puuid = round_defuse['player']['puuid']
+        self.flushes = 0
+        self.matches_written = 0
+        # Ids of matches that could not be written since flush() last returned them
+        self._failed = set()
+        self._reset()
 
-        round_defuse_flat = flatten_dict(round_defuse)
-        defuse_obj = MatchRoundDefuse(
-            match_id=self.match_id,
-            round_num=round_num,
-            agent_id = self._get_player_agent(player_puuid),
-            **round_defuse_flat
-        )
-        objs.append(defuse_obj)
-        # session.merge(defuse_obj)
-        for player_location in round_defuse['player_locations']:
-            obj = self._save_match_round_player_locations(session, player_location, round_num, "DEFUSE")
-            objs.append(obj)
-        return objs
+    def _reset(self):
+        self._lookups = {model: {} for model in self.LOOKUP_TABLES}
+        self._matches = {}
+        self._pending_rows = 0
 
-    def _save_match_round_player_locations(self, session, player_location, round_num,event):
-        player_loc_obj = MatchRoundPlayerLocations(
-            match_id=self.match_id,
-            round_num=round_num,
-            agent_id=self._get_player_agent(player_location['player']['puuid']),
-            **flatten_dict(player_location),
-            event_type=event,
-        )
-        return player_loc_obj
-        # session.merge(player_loc_obj)
-    
-    def _save_match_round_player_stats(self, session, player_stats, round_num):
-        objs = []
-        for player_stat in player_stats:
-            if player_stat['economy']['weapon'] is not None:
-                equipment_obj = Equipment(
-                    id = player_stat['economy']['weapon']['id'],
-                    name = player_stat['economy']['weapon']['name'],
-                    type = player_stat['economy']['weapon']['type'],
-                )
-                # session.merge(equipment_obj)
-                objs.append(equipment_obj)
+    def __len__(self):
+        return len(self._matches)
 
+    def __contains__(self, match_id):
+        return match_id in self._matches
 
-            if player_stat['economy']['armor'] is not None:
-                armor_obj = Armor(
-                    id = player_stat['economy']['armor']['id'],
-                    name = player_stat['economy']['armor']['name'],
-                )
-                objs.append(armor_obj)
+    def __enter__(self):
+        return self
 
-                # session.merge(armor_obj)
-            player_stat_obj = MatchRoundPlayerStats(
-                match_id=self.match_id,
-                round_num=round_num,
-                agent_id=self._get_player_agent(player_stat['player']['puuid']),
-                **flatten_dict(player_stat)
-            )
-            objs.append(player_stat_obj)
-            # session.merge(player_stat_obj)
-            # session.commit()
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
 
-            _metadata = {
-                "round_num": round_num,
-                "player_puuid": player_stat['player']['puuid'],
-                "player_team": player_stat['player']['team'],
-                "player_agent_id": self._get_player_agent(player_stat['player']['puuid']),
-            }
-            objs_ = self._save_match_player_stats_damage_events(session, player_stat['damage_events'], _metadata)
-            objs.extend(objs_)
-            return objs
-    
-    def _save_match_player_stats_damage_events(self, session, damage_events, _metadata : dict):
-        objs = []
-        for damage_event in damage_events:
-            damage_event_flat = flatten_dict(damage_event)
-            damage_event_flat['receiver_puuid'] = damage_event_flat.pop('player_puuid')
-            damage_event_flat['receiver_team'] = damage_event_flat.pop('player_team')
-            damage_event_flat['receiver_agent_id'] = self._get_player_agent(damage_event_flat['receiver_puuid'])
-            
-            damage_event_obj = MatchRoundPlayerStatsDamageEvents(
-                match_id=self.match_id,
-                **damage_event_flat,
-                **_metadata,
-            )
-            objs.append(damage_event_obj)
-        return objs
-            # session.merge(damage_event_obj)
-        # session.commit()
+    def add(self, match_manager: MatchDataManager):
+        if match_manager.match_id not in self._matches:
+            self.add_parsed(match_manager.parse())
 
-    def _save_match_kills(self, session):
+    def add_parsed(self, parsed: ParsedMatch):
+        """
+        Adds a match that already went through the parse stage, e.g. in a process pool.
+        """
+        if parsed.match_id in self._matches:
+            return
+        for model in self.LOOKUP_TABLES:
+            rows = parsed.rows(model)
+            primary_key = [column.name for column in model.__table__.primary_key.columns]
+            if self.known_keys is not None:
+                rows = self.known_keys.unknown_rows(model, rows)
+            for row in rows:
+                self._lookups[model][tuple(row[k] for k in primary_key)] = row
+        self._matches[parsed.match_id] = parsed
+        self._pending_rows += parsed.row_count()
 
-        def _indiv(kill):
-            objs = []
-            if kill['weapon']['id'] is not None:
-                weapon_obj = Equipment(
-                    id = kill['weapon']['id'],
-                    name = kill['weapon']['name'],
-                    type = kill['weapon']['type'],
-                )
-                objs.append(weapon_obj)
-                # session.merge(weapon_obj)
+        if len(self._matches) >= self.max_matches or self._pending_rows >= self.max_rows:
+            self._write()
 
-            killer_obj = Player(
-                puuid = kill['killer']['puuid'],
-                name = kill['killer']['name'],
-                tag = kill['killer']['tag'],
-                primary_platform=self.platform,
-                primary_region=self.region
-            )
-            victim_obj = Player(
-                puuid = kill['victim']['puuid'],
-                name = kill['victim']['name'],
-                tag = kill['victim']['tag'],
-                primary_platform=self.platform,
-                primary_region=self.region
-            )
-            objs.append(killer_obj)
-            objs.append(victim_obj)
-            # session.merge(killer_obj)
-            # session.merge(victim_obj)
-            # session.commit()
-            kill_flat = flatten_dict(kill)
-            kill_flat['round_num'] = kill_flat.pop('round')
-            kill_obj = MatchRoundKills(
-                match_id=self.match_id,
-                killer_agent_id=self._get_player_agent(kill['killer']['puuid']),
-                victim_agent_id=self._get_player_agent(kill['victim']['puuid']),
-                **kill_flat
-            )
-            _metadata = {
-                "round_num": kill_flat['round_num'],
-                "killer_puuid": kill['killer']['puuid'],
-                "killer_team": kill['killer']['team'],
-                "killer_agent_id": self._get_player_agent(kill['killer']['puuid']),
-                "victim_puuid": kill['victim']['puuid'],
-                "victim_team": kill['victim']['team'],
-                "victim_agent_id": self._get_player_agent(kill['victim']['puuid']),
+    def _write_lookups(self, session):
+        for model, rows in self._lookups.items():
+            upsert(session, model, list(rows.values()))
 
-            }
-            objs.extend(self._save_match_assists(session, kill['assistants'], _metadata))
-            objs.extend(self._save_match_round_kills_player_locations(session, kill['player_locations'], _metadata))
-            objs.append(kill_obj)
-            return objs
+    def _remember_lookups(self):
+        if self.known_keys is not None:
+            for model, rows in self._lookups.items():
+                self.known_keys.remember(model, list(rows.values()))
 
-        with ThreadPoolExecutor() as executor:
-            executor.map(_indiv, self.match_kills)
-            results = list(executor.map(_indiv, self.match_kills))
-            objs = []
-            for result in results:
-                objs.extend(result)
-            #print("LEN OF RESULTS MATCH KILLS", len(objs))
-            for obj in objs:
-                session.merge(obj)
-        
-        # for kill in self.match_kills:
-            
-        session.commit()
+    def _remember_matches(self, match_ids):
+        if self.known_matches is not None:
+            for match_id in match_ids:
+                self.known_matches.add(match_id)
 
-    def _save_match_round_kills_player_locations(self, session, player_locations, _metadata):
-        objs = []
-        for player_location in player_locations:
-            player_loc_obj = MatchRoundKillsPlayerLocations(
-                match_id=self.match_id,
-                player_agent_id=self._get_player_agent(player_location['player']['puuid']),
-                **flatten_dict(player_location),
-                **_metadata,
-            )
-            # session.merge(player_loc_obj)
-            objs.append(player_loc_obj)
-        return objs
-        # session.commit()
+    def _write_matches(self, session, matches):
+        """
+        Writes the matches whose match row this transaction inserts and returns how many that is;
+        matches another writer stored since the existence check in flush are left alone, so
+        their players' match counts and agent_map_stats cells are not added twice.
+        """
+        inserted = set(insert_new(session, Match, [row for parsed in matches for row in parsed.rows(Match)]))
+        matches = [parsed for parsed in matches if parsed.match_id in inserted]
+        for model in MatchDataManager.BULK_TABLE_ORDER:
+            if model in self._lookups or model is Match:
+                continue
+            MatchDataManager.write_rows(session, model, [row for parsed in matches for row in parsed.rows(model)], self.use_copy)
+        record_player_matches(session, [row for parsed in matches for row in parsed.rows(Match)],
+                              [row for parsed in matches for row in parsed.rows(MatchPlayers)])
+        record_match_cells(session, [parsed.match_id for parsed in matches])
+        return len(matches)
 
-    def _save_match_assists(self, session, assists, _metadata):
-        objs = []
-        for assist in assists:
-            assists_flat = flatten_dict(assist)
-            assists_flat['assistant_puuid'] = assists_flat.pop('puuid')
-            assists_flat['assistant_team'] = assists_flat.pop('team')
-            assists_flat['assistant_agent_id'] = self._get_player_agent(assists_flat['assistant_puuid'])
-            assist_obj = MatchRoundAssists(
-                match_id=self.match_id,
-                **assists_flat,
-                **_metadata
-            )
-            objs.append(assist_obj)
-        return objs
-            # session.merge(assist_obj)
-        # session.commit()
+    def _write(self):
+        if not self._matches:
+            return
+        try:
+            with open_session(self.engine) as session:
+                existing = set(session.exec(select(Match.id).where(Match.id.in_(list(self._matches)))).all())
+                matches = [parsed for match_id, parsed in self._matches.items() if match_id not in existing]
+                try:
+                    self._write_lookups(session)
+                    written = self._write_matches(session, matches)
+                    session.commit()
+                    self._remember_lookups()
+                    self._remember_matches(self._matches)
+                    self.matches_written += written
+                except Exception as e:
+                    # One bad match should not cost the whole batch: retry match by match.
+                    print(f"Batch write failed, retrying {len(matches)} matches one at a time: {e}")
+                    session.rollback()
+                    self._write_lookups(session)
+                    session.commit()
+                    self._remember_lookups()
+                    self._remember_matches(existing)
+                    for parsed in matches:
+                        try:
+                            written = self._write_matches(session, [parsed])
+                            session.commit()
+                            self._remember_matches([parsed.match_id])
+                            self.matches_written += written
+                        except Exception as e:
+                            print(f"An error has ocurred when saving match {parsed.match_id}: {e}")
+                            session.rollback()
+                            self._failed.add(parsed.match_id)
+            self.flushes += 1
+        except Exception:
+            # Which matches of the batch made it is unknown, so all of them are reported
+            self._failed.update(self._matches)
+            raise
+        finally:
+            self._reset()
 
-    def save(self):
-        
-        # print("Saving match data", self.match_id)
-        time_ = time.time()
-        with Session(self.engine) as session:
-            match_exists = session.exec(exists().where(Match.id == self.match_id).select()).scalar()
-            if match_exists:
-                # print(f"Match {self.match_id} already exists in the database.")
-                return
-            # print(f"Session took {time.time() - time_:.2f} seconds to connect.")
-            self._save_metadata(session)
-            #print(f"Saving metadata took {time.time() - time_:.2f} seconds")
-            self._save_match_players(session)
-            #print(f"Saving players took {time.time() - time_:.2f} seconds")
-            self._save_match_teams(session)
-            #print(f"Saving teams took {time.time() - time_:.2f} seconds")
-            self._save_match_rounds(session)
-            #print(f"Saving rounds took {time.time() - time_:.2f} seconds")
-            self._save_match_kills(session)
-            #print(f"Saving kills took {time.time() - time_:.2f} seconds")
-            session.commit()
+    def flush(self):
+        """
+        Writes the pending matches. Returns the ids of the matches that could not be written, in
+        this flush or in one add() started since the last flush, so the caller can fetch them again.
+        """
+        self._write()
+        failed, self._failed = self._failed, set()
+        return failed
 
 class LeaderboardDataManager:
     def __init__(self, engine, data, region, platform):
@@ -364,7 +253,7 @@ class LeaderboardDataManager:
         self.players = data['data']['players']
 
     def save(self):
-        with Session(self.engine) as session:
+        with open_session(self.engine) as session:
             for leaderboard in self.players:
                 # #print(f"Saving leaderboard at {self.region} {self.platform}, {leaderboard['tier']}, {leaderboard['leaderboard_rank']}" )
                 if leaderboard["puuid"] is not None:
@@ -382,6 +271,8 @@ class LeaderboardDataManager:
                     **flatten_dict(leaderboard),
                 )
                 session.merge(leaderboard_obj)
+            session.flush()
+            ensure_player_stats(session, self.get_player_uuids())
             session.commit()
         return self.players
     
@@ -389,96 +280,125 @@ class LeaderboardDataManager:
         return [player['puuid'] for player in self.players if player['puuid'] is not None]
     
 class AssetsDataManager:
+    """
+    Syncs the content endpoint (agents, maps, equipment, acts) and the fixed tier list.
+
+    The last applied content version is kept in content_version; a payload with the same
+    version is skipped. Otherwise only rows that are new or differ from the database are
+    upserted, one statement per table. The version column is left out of the comparison,
+    so it records the content version in which a row last changed.
+    """
+    TIERS = [
+        (27, "Radiant"),
+        (26, "Immmortal 3"),
+        (25, "Immmortal 2"),
+        (24, "Immmortal 1"),
+        (23, "Radiant 3"),
+        (22, "Radiant 2"),
+        (21, "Radiant 1"),
+        (20, "Diamond 3"),
+        (19, "Diamond 2"),
+        (18, "Diamond 1"),
+        (17, "Platinum 3"),
+        (16, "Platinum 2"),
+        (15, "Platinum 1"),
+        (14, "Gold 3"),
+        (13, "Gold 2"),
+        (12, "Gold 1"),
+        (11, "Silver 3"),
+        (10, "Silver 2"),
+        (9, "Silver 1"),
+        (8, "Bronze 3"),
+        (7, "Bronze 2"),
+        (6, "Bronze 1"),
+        (5, "Iron 3"),
+        (4, "Iron 2"),
+        (3, "Iron 1"),
+        (2, "Unranked"),
+        (1, "Unknown"),
+        (0, "Unrated"),
+    ]
+
     def __init__(self, engine, data) -> None:
         self.data = data
         self.engine = engine
         self.version = data['version']
         self.assets_data = data
 
-    def save(self):
-        with Session(self.engine) as session:
-            for character in self.assets_data['characters']:
-                agent = Agent(
-                    id = character["id"],
-                    name = character["name"],
-                    asset_name = character["assetName"],
-                    localized_names = str(character["localizedNames"]),
-                    version = self.version
-                )
-                session.merge(agent)
-            unknown_agent = Agent(
-                id = "Unknown",
-                name = "Unknown",
-                asset_name = "Unknown",
-                localized_names=[],
+    def to_rows(self):
+        rows = {Agent: [], Map: [], Equipment: [], Act: [], Tier: []}
+        for character in self.assets_data['characters']:
+            rows[Agent].append(dict(
+                id = character["id"],
+                name = character["name"],
+                asset_name = character["assetName"],
+                localized_names = str(character["localizedNames"]),
                 version = self.version
-            )
-            session.merge(unknown_agent)
-            for map in self.assets_data["maps"]:
-                map = Map(
-                    id = map["id"],
-                    name = map["name"],
-                    asset_name = map["assetName"],
-                    localized_names = str(map["localizedNames"]),
-                    version = self.version
-                )
-                session.merge(map)
+            ))
+        rows[Agent].append(dict(
+            id = "Unknown",
+            name = "Unknown",
+            asset_name = "Unknown",
+            localized_names=str([]),
+            version = self.version
+        ))
+        for map in self.assets_data["maps"]:
+            rows[Map].append(dict(
+                id = map["id"],
+                name = map["name"],
+                asset_name = map["assetName"],
+                localized_names = str(map["localizedNames"]),
+                version = self.version
+            ))
+        for equipment in self.assets_data["equips"]:
+            # type is left out: it is only known from match data and must not be reset here
+            rows[Equipment].append(dict(
+                id = equipment["id"],
+                name = equipment["name"],
+                asset_name = equipment["assetName"],
+                localized_names = str(equipment["localizedNames"]),
+                version = self.version
+            ))
+        for act in self.assets_data["acts"]:
+            rows[Act].append(dict(
+                id = act["id"],
+                parent_id=act["parentId"] if act['parentId'] != "00000000-0000-0000-0000-000000000000" else None,
+                type = act["type"],
+                name = act["name"],
+                localized_names=str(act["localizedNames"]),
+                is_active=act["isActive"],
+            ))
+        for tier_id, name in self.TIERS:
+            rows[Tier].append(dict(id = tier_id, name = name))
+        return rows
 
-            for equipment in self.assets_data["equips"]:
-                equipment = Equipment(
-                    id = equipment["id"],
-                    name = equipment["name"],
-                    asset_name = equipment["assetName"],
-                    localized_names = str(equipment["localizedNames"]),
-                    version = self.version
-                )
-                session.merge(equipment)
+    @staticmethod
+    def _changed_rows(session, model, rows):
+        if not rows:
+            return []
+        table = model.__table__
+        columns = [name for name in rows[0] if name != "version"]
+        stored = {row.id: row for row in session.exec(select(*(table.c[name] for name in columns))).all()}
+        return [row for row in rows
+                if row["id"] not in stored or any(getattr(stored[row["id"]], name) != row[name] for name in columns)]
 
-            for act in self.assets_data["acts"]:
-                act = Act(
-                    id = act["id"],
-                    parent_id=act["parentId"] if act['parentId'] != "00000000-0000-0000-0000-000000000000" else None,
-                    type = act["type"],
-                    name = act["name"],
-                    localized_names=str(act["localizedNames"]),
-                    is_active=act["isActive"],
-                )
-                session.merge(act)
+    def applied_version(self, session):
+        return session.exec(
+            select(ContentVersion.version).order_by(ContentVersion.applied_at.desc()).limit(1)
+        ).first()
 
-            tiers = [
-                (27, "Radiant"),
-                (26, "Immmortal 3"),
-                (25, "Immmortal 2"),
-                (24, "Immmortal 1"),
-                (23, "Radiant 3"),
-                (22, "Radiant 2"),
-                (21, "Radiant 1"),
-                (20, "Diamond 3"),
-                (19, "Diamond 2"),
-                (18, "Diamond 1"),
-                (17, "Platinum 3"),
-                (16, "Platinum 2"),
-                (15, "Platinum 1"),
-                (14, "Gold 3"),
-                (13, "Gold 2"),
-                (12, "Gold 1"),
-                (11, "Silver 3"),
-                (10, "Silver 2"),
-                (9, "Silver 1"),
-                (8, "Bronze 3"),
-                (7, "Bronze 2"),
-                (6, "Bronze 1"),
-                (5, "Iron 3"),
-                (4, "Iron 2"),
-                (3, "Iron 1"),
-                (2, "Unranked"),
-                (1, "Unknown"),
-                (0, "Unrated"),
-            ]
-            for tier in tiers:
-                tier_obj = Tier(
-                    id = tier[0],
-                    name = tier[1]
-                )
-                session.merge(tier_obj)
-            session.commit()
\ No newline at end of file
+    def save(self, force=False):
+        """
+        Returns the number of changed rows per table, or None when the version was already applied.
+        """
+        with open_session(self.engine) as session:
+            if not force and self.applied_version(session) == self.version:
+                return None
+            changed = {}
+            for model, rows in self.to_rows().items():
+                changed[model] = self._changed_rows(session, model, rows)
+                upsert(session, model, changed[model])
+            upsert(session, ContentVersion, [dict(version=self.version, applied_at=datetime.now(),
+                                                  rows_changed=sum(map(len, changed.values())))])
+            session.commit()
+        return {model.__tablename__: len(rows) for model, rows in changed.items()}
@@ -0,0 +1,78 @@
+"""
+Brings an existing database up to the tables, columns and indexes declared in models.py.
+The crawler runs it at start-up; it can also be run on its own before a crawl:
+
+    python migrations.py
+"""
+import os
+import time
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel
+import models  # noqa: F401 registers the tables
+from crawl_stats import backfill_player_crawl_stats
+from cube import backfill_agent_map_stats
+
+# Run once, right after the table is created, to fill it from data that is already there
+BACKFILLS = {
+    "player_crawl_stats": backfill_player_crawl_stats,
+    "agent_map_stats": backfill_agent_map_stats,
+}
+
+def add_missing_columns(engine):
+    """
+    Adds nullable columns that were declared on a model after its table was created.
+    Returns the "table.column" names that were added.
+    """
+    added = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable:
+                    print(f"Column {table.name}.{column.name} is NOT NULL and has to be added by hand")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def create_indexes(engine):
+    """
+    Creates every index declared on the models that the database does not have yet.
+    Returns the names of the created indexes.
+    """
+    created = []
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            time_ = time.perf_counter()
+            index.create(engine, checkfirst=True)
+            print(f"Created index {index.name} in {time.perf_counter() - time_:.1f}s")
+            created.append(index.name)
+    return created
+
+def migrate(engine):
+    existing_tables = set(inspect(engine).get_table_names())
+    SQLModel.metadata.create_all(engine)
+    backfilled = []
+    for table, backfill in BACKFILLS.items():
+        if table not in existing_tables:
+            backfill(engine)
+            backfilled.append(table)
+    return {"columns": add_missing_columns(engine), "indexes": create_indexes(engine), "backfilled": backfilled}
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from db import create_db_engine
+
+    load_dotenv()
+    print(migrate(create_db_engine(os.getenv("DATABASE_URL"))))
@@ -1,4 +1,5 @@
 from sqlmodel import Field, SQLModel
+from sqlalchemy import Index
 from datetime import datetime
 
 class Equipment(SQLModel, table=True):
@@ -92,12 +93,15 @@ class Match(SQLModel,table=True):
     """
     __tablename__ = "match"
     __henrik_schema__ = "v4_match"
+    __table_args__ = (
+        Index("ix_match_queue_id_map_id", "queue_id", "map_id"),
+    )
 
     id : str = Field(primary_key=True)
     map_id : str = Field(foreign_key="map.id")
     game_version : str
     game_length_in_ms : int
-    started_at : datetime
+    started_at : datetime = Field(index=True)
     is_completed : bool
     queue_id : str = Field(foreign_key="queue.id")
     season_id : str = Field(foreign_key="act.id")
@@ -119,7 +123,7 @@ class Leaderboard(SQLModel, table=True):
     title : str
     is_banned : bool
     is_anonymized : bool
-    puuid : str | None = Field(foreign_key="player.puuid")
+    puuid : str | None = Field(foreign_key="player.puuid", index=True)
     leaderboard_rank : int
     tier : int # Equivalent to tier_id max 27 min 0 (unrated to radiant)
     rr : int
@@ -131,12 +135,16 @@ class MatchPlayers(SQLModel, table=True):
     Grain is one row per player per match.
     """
     __tablename__ = "match_players"
+    __table_args__ = (
+        # The primary key leads with match_id; per-player lookups and match counts need this one
+        Index("ix_match_players_player_puuid_match_id", "player_puuid", "match_id"),
+    )
     match_id : str = Field(foreign_key="match.id", primary_key=True)
     player_puuid : str | None = Field(foreign_key="player.puuid", primary_key=True)
     team_id : str | None
     platform : str
     party_id : str | None
-    agent_id : str = Field(foreign_key="agent.id")
+    agent_id : str = Field(foreign_key="agent.id", index=True)
 
     stats_score : int
     stats_kills : int
@@ -312,6 +320,9 @@ class MatchRoundKills(SQLModel, table=True):
     Answers the question: Who killed whom in a round?
     """
     __tablename__ = "match_round_kills"
+    __table_args__ = (
+        Index("ix_match_round_kills_match_id_round_num", "match_id", "round_num"),
+    )
 
     id: int | None = Field(default=None, primary_key=True)
 
@@ -322,11 +333,11 @@ class MatchRoundKills(SQLModel, table=True):
     time_in_match_in_ms : int
 
     # Player puuid may be None, if the player is anonymous.  IF player is anonymous, use agent_id instead
-    killer_puuid : str = Field(foreign_key="player.puuid", )
+    killer_puuid : str = Field(foreign_key="player.puuid", index=True)
     killer_team : str
     killer_agent_id : str = Field(foreign_key="agent.id")
 
-    victim_puuid : str = Field(foreign_key="player.puuid", )
+    victim_puuid : str = Field(foreign_key="player.puuid", index=True)
     victim_team : str
     victim_agent_id : str = Field(foreign_key="agent.id")
 
@@ -343,6 +354,9 @@ class MatchRoundKillsPlayerLocations(SQLModel, table=True):
     Answers the question: Where was the player when a kill happened?
     """
     __tablename__ = "match_round_kills_player_locations"
+    __table_args__ = (
+        Index("ix_match_round_kills_player_locations_match_id_round_num", "match_id", "round_num"),
+    )
 
     id: int | None = Field(default=None, primary_key=True)
 
@@ -372,6 +386,9 @@ class MatchRoundAssists(SQLModel, table=True):
     Answers the question: Who assisted whom in a round?
     """
     __tablename__ = "match_round_assists"
+    __table_args__ = (
+        Index("ix_match_round_assists_match_id_round_num", "match_id", "round_num"),
+    )
     
     id: int | None = Field(default=None, primary_key=True)
     
@@ -392,6 +409,84 @@ class MatchRoundAssists(SQLModel, table=True):
     victim_agent_id : str = Field(foreign_key="agent.id")
 
 
+class ContentVersion(SQLModel, table=True):
+    """
+    Grain is one row per content (assets) version applied to the database.
+    The most recently applied one lets the asset sync skip a payload it already has.
+    """
+    __tablename__ = "content_version"
+
+    version : str = Field(primary_key=True)
+    applied_at : datetime
+    rows_changed : int
+
+class PlayerCrawlStats(SQLModel, table=True):
+    """
+    Grain is one row per player. Running totals kept in the same transaction as match
+    ingestion, so picking players to crawl never has to aggregate match_players.
+    """
+    __tablename__ = "player_crawl_stats"
+    __table_args__ = (
+        Index("ix_player_crawl_stats_match_count_puuid", "match_count", "puuid"),
+    )
+
+    puuid : str = Field(foreign_key="player.puuid", primary_key=True)
+    match_count : int = Field(default=0)
+    last_match_at : datetime | None = Field(default=None)
+    last_crawled_at : datetime | None = Field(default=None)
+
+class AgentMapStats(SQLModel, table=True):
+    """
+    Grain is one row per (agent, map, queue, tier bucket) cell of cube.AggregateCube. Count, mean
+    and scatter matrix of the cell's feature rows (scoring.FEATURE_COLUMNS), kept in the same
+    transaction as match ingestion, so rankings never have to read the matches or the dataset.
+    """
+    __tablename__ = "agent_map_stats"
+
+    agent_id : str = Field(primary_key=True)
+    map_id : str = Field(primary_key=True)
+    queue_id : str = Field(primary_key=True)
+    tier_bucket : str = Field(primary_key=True)
+    count : int = Field(default=0)
+    mean : bytes # float64 mean of every feature
+    scatter : bytes # float64 upper triangle of the scatter matrix, row by row
+
+class CrawlFrontier(SQLModel, table=True):
+    """
+    Grain is one row per player queued for match history crawling.
+    Persists the crawl queue so a restarted crawler resumes where it stopped.
+    """
+    __tablename__ = "crawl_frontier"
+    __table_args__ = (
+        # Pending players in claim order, optionally per region/platform
+        Index("ix_crawl_frontier_status_added_at", "status", "added_at"),
+        Index("ix_crawl_frontier_region_platform_status_added_at", "region", "platform", "status", "added_at"),
+    )
+
+    puuid : str = Field(primary_key=True)
+    region : str
+    platform : str
+    status : str = Field(default="pending") # values: pending, in_progress, done, failed
+    pages_fetched : int = Field(default=0)
+    attempts : int = Field(default=0)
+    added_at : datetime
+    claimed_at : datetime | None = Field(default=None)
+    last_crawled_at : datetime | None = Field(default=None)
+    # High-water mark: the newest match ingested for the player, where incremental crawls stop paging
+    newest_match_id : str | None = Field(default=None)
+    newest_match_at : datetime | None = Field(default=None)
+
+class ExportedMatch(SQLModel, table=True):
+    """
+    Grain is one row per match written to the Parquet analysis dataset.
+    Lets an export refresh only process matches ingested since the last one.
+    """
+    __tablename__ = "exported_match"
+
+    match_id : str = Field(foreign_key="match.id", primary_key=True)
+    exported_at : datetime
+    part : str # Parquet file name template the match's rows were written under
+
 # class MatchRoundKills(SQLModel, table=True):
 #     """
 #     Grain is one row per kill per round per match.
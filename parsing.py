@@ -0,0 +1,257 @@
+"""
+Parse stage of match ingestion: a v4 match payload in, plain rows per table out.
+Nothing here touches a session or an engine, so parsing can run in a ProcessPoolExecutor
+while the write stage stays in the crawler process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from models import (Player,
+                    Match,
+                    MatchPlayers,
+                    Equipment,
+                    Armor,
+                    Queue,
+                    MatchTeams,
+                    MatchRounds,
+                    MatchRoundPlant,
+                    MatchRoundDefuse,
+                    MatchRoundPlayerLocations,
+                    MatchRoundPlayerStats,
+                    MatchRoundPlayerStatsDamageEvents,
+                    MatchRoundKills,
+                    MatchRoundKillsPlayerLocations,
+                    MatchRoundAssists,
+)
+from utils import flatten_dict
+from db import model_row
+
+# Parents before children, so foreign keys resolve when each table is written in one statement.
+TABLE_ORDER = [
+    Queue,
+    Match,
+    Player,
+    MatchPlayers,
+    MatchTeams,
+    Equipment,
+    Armor,
+    MatchRounds,
+    MatchRoundPlant,
+    MatchRoundDefuse,
+    MatchRoundPlayerLocations,
+    MatchRoundPlayerStats,
+    MatchRoundPlayerStatsDamageEvents,
+    MatchRoundKills,
+    MatchRoundAssists,
+    MatchRoundKillsPlayerLocations,
+]
+
+class ParsedMatch:
+    """
+    The rows of one match as tuples, grouped per table by column set. Tuples keep the
+    payload small when it crosses a process boundary.
+    """
+    __slots__ = ("match_id", "tables")
+
+    def __init__(self, match_id, tables):
+        self.match_id = match_id
+        # model -> [(columns, [row tuple, ...]), ...]
+        self.tables = tables
+
+    @classmethod
+    def from_rows(cls, match_id, rows_by_model):
+        tables = {}
+        for model, rows in rows_by_model.items():
+            groups = {}
+            for row in rows:
+                groups.setdefault(tuple(row), []).append(tuple(row.values()))
+            tables[model] = list(groups.items())
+        return cls(match_id, tables)
+
+    def rows(self, model):
+        return [dict(zip(columns, row)) for columns, rows in self.tables.get(model, ()) for row in rows]
+
+    def row_count(self, models=None):
+        return sum(len(rows) for model, groups in self.tables.items() if models is None or model in models
+                   for _, rows in groups)
+
+class MatchParser:
+    "API reference: v4_match"
+    def __init__(self, data):
+        self.match_metadata :dict = data['metadata']
+        self.platform :str = data['metadata']['platform']
+        self.region :str = data['metadata']['region']
+
+        self.match_id :str = data['metadata']['match_id']
+
+        self.match_players :dict = data['players']
+        self.player_agent_mappings = {match_player["puuid"]: match_player["agent"]["id"] for match_player in data['players']}
+        
+        self.match_observers :dict = data['observers']
+        self.match_coaches :dict = data['coaches']
+        self.match_teams :dict = data['teams']
+        self.match_rounds :dict = data['rounds']
+        self.match_kills :dict = data['kills']
+
+    def _get_player_agent(self, player_puuid):
+        return self.player_agent_mappings.get(player_puuid, "Unknown")
+
+    def _kill_metadata(self, kill):
+        return {
+            "round_num": kill['round'],
+            "killer_puuid": kill['killer']['puuid'],
+            "killer_team": kill['killer']['team'],
+            "killer_agent_id": self._get_player_agent(kill['killer']['puuid']),
+            "victim_puuid": kill['victim']['puuid'],
+            "victim_team": kill['victim']['team'],
+            "victim_agent_id": self._get_player_agent(kill['victim']['puuid']),
+        }
+
+    def _rows_round(self, round):
+        rows = []
+        round_flat = flatten_dict(round)
+        round_flat['round_num'] = round_flat.pop('id')
+        rows.append((MatchRounds, model_row(MatchRounds, {"match_id": self.match_id, **round_flat})))
+
+        for key, model, event in (("plant", MatchRoundPlant, "PLANT"), ("defuse", MatchRoundDefuse, "DEFUSE")):
+            if not round[key]:
+                continue
+            rows.append((model, model_row(model, {
+                "match_id": self.match_id,
+                "round_num": round['id'],
+                "agent_id": self._get_player_agent(round[key]['player']['puuid']),
+                **flatten_dict(round[key]),
+            })))
+            for player_location in round[key]['player_locations']:
+                rows.append((MatchRoundPlayerLocations, model_row(MatchRoundPlayerLocations, {
+                    "match_id": self.match_id,
+                    "round_num": round['id'],
+                    "agent_id": self._get_player_agent(player_location['player']['puuid']),
+                    **flatten_dict(player_location),
+                    "event_type": event,
+                })))
+
+        for player_stat in round['stats']:
+            weapon = player_stat['economy']['weapon']
+            if weapon is not None:
+                rows.append((Equipment, model_row(Equipment, {"id": weapon['id'], "name": weapon['name'], "type": weapon['type']})))
+            armor = player_stat['economy']['armor']
+            if armor is not None:
+                rows.append((Armor, model_row(Armor, {"id": armor['id'], "name": armor['name']})))
+
+            player_puuid = player_stat['player']['puuid']
+            rows.append((MatchRoundPlayerStats, model_row(MatchRoundPlayerStats, {
+                "match_id": self.match_id,
+                "round_num": round['id'],
+                "agent_id": self._get_player_agent(player_puuid),
+                **flatten_dict(player_stat),
+            })))
+            _metadata = {
+                "round_num": round['id'],
+                "player_puuid": player_puuid,
+                "player_team": player_stat['player']['team'],
+                "player_agent_id": self._get_player_agent(player_puuid),
+            }
+            for damage_event in player_stat['damage_events']:
+                damage_event_flat = flatten_dict(damage_event)
+                damage_event_flat['receiver_puuid'] = damage_event_flat.pop('player_puuid')
+                damage_event_flat['receiver_team'] = damage_event_flat.pop('player_team')
+                damage_event_flat['receiver_agent_id'] = self._get_player_agent(damage_event_flat['receiver_puuid'])
+                rows.append((MatchRoundPlayerStatsDamageEvents, model_row(MatchRoundPlayerStatsDamageEvents, {
+                    "match_id": self.match_id,
+                    **damage_event_flat,
+                    **_metadata,
+                })))
+        return rows
+
+    def _rows_kill(self, kill):
+        rows = []
+        if kill['weapon']['id'] is not None:
+            rows.append((Equipment, model_row(Equipment, {
+                "id": kill['weapon']['id'], "name": kill['weapon']['name'], "type": kill['weapon']['type'],
+            })))
+        for role in ("killer", "victim"):
+            rows.append((Player, model_row(Player, {
+                "puuid": kill[role]['puuid'],
+                "name": kill[role]['name'],
+                "tag": kill[role]['tag'],
+                "primary_platform": self.platform,
+                "primary_region": self.region,
+            })))
+
+        _metadata = self._kill_metadata(kill)
+        for assist in kill['assistants']:
+            assists_flat = flatten_dict(assist)
+            assists_flat['assistant_puuid'] = assists_flat.pop('puuid')
+            assists_flat['assistant_team'] = assists_flat.pop('team')
+            assists_flat['assistant_agent_id'] = self._get_player_agent(assists_flat['assistant_puuid'])
+            rows.append((MatchRoundAssists, model_row(MatchRoundAssists, {"match_id": self.match_id, **assists_flat, **_metadata})))
+        for player_location in kill['player_locations']:
+            rows.append((MatchRoundKillsPlayerLocations, model_row(MatchRoundKillsPlayerLocations, {
+                "match_id": self.match_id,
+                "player_agent_id": self._get_player_agent(player_location['player']['puuid']),
+                **flatten_dict(player_location),
+                **_metadata,
+            })))
+
+        kill_flat = flatten_dict(kill)
+        kill_flat['round_num'] = kill_flat.pop('round')
+        rows.append((MatchRoundKills, model_row(MatchRoundKills, {
+            "match_id": self.match_id,
+            "killer_agent_id": self._get_player_agent(kill['killer']['puuid']),
+            "victim_agent_id": self._get_player_agent(kill['victim']['puuid']),
+            **kill_flat,
+        })))
+        return rows
+
+    def to_rows(self):
+        """
+        Plain row dicts for every table this match touches, grouped by model in foreign key order.
+        """
+        tables = {model: [] for model in TABLE_ORDER}
+        tables[Queue].append(model_row(Queue, flatten_dict(self.match_metadata['queue'])))
+        tables[Match].append(model_row(Match, {"id": self.match_id, **flatten_dict(self.match_metadata)}))
+
+        for match_player in self.match_players:
+            tables[Player].append(model_row(Player, {
+                "puuid": match_player["puuid"],
+                "name": match_player["name"],
+                "tag": match_player["tag"],
+                "primary_region": self.region,
+                "primary_platform": self.platform,
+            }))
+            match_player_flat = flatten_dict(match_player)
+            match_player_flat['player_puuid'] = match_player_flat.pop('puuid')
+            tables[MatchPlayers].append(model_row(MatchPlayers, {"match_id": self.match_id, **match_player_flat}))
+
+        for team in self.match_teams:
+            tables[MatchTeams].append(model_row(MatchTeams, {"match_id": self.match_id, **flatten_dict(team)}))
+
+        for round in self.match_rounds:
+            for model, row in self._rows_round(round):
+                tables[model].append(row)
+        for kill in self.match_kills:
+            for model, row in self._rows_kill(kill):
+                tables[model].append(row)
+        return tables
+
+
+    def parse(self):
+        return ParsedMatch.from_rows(self.match_id, self.to_rows())
+
+def parse_match(data):
+    """
+    Parses one match payload. Module level so a ProcessPoolExecutor can pickle it.
+    """
+    return MatchParser(data).parse()
+
+def parse_matches(matches, executor=None, chunksize=4):
+    """
+    Parses many match payloads, in executor when one is given (e.g. a ProcessPoolExecutor)
+    or in this process otherwise. Yields ParsedMatch objects in input order.
+    """
+    if executor is None:
+        yield from map(parse_match, matches)
+    else:
+        yield from executor.map(parse_match, matches, chunksize=chunksize)
+
+def make_parse_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers)
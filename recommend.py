@@ -0,0 +1,243 @@
+"""
+Personalized agent recommendations. A player's profile is the mean of their component scores over
+their competitive matches; the players with the nearest profiles are found in an index built from
+the exported dataset, and the agents are ranked by how those players scored with them on the map,
+by the notebook's total_pc_score (the sum of the component scores).
+
+    python recommend.py build --dataset output/dataset --model output/pca.npz --output output/recommend.npz
+    python recommend.py recommend --index output/recommend.npz --model output/pca.npz --player <puuid> --map Ascent
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from models import Match, MatchPlayers
+from scoring import PCA_QUEUES, PcaModel, feature_matrix
+
+KEY_COLUMNS = ["player_puuid", "agent_id", "map_id"]
+
+def _aggregate(frame, component_names):
+    # Per (player, agent, map): matches, and sums of the component scores and of their total
+    frame = frame.assign(total_pc_score=frame[component_names].sum(axis=1), matches=1)
+    return frame.groupby(KEY_COLUMNS, observed=True)[component_names + ["total_pc_score", "matches"]].sum()
+
+def player_profile(engine, model, player_puuid, queues=PCA_QUEUES):
+    """
+    The mean component scores of a player's matches in queues, read from match_players and the
+    tables export.py joins, with the number of matches they cover; (None, 0) without any.
+    """
+    from export import read_feature_chunk
+
+    with engine.connect() as connection:
+        match_ids = connection.execute(
+            select(MatchPlayers.match_id)
+                .join(Match, Match.id == MatchPlayers.match_id)
+                .where(MatchPlayers.player_puuid == player_puuid, Match.queue_id.in_(queues))
+        ).scalars().all()
+        table = read_feature_chunk(connection, match_ids) if match_ids else None
+    if table is None:
+        return None, 0
+    frame = table.to_pandas()
+    features = feature_matrix(frame[frame["player_puuid"] == player_puuid], model.feature_names)
+    features = features[~np.isnan(features).any(axis=1)]
+    if not len(features):
+        return None, 0
+    return model.project(features).mean(axis=0), len(features)
+
+class RecommendationIndex:
+    """
+    Player profiles for nearest-neighbour search, and every player's match count and score sums
+    per agent and map, stored by player (entries offsets[i]:offsets[i + 1] are those of player i)
+    so the entries of a set of neighbours are gathered with one index array. Neighbours are found
+    by brute force in NumPy, or with a scikit-learn BallTree when method is "ball_tree".
+    """
+    def __init__(self, player_puuids, profiles, matches, offsets, entry_agents, entry_maps, entry_matches,
+                 entry_scores, agent_ids, agent_names, map_ids, map_names, component_names, method="brute"):
+        self.player_puuids = np.asarray(player_puuids, dtype=str)
+        self.profiles = np.ascontiguousarray(profiles, dtype=np.float64)
+        self.matches = np.asarray(matches, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.entry_agents = np.asarray(entry_agents, dtype=np.int32)
+        self.entry_maps = np.asarray(entry_maps, dtype=np.int32)
+        self.entry_matches = np.asarray(entry_matches, dtype=np.int64)
+        self.entry_scores = np.asarray(entry_scores, dtype=np.float64)
+        self.agent_ids, self.agent_names = list(agent_ids), list(agent_names)
+        self.map_ids, self.map_names = list(map_ids), list(map_names)
+        self.component_names = list(component_names)
+        self.method = method
+        self._players = {puuid: i for i, puuid in enumerate(self.player_puuids.tolist())}
+        self._norms = np.einsum("ij,ij->i", self.profiles, self.profiles)
+        self._tree = None
+        if method == "ball_tree":
+            from sklearn.neighbors import BallTree
+
+            self._tree = BallTree(self.profiles)
+        elif method != "brute":
+            raise ValueError(f"Unknown neighbour search method {method!r}")
+
+    @classmethod
+    def from_sums(cls, sums, component_names, agent_names=None, map_names=None, method="brute"):
+        """
+        Builds the index from per (player_puuid, agent_id, map_id) sums of component scores,
+        total_pc_score and matches, as _aggregate returns them.
+        """
+        sums = sums.reset_index()
+        for column in KEY_COLUMNS:
+            sums[column] = sums[column].astype(str)
+        sums = sums.sort_values(KEY_COLUMNS, ignore_index=True)
+        players, player_codes = np.unique(sums["player_puuid"].to_numpy(), return_inverse=True)
+        agents, agent_codes = np.unique(sums["agent_id"].to_numpy(), return_inverse=True)
+        maps, map_codes = np.unique(sums["map_id"].to_numpy(), return_inverse=True)
+        matches = np.bincount(player_codes, weights=sums["matches"], minlength=len(players)).astype(np.int64)
+        profiles = np.column_stack([np.bincount(player_codes, weights=sums[name], minlength=len(players))
+                                    for name in component_names]) / matches[:, None]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(player_codes, minlength=len(players)))])
+        agent_names, map_names = agent_names or {}, map_names or {}
+        return cls(players, profiles, matches, offsets, agent_codes, map_codes, sums["matches"],
+                   sums["total_pc_score"] / sums["matches"], agents, [agent_names.get(agent, agent) for agent in agents],
+                   maps, [map_names.get(map_, map_) for map_ in maps], component_names, method=method)
+
+    @classmethod
+    def build(cls, output_dir, model, queues=PCA_QUEUES, batch_size=65_536, method="brute"):
+        """
+        Builds the index from the dataset in output_dir (written by export.py), streaming it
+        batch_size rows at a time and scoring every match with model. Matches with a missing
+        feature, agent or map are skipped, as the notebooks drop them.
+        """
+        from export import dataset_files, read_batches
+
+        columns = list(dict.fromkeys(model.feature_names + KEY_COLUMNS + ["agent_name", "map_name", "queue_id"]))
+        parts, agent_names, map_names = [], {}, {}
+        for batch in read_batches(output_dir, dataset_files(output_dir), columns, batch_size=batch_size):
+            frame = batch.to_pandas()
+            frame = frame[frame["queue_id"].astype(str).isin(queues)]
+            features = feature_matrix(frame, model.feature_names)
+            complete = ~np.isnan(features).any(axis=1) & frame["agent_id"].notna().to_numpy() & frame["map_id"].notna().to_numpy()
+            frame = frame[complete]
+            scores = pd.DataFrame(model.project(features[complete]), columns=model.component_names, index=frame.index)
+            parts.append(_aggregate(pd.concat([frame[KEY_COLUMNS].astype(str), scores], axis=1), model.component_names))
+            agent_names.update(zip(frame["agent_id"].astype(str), frame["agent_name"].astype(str)))
+            map_names.update(zip(frame["map_id"].astype(str), frame["map_name"].astype(str)))
+        if not parts:
+            raise ValueError(f"No {', '.join(queues)} matches in {output_dir}")
+        sums = pd.concat(parts).groupby(level=KEY_COLUMNS).sum()
+        return cls.from_sums(sums, model.component_names, agent_names, map_names, method=method)
+
+    def profile(self, player_puuid):
+        """
+        The stored profile of a player and its match count, or (None, 0) for a player not indexed.
+        """
+        i = self._players.get(player_puuid)
+        return (None, 0) if i is None else (self.profiles[i], int(self.matches[i]))
+
+    def neighbours(self, profile, k=50):
+        """
+        Positions of the k players with profiles nearest to profile, nearest first, and their distances.
+        """
+        profile = np.asarray(profile, dtype=np.float64)
+        k = min(k, len(self.profiles))
+        if self._tree is not None:
+            distances, positions = self._tree.query(profile[None], k=k)
+            return positions[0], distances[0]
+        squared = self._norms - 2 * (self.profiles @ profile) + profile @ profile
+        positions = np.argpartition(squared, k - 1)[:k] if k < len(squared) else np.arange(len(squared))
+        positions = positions[np.argsort(squared[positions], kind="stable")]
+        return positions, np.sqrt(np.maximum(squared[positions], 0))
+
+    def map_position(self, map_):
+        """
+        Position of a map given by id or name.
+        """
+        for names in (self.map_ids, self.map_names):
+            if map_ in names:
+                return names.index(map_)
+        raise KeyError(f"Map {map_!r} is not in the index")
+
+    def recommend(self, profile, map_, k=50, top=5, min_matches=5, exclude=None):
+        """
+        Agents ranked for map_ by the mean total_pc_score of the matches the k players nearest to
+        profile played with them there, as a DataFrame with the matches and players behind each
+        score. Agents with fewer than min_matches such matches are left out, and so is the player
+        exclude (a puuid), so a player indexed already is not their own neighbour.
+        """
+        excluded = self._players.get(exclude) if exclude is not None else None
+        positions, _ = self.neighbours(profile, k + (excluded is not None))
+        positions = positions[positions != excluded][:k]
+
+        starts, lengths = self.offsets[positions], self.offsets[positions + 1] - self.offsets[positions]
+        entries = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths) + np.arange(lengths.sum())
+        entries = entries[self.entry_maps[entries] == self.map_position(map_)]
+        agents, matches = self.entry_agents[entries], self.entry_matches[entries]
+        agent_matches = np.bincount(agents, weights=matches, minlength=len(self.agent_ids))
+        agent_scores = np.bincount(agents, weights=matches * self.entry_scores[entries], minlength=len(self.agent_ids))
+        agent_players = np.bincount(agents, minlength=len(self.agent_ids))
+
+        ranked = np.flatnonzero(agent_matches >= max(min_matches, 1))
+        scores = agent_scores[ranked] / agent_matches[ranked]
+        order = np.argsort(-scores, kind="stable")[:top]
+        ranked, scores = ranked[order], scores[order]
+        return pd.DataFrame({"agent_id": [self.agent_ids[i] for i in ranked],
+                             "agent_name": [self.agent_names[i] for i in ranked],
+                             "score": scores, "matches": agent_matches[ranked].astype(np.int64),
+                             "players": agent_players[ranked]})
+
+    def save(self, path):
+        np.savez_compressed(path, player_puuids=self.player_puuids, profiles=self.profiles, matches=self.matches,
+                            offsets=self.offsets, entry_agents=self.entry_agents, entry_maps=self.entry_maps,
+                            entry_matches=self.entry_matches, entry_scores=self.entry_scores,
+                            agent_ids=np.array(self.agent_ids, dtype=str), agent_names=np.array(self.agent_names, dtype=str),
+                            map_ids=np.array(self.map_ids, dtype=str), map_names=np.array(self.map_names, dtype=str),
+                            component_names=np.array(self.component_names, dtype=str))
+
+    @classmethod
+    def load(cls, path, method="brute"):
+        with np.load(path) as state:
+            return cls(*(state[name] for name in ("player_puuids", "profiles", "matches", "offsets", "entry_agents",
+                                                  "entry_maps", "entry_matches", "entry_scores")),
+                       *(state[name].tolist() for name in ("agent_ids", "agent_names", "map_ids", "map_names",
+                                                           "component_names")),
+                       method=method)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the index from an exported dataset")
+    build_parser.add_argument("--dataset", default="output/dataset")
+    build_parser.add_argument("--model", default="output/pca.npz")
+    build_parser.add_argument("--output", default="output/recommend.npz")
+    recommend_parser = subparsers.add_parser("recommend", help="recommend agents for a player on a map")
+    recommend_parser.add_argument("--index", default="output/recommend.npz")
+    recommend_parser.add_argument("--model", default="output/pca.npz")
+    recommend_parser.add_argument("--player", required=True)
+    recommend_parser.add_argument("--map", required=True, help="map id or name")
+    recommend_parser.add_argument("--neighbours", type=int, default=50)
+    recommend_parser.add_argument("--top", type=int, default=5)
+    recommend_parser.add_argument("--min-matches", type=int, default=5, help="neighbour matches an agent needs on the map")
+    recommend_parser.add_argument("--method", choices=["brute", "ball_tree"], default="brute")
+    recommend_parser.add_argument("--indexed-profile", action="store_true",
+                                  help="use the player's profile stored in the index instead of reading their matches")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = RecommendationIndex.build(args.dataset, PcaModel.load(args.model))
+        index.save(args.output)
+        print(f"Indexed {len(index.player_puuids)} players over {index.matches.sum()} matches, saved to {args.output}")
+    else:
+        index = RecommendationIndex.load(args.index, method=args.method)
+        if args.indexed_profile:
+            profile, matches = index.profile(args.player)
+        else:
+            from dotenv import load_dotenv
+            from db import create_db_engine
+
+            load_dotenv()
+            profile, matches = player_profile(create_db_engine(os.getenv("DATABASE_URL")), PcaModel.load(args.model), args.player)
+        if profile is None:
+            raise SystemExit(f"No competitive matches of player {args.player}")
+        recommendations = index.recommend(profile, args.map, k=args.neighbours, top=args.top,
+                                          min_matches=args.min_matches, exclude=args.player)
+        print(json.dumps({"player_puuid": args.player, "matches": matches, "map": args.map,
+                          "profile": dict(zip(index.component_names, profile.round(4).tolist())),
+                          "agents": recommendations.round(4).to_dict("records")}, indent=2))
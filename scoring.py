@@ -0,0 +1,285 @@
+"""
+The StandardScaler + PCA of the analysis notebooks, fitted once and kept as a small .npz artifact,
+so a player or a match can be scored against the principal components without the notebooks.
+The incremental fit streams the exported dataset through running means and covariances instead,
+and later folds in only the files exported since, so the history never has to fit in memory.
+
+    python scoring.py fit --dataset output/dataset --output output/pca.npz
+    python scoring.py fit --incremental --state output/pca_state.npz --dataset output/dataset --output output/pca.npz
+    python scoring.py profile --model output/pca.npz --dataset output/dataset --player <puuid>
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# The 30 features the notebooks standardize and feed to the PCA, in their column order
+FEATURE_COLUMNS = [
+    "stats_score", "stats_kills", "stats_deaths", "stats_assists", "stats_headshots", "stats_bodyshots",
+    "stats_legshots", "stats_damage_dealt", "stats_damage_received", "ability_casts_grenade",
+    "ability_casts_ability1", "ability_casts_ability2", "ability_casts_ultimate", "tier_id", "account_level",
+    "economy_spent_overall", "economy_spent_average", "economy_loadout_value_overall",
+    "economy_loadout_value_average", "total_plants", "total_defuses", "rounds_won", "rounds_lost",
+    "total_rounds", "KDA Ratio", "ADR", "ACS", "Overall Ability Cast", "Win Ratio", "damage_per_kills",
+]
+
+# Names given to the components in analysis_for_technnical_report.ipynb
+COMPONENT_NAMES = [
+    "Combat Prowess", "Fragility Factor", "Utility-Based Teamwork", "Ability Focus",
+    "Calculated Objective Play", "Gunfire Support", "Objective-Focused Gunplay", "Player Progression",
+]
+
+# The notebooks scale the versus queues and run the PCA on competitive matches only
+SCALER_QUEUES = ["competitive", "premier", "unrated"]
+PCA_QUEUES = ["competitive"]
+
+def feature_matrix(frame, feature_names=FEATURE_COLUMNS):
+    """
+    The feature columns of frame as a float64 (rows, features) array, NULLs as NaN.
+    """
+    return np.column_stack([frame[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in feature_names])
+
+class PcaModel:
+    """
+    A fitted scaler and PCA folded into one affine map: scores = features @ weights + offset,
+    which is (features - mean) / scale - pca_mean, projected on the components. Only the
+    arrays are stored, so loading and scoring need NumPy alone.
+    """
+    def __init__(self, feature_names, mean, scale, pca_mean, components, explained_variance_ratio,
+                 component_names=None):
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.pca_mean = np.asarray(pca_mean, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.explained_variance_ratio = np.asarray(explained_variance_ratio, dtype=np.float64)
+        self.component_names = list(component_names or [f"PC{i}" for i in range(1, len(self.components) + 1)])
+        self.weights = np.ascontiguousarray((self.components / self.scale).T)
+        self.offset = -(self.mean / self.scale + self.pca_mean) @ self.components.T
+        self._positions = {name: i for i, name in enumerate(self.feature_names)}
+
+    @classmethod
+    def fit(cls, frame, n_components=8, pca_rows=None, feature_names=FEATURE_COLUMNS, component_names=COMPONENT_NAMES):
+        """
+        Fits the scaler on every row of frame without missing features and the PCA on the
+        subset of them selected by the boolean mask pca_rows (all of them by default).
+        """
+        from sklearn.decomposition import PCA
+        from sklearn.preprocessing import StandardScaler
+
+        features = feature_matrix(frame, feature_names)
+        complete = ~np.isnan(features).any(axis=1)
+        pca_rows = complete if pca_rows is None else complete & np.asarray(pca_rows, dtype=bool)
+        scaler = StandardScaler().fit(features[complete])
+        pca = PCA(n_components=n_components).fit(scaler.transform(features[pca_rows]))
+        return cls(feature_names, scaler.mean_, scaler.scale_, pca.mean_, pca.components_,
+                   pca.explained_variance_ratio_, list(component_names)[:n_components] if component_names else None)
+
+    def save(self, path):
+        np.savez_compressed(path, feature_names=np.array(self.feature_names), mean=self.mean, scale=self.scale,
+                            pca_mean=self.pca_mean, components=self.components,
+                            explained_variance_ratio=self.explained_variance_ratio,
+                            component_names=np.array(self.component_names))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as artifact:
+            return cls(artifact["feature_names"].tolist(), artifact["mean"], artifact["scale"], artifact["pca_mean"],
+                       artifact["components"], artifact["explained_variance_ratio"], artifact["component_names"].tolist())
+
+    def project(self, rows):
+        """
+        Component scores of a DataFrame of feature rows or a (rows, features) array, one row of
+        scores per input row. Rows with a missing feature score NaN.
+        """
+        features = feature_matrix(rows, self.feature_names) if isinstance(rows, pd.DataFrame) else np.asarray(rows, dtype=np.float64)
+        return features @ self.weights + self.offset
+
+    def project_one(self, features):
+        """
+        Component scores of a single row given as a mapping of feature name to value.
+        """
+        row = np.empty(len(self.feature_names))
+        for name, position in self._positions.items():
+            value = features[name]
+            row[position] = np.nan if value is None else value
+        return row @ self.weights + self.offset
+
+    def profile(self, features):
+        """
+        project_one as a {component name: score} dict, for display.
+        """
+        return dict(zip(self.component_names, self.project_one(features).tolist()))
+
+def merge_moments(count, mean, scatter, other_count, other_mean, other_scatter):
+    """
+    Count, mean and scatter matrix (sum of outer products of deviations from the mean) of the
+    union of two sets of rows, from those of each set, by the pairwise update of Chan et al.
+    Takes one set per side, or arrays of sets stacked along the first axis; every pair needs
+    rows on at least one side.
+    """
+    count, other_count = np.asarray(count), np.asarray(other_count)
+    total = count + other_count
+    delta = other_mean - mean
+    weight = np.asarray(count * other_count / total)[..., None, None]
+    scatter = scatter + other_scatter + delta[..., :, None] * delta[..., None, :] * weight
+    mean = mean + delta * np.asarray(other_count / total)[..., None]
+    return total, mean, scatter
+
+def fold_new_files(state, output_dir, columns, fold, batch_size=65_536):
+    """
+    Calls fold with a {column: NumPy array} dict for every batch_size rows of the dataset files of
+    output_dir (written by export.py) that are not in state.files yet, and adds them to it. When
+    a file of state.files is gone (export.py --rebuild rewrote the dataset), state.reset() is
+    called first and every file is read again. Returns the number of files read.
+    """
+    from export import dataset_files, read_batches
+
+    present = dataset_files(output_dir)
+    if state.files - present:
+        print(f"{len(state.files - present)} dataset files read before are gone, folding the dataset in again")
+        state.reset()
+    paths = present - state.files
+    if not paths:
+        return 0
+    for batch in read_batches(output_dir, paths, columns, batch_size=batch_size):
+        # Straight from Arrow to NumPy; NULLs come out as NaN or None
+        fold({name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns})
+    state.files.update(paths)
+    return len(paths)
+
+class CovarianceAccumulator:
+    """
+    Count, mean and scatter matrix of the rows seen so far. Batches are merged with
+    merge_moments, so the result equals that of one pass over all rows, whatever the batch sizes.
+    """
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.scatter = np.zeros((n_features, n_features))
+
+    def update(self, features):
+        """
+        Folds in a (rows, features) batch; rows with a missing feature are skipped.
+        """
+        features = features[~np.isnan(features).any(axis=1)]
+        if not len(features):
+            return
+        mean = features.mean(axis=0)
+        deviations = features - mean
+        self.count, self.mean, self.scatter = merge_moments(self.count, self.mean, self.scatter,
+                                                            len(features), mean, deviations.T @ deviations)
+
+    def covariance(self, ddof=1):
+        return self.scatter / (self.count - ddof)
+
+class IncrementalPcaFit:
+    """
+    Running statistics of an exported dataset from which the PcaModel of PcaModel.fit is computed
+    exactly: the feature means and variances of the SCALER_QUEUES rows (the scaler) and the means
+    and covariances of the PCA_QUEUES rows, rescaled and eigendecomposed. fold_dataset reads the
+    dataset through fold_new_files, so only files exported since the last call are read.
+    """
+    def __init__(self, feature_names=FEATURE_COLUMNS, scaler_queues=SCALER_QUEUES, pca_queues=PCA_QUEUES):
+        self.feature_names = list(feature_names)
+        self.scaler_queues = list(scaler_queues)
+        self.pca_queues = list(pca_queues)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets every row and file folded in so far.
+        """
+        self.scaler = CovarianceAccumulator(len(self.feature_names))
+        self.pca = CovarianceAccumulator(len(self.feature_names))
+        self.files = set()
+
+    def _fold(self, features, queues):
+        self.scaler.update(features[np.isin(queues, self.scaler_queues)])
+        self.pca.update(features[np.isin(queues, self.pca_queues)])
+
+    def update(self, frame):
+        """
+        Folds in a DataFrame of feature rows with their queue_id.
+        """
+        self._fold(feature_matrix(frame, self.feature_names), frame["queue_id"].astype(str).to_numpy())
+
+    def fold_dataset(self, output_dir, batch_size=65_536):
+        """
+        Folds in the dataset files of output_dir (written by export.py) not read before,
+        batch_size rows at a time. Returns the number of files read.
+        """
+        def fold(values):
+            features = np.column_stack([values[name].astype(np.float64) for name in self.feature_names])
+            self._fold(features, values["queue_id"])
+
+        return fold_new_files(self, output_dir, self.feature_names + ["queue_id"], fold, batch_size=batch_size)
+
+    def to_model(self, n_components=8, component_names=COMPONENT_NAMES):
+        scale = np.sqrt(self.scaler.covariance(ddof=0).diagonal())
+        scale = np.where(scale == 0, 1.0, scale)  # StandardScaler leaves constant features unscaled
+        eigenvalues, eigenvectors = np.linalg.eigh(self.pca.covariance() / np.outer(scale, scale))
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues, components = eigenvalues[order], eigenvectors[:, order].T
+        # scikit-learn's sign convention: the largest loading of every component is positive
+        largest = components[np.arange(len(components)), np.abs(components).argmax(axis=1)]
+        components *= np.sign(largest)[:, None]
+        return PcaModel(self.feature_names, self.scaler.mean, scale, (self.pca.mean - self.scaler.mean) / scale,
+                        components[:n_components], (eigenvalues / eigenvalues.sum())[:n_components],
+                        list(component_names)[:n_components] if component_names else None)
+
+    def save(self, path):
+        np.savez_compressed(path, feature_names=np.array(self.feature_names), scaler_queues=np.array(self.scaler_queues),
+                            pca_queues=np.array(self.pca_queues), files=np.array(sorted(self.files), dtype=str),
+                            **{f"{name}_{field}": np.asarray(getattr(getattr(self, name), field))
+                               for name in ("scaler", "pca") for field in ("count", "mean", "scatter")})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            fit = cls(state["feature_names"].tolist(), state["scaler_queues"].tolist(), state["pca_queues"].tolist())
+            for name in ("scaler", "pca"):
+                accumulator = getattr(fit, name)
+                accumulator.count = int(state[f"{name}_count"])
+                accumulator.mean = state[f"{name}_mean"]
+                accumulator.scatter = state[f"{name}_scatter"]
+            fit.files = set(state["files"].tolist())
+        return fit
+
+if __name__ == "__main__":
+    from export import read_features
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fit_parser = subparsers.add_parser("fit", help="fit the scaler and PCA on an exported dataset")
+    fit_parser.add_argument("--dataset", default="output/dataset")
+    fit_parser.add_argument("--output", default="output/pca.npz")
+    fit_parser.add_argument("--components", type=int, default=8)
+    fit_parser.add_argument("--incremental", action="store_true", help="stream the dataset, folding in only new files")
+    fit_parser.add_argument("--state", default="output/pca_state.npz", help="running statistics of --incremental")
+    profile_parser = subparsers.add_parser("profile", help="average component scores of a player's matches")
+    profile_parser.add_argument("--model", default="output/pca.npz")
+    profile_parser.add_argument("--dataset", default="output/dataset")
+    profile_parser.add_argument("--player", required=True)
+    args = parser.parse_args()
+
+    if args.command == "fit" and args.incremental:
+        fit = IncrementalPcaFit.load(args.state) if os.path.exists(args.state) else IncrementalPcaFit()
+        files = fit.fold_dataset(args.dataset)
+        fit.save(args.state)
+        model = fit.to_model(n_components=args.components)
+        model.save(args.output)
+        print(f"Folded in {files} new files, {fit.pca.count} rows in the PCA; explained variance "
+              f"{model.explained_variance_ratio.sum():.1%}, saved to {args.output}")
+    elif args.command == "fit":
+        frame = read_features(args.dataset, queues=SCALER_QUEUES)
+        model = PcaModel.fit(frame, n_components=args.components, pca_rows=frame["queue_id"].isin(PCA_QUEUES))
+        model.save(args.output)
+        print(f"Fitted on {len(frame)} rows; explained variance {model.explained_variance_ratio.sum():.1%}, saved to {args.output}")
+    else:
+        model = PcaModel.load(args.model)
+        matches = read_features(args.dataset, queues=PCA_QUEUES, players=[args.player])
+        scores = np.nanmean(model.project(matches), axis=0) if len(matches) else np.full(len(model.component_names), np.nan)
+        print(json.dumps({"player_puuid": args.player, "matches": len(matches),
+                          **dict(zip(model.component_names, scores.round(4).tolist()))}, indent=2))
@@ -1,5 +1,8 @@
 import time
-from httpx import HTTPTransport
+import asyncio
+import threading
+import httpx
+from httpx import HTTPTransport, AsyncHTTPTransport
 def flatten_dict(d, parent_key='', sep='_'):
     """
     Flatten a nested dictionary.
@@ -21,38 +24,184 @@ def flatten_dict(d, parent_key='', sep='_'):
             items.append((new_key, v))
     return dict(items)
 
+class KeyState:
+    """
+    Quota bookkeeping for a single API key, filled from the x-ratelimit-* response headers.
+    """
+    def __init__(self, key, rate_limit=60):
+        self.key = key
+        self.limit = rate_limit
+        self.remaining = None
+        self.reset_at = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.wait_time = 0.0
+        self.first_request_at = None
+
+    def budget(self, now):
+        if self.remaining is None or now >= self.reset_at:
+            return self.limit - self.in_flight
+        return self.remaining - self.in_flight
+
+class KeyScheduler:
+    """
+    Tracks remaining quota and reset time per API key and hands each request to the key
+    with the most remaining budget. A 429 only parks the key that received it.
+    """
+    def __init__(self, keys=(), rate_limit=60):
+        self.rate_limit = rate_limit
+        self.keys = {key: KeyState(key, rate_limit) for key in keys}
+        self._lock = threading.Lock()
+
+    def add_key(self, key):
+        with self._lock:
+            self.keys.setdefault(key, KeyState(key, self.rate_limit))
+
+    def acquire(self):
+        """
+        Returns (key, 0) for the key with the most budget left, or (None, seconds) with the
+        time until the earliest reset when every key is exhausted.
+        """
+        with self._lock:
+            now = time.time()
+            state = max(self.keys.values(), key=lambda state: state.budget(now))
+            if state.budget(now) > 0:
+                state.in_flight += 1
+                state.requests += 1
+                if state.first_request_at is None:
+                    state.first_request_at = now
+                return state.key, 0
+            earliest = min(self.keys.values(), key=lambda state: state.reset_at)
+            return None, max(earliest.reset_at - now, 0.05)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            earliest = min(self.keys.values(), key=lambda state: state.reset_at)
+            earliest.wait_time += seconds
+
+    def release(self, key, response):
+        with self._lock:
+            state = self.keys[key]
+            state.in_flight -= 1
+            now = time.time()
+            headers = response.headers
+            if "x-ratelimit-limit" in headers:
+                state.limit = int(headers["x-ratelimit-limit"])
+            if response.status_code == 429:
+                state.rate_limited += 1
+                reset = int(headers.get("x-ratelimit-reset", 60)) or 3
+                state.remaining = 0
+                state.reset_at = now + reset
+                print(f"Rate limited for {reset} with key {key}. Switching keys until reset...")
+            elif "x-ratelimit-remaining" in headers:
+                state.remaining = int(headers["x-ratelimit-remaining"])
+                state.limit = max(state.limit, state.remaining + 1)
+                state.reset_at = now + int(headers.get("x-ratelimit-reset", 0))
+
+    def requests_sent(self):
+        """
+        Requests sent over all keys since start-up; responses served from the HTTP cache are not counted.
+        """
+        with self._lock:
+            return sum(state.requests for state in self.keys.values())
+
+    def stats(self):
+        """
+        Per-key counters: requests sent, 429s received, seconds spent waiting for a reset,
+        and requests per minute since the key was first used.
+        """
+        now = time.time()
+        stats = {}
+        for key, state in self.keys.items():
+            elapsed = now - state.first_request_at if state.first_request_at else 0
+            stats[key] = {
+                "requests": state.requests,
+                "rate_limited": state.rate_limited,
+                "wait_time": round(state.wait_time, 2),
+                "remaining": state.remaining,
+                "limit": state.limit,
+                "requests_per_minute": round(state.requests / elapsed * 60, 2) if elapsed else 0.0,
+            }
+        return stats
+
+    def report(self):
+        for key, stats in self.stats().items():
+            print(f"Key {key[:8]}...: {stats['requests']} requests, {stats['rate_limited']} rate limited, "
+                  f"{stats['wait_time']}s waiting, {stats['requests_per_minute']}/{stats['limit']} requests per minute")
+
 class RateLimitTransport(HTTPTransport):
-    def __init__(self, rate_limit=60, *args, **kwargs):
+    """
+    Sets the Authorization header of every request from a KeyScheduler. When a key runs out
+    or gets a 429 the request moves to the next key; it only sleeps when every key is exhausted.
+    """
+    def __init__(self, scheduler=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.rate_limit = rate_limit
-        self.rate_limit_remaining = None
-        self.rate_limit_reset = None
+        self.scheduler = scheduler or KeyScheduler()
 
     def handle_request(self, request):
-        if self.rate_limit_remaining is not None and self.rate_limit_remaining <= 0:
-            sleep_time = self.rate_limit_reset - time.time()
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-
-        time_ = time.time()
-        response = super().handle_request(request)
-        
-        # print(f"Request took {time.time() - time_:.2f} seconds")    
-        if response.status_code == 200:
-            self.rate_limit_remaining = int(response.headers.get("x-ratelimit-remaining", 0))
-            self.rate_limit_reset = int(response.headers.get("x-ratelimit-reset", 0))
-            return response
-        elif response.status_code == 429:
-            sleep_time = int(response.headers.get("x-ratelimit-reset", 60))
-            if sleep_time == 0:
-                sleep_time = 3
-            print(f"Rate limited for {sleep_time} with key {request.headers['Authorization']}. Waiting for reset...")
-            time.sleep(sleep_time)
-            return self.handle_request(request)
-        else:
-            response.read()
-            raise Exception(f"HTTP error {response.status_code}. {response.text}")
+        if not self.scheduler.keys:
+            self.scheduler.add_key(request.headers["Authorization"])
+
+        while True:
+            key, wait = self.scheduler.acquire()
+            if key is None:
+                time.sleep(wait)
+                self.scheduler.record_wait(wait)
+                continue
+
+            request.headers["Authorization"] = key
+            try:
+                response = super().handle_request(request)
+            except Exception:
+                self.scheduler.release(key, httpx.Response(0))
+                raise
+            self.scheduler.release(key, response)
+
+            # 304 answers a conditional request from the HTTP cache
+            if response.status_code in (200, 304):
+                return response
+            elif response.status_code == 429:
+                response.close()
+                continue
+            else:
+                response.read()
+                raise Exception(f"HTTP error {response.status_code}. {response.text}")
+
+class AsyncRateLimitTransport(AsyncHTTPTransport):
+    """
+    Async counterpart of RateLimitTransport. Waits with asyncio.sleep so other lanes keep running.
+    """
+    def __init__(self, scheduler=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or KeyScheduler()
+
+    async def handle_async_request(self, request):
+        if not self.scheduler.keys:
+            self.scheduler.add_key(request.headers["Authorization"])
+
+        while True:
+            key, wait = self.scheduler.acquire()
+            if key is None:
+                await asyncio.sleep(wait)
+                self.scheduler.record_wait(wait)
+                continue
 
+            request.headers["Authorization"] = key
+            try:
+                response = await super().handle_async_request(request)
+            except Exception:
+                self.scheduler.release(key, httpx.Response(0))
+                raise
+            self.scheduler.release(key, response)
 
-  
-        
\ No newline at end of file
+            # 304 answers a conditional request from the HTTP cache
+            if response.status_code in (200, 304):
+                return response
+            elif response.status_code == 429:
+                await response.aclose()
+                continue
+            else:
+                await response.aread()
+                raise Exception(f"HTTP error {response.status_code}. {response.text}")